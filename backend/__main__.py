@@ -0,0 +1,4 @@
+from .batch import main
+
+if __name__ == "__main__":
+    raise SystemExit(main())
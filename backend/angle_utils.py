@@ -22,3 +22,61 @@ def calculate_distance(point1, point2):
     Calculates the Euclidean distance between two points.
     """
     return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
+
+# COCO keypoint triplets (a, b, c) for the joint angles used in shot analysis;
+# the angle is measured at b
+SHOT_ANGLES = {
+    'right_knee': (12, 14, 16),
+    'left_knee': (11, 13, 15),
+    'right_elbow': (6, 8, 10),
+    'left_elbow': (5, 7, 9),
+    'right_hip': (6, 12, 14),
+    'left_hip': (5, 11, 13),
+}
+
+# COCO keypoint pairs for the distances used in shot analysis
+SHOT_DISTANCES = {
+    'wrist_nose': (10, 0),
+    'right_left_leg': (16, 15),
+}
+
+def joint_angles(keypoints, triplets, zero_degenerate=False):
+    """
+    Vectorized calculate_angle over a whole batch of poses.
+
+    keypoints: array of shape (..., 17, 2), e.g. (frames, persons, 17, 2).
+    triplets: sequence of K (a, b, c) keypoint indices.
+    Returns an array of shape (..., K) with the angle at b in degrees (0-180).
+    With zero_degenerate, angles where a or c coincides with b are 0.
+    """
+    kpts = np.asarray(keypoints, dtype=np.float64)
+    idx = np.asarray(triplets, dtype=np.intp).reshape(-1, 3)
+
+    ba = kpts[..., idx[:, 0], :] - kpts[..., idx[:, 1], :]
+    bc = kpts[..., idx[:, 2], :] - kpts[..., idx[:, 1], :]
+
+    radians = np.arctan2(bc[..., 1], bc[..., 0]) - np.arctan2(ba[..., 1], ba[..., 0])
+    angle = np.abs(np.degrees(radians))
+    angle = np.where(angle > 180.0, 360.0 - angle, angle)
+
+    if zero_degenerate:
+        degenerate = ~(ba.any(axis=-1) & bc.any(axis=-1))
+        angle = np.where(degenerate, 0.0, angle)
+    return angle
+
+def joint_distances(keypoints, pairs, scale=None):
+    """
+    Vectorized calculate_distance over a whole batch of poses.
+
+    keypoints: array of shape (..., 17, 2).
+    pairs: sequence of K (p1, p2) keypoint indices.
+    scale: optional (width, height) the coordinates are divided by first.
+    Returns an array of shape (..., K).
+    """
+    kpts = np.asarray(keypoints, dtype=np.float64)
+    if scale is not None:
+        kpts = kpts / np.asarray(scale, dtype=np.float64)
+    idx = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+
+    delta = kpts[..., idx[:, 0], :] - kpts[..., idx[:, 1], :]
+    return np.hypot(delta[..., 0], delta[..., 1])
@@ -0,0 +1,315 @@
+"""
+Batch analysis of many clips: a directory of videos or a manifest.
+
+    python -m backend /footage/tournament --analyses tracking pose speed --output-dir runs/tournament
+
+Clips run concurrently on the analysis worker pool (ANALYSIS_WORKERS,
+"auto" for the CLI), each clip's artifacts go to its own directory and every
+finished clip appends one JSON line to the metrics file, so an interrupted
+run keeps what it finished and `--resume` picks up from there.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .detector import TrackingConsumer
+from .heatmap import HeatmapConsumer
+from .pose_analysis import PoseConsumer
+from .shot_analysis import ShotConsumer
+from .speed_analysis import SpeedConsumer
+
+# Analyses in the order their outputs are listed
+ANALYSIS_ORDER = ["tracking", "heatmap", "pose", "speed", "shot_analysis"]
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v", ".mpg", ".mpeg")
+
+METRICS_FILENAME = "metrics.jsonl"
+
+
+def build_consumers(input_path, output_dir, analyses, tracked_path, batch_size=None, skip_frames=None,
+                    render_mode="video"):
+    """One frame consumer per requested analysis of `input_path`, writing artifacts to `output_dir`."""
+    consumers = []
+    if "tracking" in analyses:
+        consumers.append(TrackingConsumer(tracked_path, batch_size, skip_frames, render_mode))
+    if "heatmap" in analyses:
+        consumers.append(HeatmapConsumer(input_path, output_dir, batch_size, skip_frames))
+    if "pose" in analyses:
+        consumers.append(PoseConsumer(input_path, output_dir, batch_size, skip_frames, render_mode))
+    if "speed" in analyses:
+        consumers.append(SpeedConsumer(batch_size, skip_frames))
+    if "shot_analysis" in analyses:
+        consumers.append(ShotConsumer(input_path, output_dir, batch_size, skip_frames, render_mode))
+    return consumers
+
+
+# ------------------ CLIPS ------------------
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def inside(path, root):
+    """Whether `path` resolves (symlinks included) to somewhere under directory `root`."""
+    path, root = os.path.realpath(path), os.path.realpath(root)
+    return os.path.commonpath([path, root]) == root
+
+
+def collect_clips(source, root=None):
+    """
+    Clips of a source as (path, analyses or None) pairs.
+
+    A directory yields every video under it, sorted. A manifest lists one
+    clip per line: a path, or with a .jsonl/.json manifest an object with
+    "path" and optionally its own "analyses" (a .json manifest may also be
+    one list of them). Relative paths are relative to the manifest.
+    With `root`, a source or clip outside that directory is a ValueError.
+    """
+    if root is not None and not inside(source, root):
+        raise ValueError(f"{source} is outside {root}")
+    clips = _collect_clips(source)
+    if root is not None:
+        outside = [path for path, _ in clips if not inside(path, root)]
+        if outside:
+            raise ValueError(f"Clips outside {root}: {outside}")
+    return clips
+
+
+def _collect_clips(source):
+    if os.path.isdir(source):
+        clips = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            clips.extend(os.path.join(root, f) for f in sorted(files) if is_video(f))
+        return [(path, None) for path in clips]
+
+    if not os.path.isfile(source):
+        raise ValueError(f"No such directory or manifest: {source}")
+    if is_video(source):
+        return [(source, None)]
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        text = f.read()
+    # (where, entry) pairs; where names the line, or the item of a .json list
+    if source.endswith(".json"):
+        entries = json.loads(text)
+        entries = entries if isinstance(entries, list) else [entries]
+        entries = [(f"item {number}", entry) for number, entry in enumerate(entries, 1)]
+    else:
+        entries = [(f"line {number}", line.strip()) for number, line in enumerate(text.splitlines(), 1)]
+        entries = [(where, line) for where, line in entries if line and not line.startswith("#")]
+        if source.endswith(".jsonl"):
+            entries = [(where, json.loads(line)) for where, line in entries]
+
+    clips = []
+    for where, entry in entries:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("path"), str):
+            raise ValueError(f"{source}, {where}: expected a path or an object with a \"path\", got {entry!r}")
+        analyses = entry.get("analyses")
+        if isinstance(analyses, str):
+            analyses = [analyses]
+        if analyses is not None and not (isinstance(analyses, list) and all(isinstance(a, str) for a in analyses)):
+            raise ValueError(f"{source}, {where}: \"analyses\" must be a list of names, got {analyses!r}")
+        clips.append((os.path.normpath(os.path.join(base, os.path.expanduser(entry["path"]))), analyses))
+    return clips
+
+
+def clip_slug(path, root=None):
+    """Directory name for a clip's artifacts: its path (relative to root) made filename-safe."""
+    if root is not None:
+        path = os.path.relpath(path, root)
+    return re.sub(r'[^a-zA-Z0-9_\-]', '_', os.path.splitext(path)[0]).strip("_") or "clip"
+
+
+# ------------------ RUN ------------------
+
+def collect_outcome(outcome, base_dir):
+    """
+    Splits a scheduler outcome into (metrics, artifacts, errors): the
+    aggregated metrics, artifact paths per analysis (relative to base_dir)
+    and the error of each analysis that failed.
+    """
+    metrics, artifacts, errors = {}, {}, {}
+    for name in ANALYSIS_ORDER:
+        if name not in outcome:
+            continue
+        result, error = outcome[name]
+        if error is not None:
+            errors[name] = str(error) or type(error).__name__
+            continue
+        paths = []
+        if name == "tracking":
+            paths = [result] if result else []
+        elif name == "heatmap":
+            path, layers = result
+            paths = ([path] if path else []) + [layer for _, layer in layers]
+        elif name == "speed":
+            metrics.update(result)
+        else:
+            path, clip_metrics = result
+            metrics.update(clip_metrics)
+            if not path:
+                # Its video writer couldn't be opened: nothing to show for this clip
+                errors[name] = "No output written"
+                continue
+            paths = [path]
+        if paths:
+            artifacts[name] = [os.path.relpath(p, base_dir) for p in paths]
+    return metrics, artifacts, errors
+
+
+def analyze_clip(path, analyses, output_dir, scheduler, base_dir, batch_size=None, skip_frames=None,
+                 render_mode="video", segments=None, backend=None):
+    """Runs the analyses of one clip; returns its metrics record."""
+    record = {"clip": path, "analyses": [a for a in ANALYSIS_ORDER if a in analyses]}
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    consumers = build_consumers(path, output_dir, analyses, os.path.join(output_dir, f"tracked_{clip_slug(name)}.mp4"),
+                                batch_size, skip_frames, render_mode)
+    for consumer in consumers:
+        consumer.backend = backend
+    try:
+        outcome = scheduler.run(path, consumers, segments=segments)
+    except Exception as e:
+        # Unreadable video, or a worker died on it (the pool restarts for the
+        # next clip): record it and carry on with the other clips
+        traceback.print_exc()
+        outcome, record["error"] = {}, str(e) or type(e).__name__
+    metrics, artifacts, errors = collect_outcome(outcome, base_dir)
+    record.update(
+        status="failed" if errors or "error" in record else "done",
+        metrics=metrics,
+        artifacts=artifacts,
+        errors=errors,
+        seconds=round(time.perf_counter() - start, 2),
+    )
+    return record
+
+
+def finished_clips(metrics_path):
+    """(clip, analyses) pairs already done in an existing metrics file."""
+    done = set()
+    if not os.path.exists(metrics_path):
+        return done
+    with open(metrics_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line cut short by an interrupted run
+            if record.get("status") == "done":
+                done.add((record["clip"], tuple(record["analyses"])))
+    return done
+
+
+def run_batch(clips, analyses, output_dir, scheduler, concurrency=None, resume=False, progress=None, **options):
+    """
+    Analyses every clip of `clips` ((path, analyses or None) pairs, None
+    meaning `analyses`) and appends one record per clip to
+    output_dir/metrics.jsonl as each finishes.
+
+    Up to `concurrency` clips run at once (default: one per pool worker, or
+    one at a time in-process). `progress(done, total)` is called after
+    every clip. With `resume`, clips already done in the metrics file are
+    skipped instead of starting the file over.
+    Returns a summary with the metrics file path and clip counts.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    metrics_path = os.path.join(output_dir, METRICS_FILENAME)
+    done_before = finished_clips(metrics_path) if resume else set()
+    if not resume:
+        open(metrics_path, "w").close()
+
+    paths = [os.path.abspath(path) for path, _ in clips]
+    root = os.path.commonpath([os.path.dirname(p) for p in paths]) if paths else output_dir
+
+    todo = []
+    for path, (_, own) in zip(paths, clips):
+        wanted = [a for a in ANALYSIS_ORDER if a in (own or analyses)]
+        # Names a manifest entry asks for that no analysis has fail that clip
+        unknown = sorted(set(own or ()) - set(ANALYSIS_ORDER))
+        if unknown or (path, tuple(wanted)) not in done_before:
+            todo.append((path, wanted, unknown))
+
+    summary = {"metrics_file": metrics_path, "clips": len(clips), "skipped": len(clips) - len(todo),
+               "done": 0, "failed": 0}
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def run(path, wanted, unknown):
+        if wanted:
+            print(f"Batch: analysing {path} ({', '.join(wanted)})")
+            record = analyze_clip(path, wanted, os.path.join(output_dir, clip_slug(path, root)), scheduler,
+                                  output_dir, **options)
+        else:
+            record = {"clip": path, "analyses": [], "metrics": {}, "artifacts": {}, "errors": {}, "seconds": 0}
+        if unknown:
+            record["errors"].update((name, f"Unknown analysis, expected one of {ANALYSIS_ORDER}") for name in unknown)
+            record["status"] = "failed"
+        with lock:
+            with open(metrics_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            summary[record["status"]] += 1
+            finished = summary["done"] + summary["failed"]
+            print(f"Batch: {record['status']} {path} in {record['seconds']}s ({finished}/{len(todo)})")
+            if progress:
+                progress(finished, len(todo))
+
+    concurrency = concurrency or max(1, scheduler.workers)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        for future in [pool.submit(run, *clip) for clip in todo]:
+            future.result()
+
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+# ------------------ CLI ------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend", description="Analyse a directory or manifest of clips.")
+    parser.add_argument("sources", nargs="+", help="directories, manifests (.txt, .jsonl, .json) or video files")
+    parser.add_argument("--analyses", nargs="+", default=ANALYSIS_ORDER, choices=ANALYSIS_ORDER)
+    parser.add_argument("--output-dir", default="batch_output", help="artifacts and metrics.jsonl go here")
+    parser.add_argument("--workers", default="auto",
+                        help='analysis worker processes: "auto" (one per WORKER_THREADS cores) or a number, 0 = in-process')
+    parser.add_argument("--concurrency", type=int, default=None, help="clips analysed at once (default: one per worker)")
+    parser.add_argument("--render-mode", choices=("video", "overlay"), default="video")
+    parser.add_argument("--skip-frames", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--segments", type=int, default=None, help="time slices per clip (default: SEGMENT_SECONDS)")
+    parser.add_argument("--backend", default=None, help="inference backend (default: INFERENCE_BACKEND)")
+    parser.add_argument("--resume", action="store_true", help="skip clips already done in the metrics file")
+    args = parser.parse_args(argv)
+
+    from .model_registry import resolve_backend
+    from .scheduler import Scheduler
+
+    try:
+        resolve_backend(args.backend, require=args.backend is not None)
+        clips = [clip for source in args.sources for clip in collect_clips(source)]
+    except (ValueError, KeyError) as e:
+        parser.error(str(e))
+    if not clips:
+        parser.error("No video clips found")
+
+    scheduler = Scheduler(workers=args.workers)
+    try:
+        summary = run_batch(
+            clips, args.analyses, args.output_dir, scheduler, args.concurrency, args.resume,
+            batch_size=args.batch_size, skip_frames=args.skip_frames, render_mode=args.render_mode,
+            segments=args.segments, backend=args.backend,
+        )
+    finally:
+        scheduler.shutdown()
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
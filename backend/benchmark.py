@@ -0,0 +1,417 @@
+"""
+Stage-level benchmark of the analyses on deterministic synthetic clips.
+
+Generates a clip of moving person-like figures (cached in the fixtures
+directory by its parameters), or takes a real clip with --clip, then runs
+each analysis entry point on it in a fresh worker process and reports, per
+analysis:
+  - frames analysed, wall time and frames/sec
+  - time spent in decode, inference, post-processing, drawing and encoding
+  - detections the analysis got from its model
+  - model load/warm-up time and peak RSS of the worker
+
+The synthetic figures are stick drawings, which the YOLO models mostly do not
+detect: on them post-processing (tracking, pose features, classification)
+and drawing run over empty results. Runs without detections are flagged,
+and benchmark real footage with --clip to measure those stages.
+
+Usage:
+    python -m backend.benchmark --width 1280 --height 720 --seconds 10 --json baseline.json
+    python -m backend.benchmark --clip nets.mp4 --json baseline.json
+    python -m backend.benchmark --compare baseline.json   # exits 1 on a regression
+
+Stage times are exclusive (inference isn't counted again in the
+post-processing that calls it). By default decoding and encoding run inline
+(FRAME_PIPELINE=0), so the stages add up to the wall time; --pipeline
+measures the threaded pipeline, where stages overlap. Detections are not
+persisted between runs (INFERENCE_STORE=0), so every run pays for inference.
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+from .detector import TrackingConsumer
+from .frame_source import FrameSource
+from .heatmap import HeatmapConsumer
+from .model_registry import get_model, warm_up
+from .pose_analysis import PoseConsumer
+from .shot_analysis import ShotConsumer
+from .speed_analysis import SpeedConsumer
+
+STAGES = ("decode", "inference", "postprocess", "drawing", "encoding")
+BENCHMARK_VERSION = 2
+# Stages that only do real work on frames with detections
+DETECTION_STAGES = ("postprocess", "drawing")
+
+# Entry point -> consumer it runs (as run_single does), with the entry point's defaults
+ANALYSES = {
+    "process_tracking": lambda clip, out, batch, skip: TrackingConsumer(os.path.join(out, "tracked.mp4"), batch, skip),
+    "generate_heatmap": lambda clip, out, batch, skip: HeatmapConsumer(clip, out, batch, skip),
+    "analyze_pose": lambda clip, out, batch, skip: PoseConsumer(clip, out, batch, skip),
+    "analyze_speed": lambda clip, out, batch, skip: SpeedConsumer(batch, skip),
+    "analyze_cricket_shot": lambda clip, out, batch, skip: ShotConsumer(clip, out, batch, skip),
+}
+
+# Fraction of baseline frames/sec a run may lose before it counts as a regression
+REGRESSION_TOLERANCE = 0.1
+
+
+# ------------------ SYNTHETIC CLIPS ------------------
+
+def draw_figure(frame, x, y, scale, phase, color):
+    """A person-like figure standing at (x, y) (feet), `scale` pixels tall, limbs swinging with `phase`."""
+    s = scale
+    head = (int(x), int(y - 0.9 * s))
+    neck, hip = (x, y - 0.78 * s), (x, y - 0.45 * s)
+    swing = np.sin(phase) * 0.18 * s
+    thickness = max(2, int(s * 0.07))
+
+    def line(a, b, width=thickness):
+        cv2.line(frame, (int(a[0]), int(a[1])), (int(b[0]), int(b[1])), color, width, cv2.LINE_AA)
+
+    line(neck, hip, max(3, int(s * 0.16)))                        # torso
+    line(hip, (x + swing, y))                                     # legs
+    line(hip, (x - swing, y))
+    line((x, y - 0.72 * s), (x - swing, y - 0.45 * s))            # arms
+    line((x, y - 0.72 * s), (x + 0.25 * s, y - 0.6 * s + swing))
+    cv2.circle(frame, head, max(3, int(s * 0.09)), (150, 180, 220), -1, cv2.LINE_AA)
+
+
+def make_clip(path, width=1280, height=720, fps=30, seconds=10, players=3, seed=0):
+    """
+    Writes a deterministic clip of `players` figures walking over a pitch:
+    each follows its own smooth path and pace drawn from `seed`.
+    """
+    rng = np.random.default_rng(seed)
+    paths = [{
+        "center": rng.uniform([0.25, 0.55], [0.75, 0.8]) * (width, height),
+        "radius": rng.uniform([0.1, 0.05], [0.25, 0.12]) * (width, height),
+        "speed": rng.uniform(0.2, 0.8),
+        "offset": rng.uniform(0, 2 * np.pi),
+        "scale": rng.uniform(0.25, 0.4) * height,
+        "color": tuple(int(c) for c in rng.integers(30, 230, 3)),
+    } for _ in range(players)]
+
+    background = np.empty((height, width, 3), dtype=np.uint8)
+    background[:] = (60, 140, 60)
+    cv2.rectangle(background, (int(width * 0.42), int(height * 0.2)), (int(width * 0.58), int(height * 0.95)),
+                  (120, 180, 200), -1)
+
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not out.isOpened():
+        raise ValueError(f"Could not open VideoWriter for {path}")
+    try:
+        for i in range(int(fps * seconds)):
+            t = i / fps
+            frame = background.copy()
+            # Farther players (smaller y) first, so nearer ones are drawn over them
+            placed = []
+            for p in paths:
+                angle = p["offset"] + 2 * np.pi * p["speed"] * t / 4
+                x = p["center"][0] + p["radius"][0] * np.cos(angle)
+                y = p["center"][1] + p["radius"][1] * np.sin(2 * angle)
+                placed.append((y, x, p))
+            for y, x, p in sorted(placed, key=lambda item: item[0]):
+                draw_figure(frame, x, y, p["scale"], 2 * np.pi * 1.5 * t + p["offset"], p["color"])
+            out.write(frame)
+    finally:
+        out.release()
+    return path
+
+
+def fixture(fixtures_dir, width, height, fps, seconds, players, seed):
+    """Path of the synthetic clip with these parameters, generated on first use."""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"synthetic_{width}x{height}_{fps}fps_{seconds}s_{players}p_seed{seed}.mp4")
+    if not os.path.exists(path):
+        tmp = path + ".tmp.mp4"
+        make_clip(tmp, width, height, fps, seconds, players, seed)
+        os.replace(tmp, path)
+    return path
+
+
+# ------------------ STAGE TIMING ------------------
+
+class StageTimer:
+    """
+    Accumulates time per stage over wrapped calls. Nested stages are
+    exclusive: while an inner stage runs, the outer one's clock is paused.
+    Each thread keeps its own nesting, so encoder threads time their own
+    drawing and encoding.
+    """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self.detections = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _add(self, stage, seconds):
+        with self._lock:
+            self.totals[stage] += seconds
+
+    def wrap(self, fn, stage):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            stack = self._local.__dict__.setdefault("stack", [])
+            now = time.perf_counter()
+            if stack:
+                self._add(stack[-1][0], now - stack[-1][1])
+            entry = [stage, now]
+            stack.append(entry)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                stack.pop()
+                self._add(stage, end - entry[1])
+                if stack:
+                    stack[-1][1] = end
+        return timed
+
+
+class _Timed:
+    """Proxy timing some methods of an object and forwarding everything else."""
+
+    def __init__(self, target, timer, stages):
+        self._target = target
+        for attr, stage in stages.items():
+            setattr(self, attr, timer.wrap(getattr(target, attr), stage))
+
+    def __call__(self, *args, **kwargs):
+        return self.__dict__["__call__"](*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class TimedFrameSource(FrameSource):
+    """FrameSource whose capture reads, grabs and seeks count as decode time."""
+
+    def __init__(self, video_path, timer):
+        super().__init__(video_path)
+        self.timer = timer
+
+    def open(self):
+        cap, meta = super().open()
+        return _Timed(cap, self.timer, {"read": "decode", "grab": "decode", "set": "decode"}), meta
+
+
+def instrument(consumer, timer):
+    """
+    Wraps a consumer's stage methods, and its network calls once start() has
+    opened the model; counts the detections the consumer gets (after its conf
+    filter) in timer.detections.
+    """
+    for attr, stage in (("infer", "postprocess"), ("handle", "postprocess"),
+                        ("render", "drawing"), ("write_frame", "encoding")):
+        if hasattr(consumer, attr):
+            setattr(consumer, attr, timer.wrap(getattr(consumer, attr), stage))
+
+    start = consumer.start
+
+    def timed_start(meta):
+        start(meta)
+        stored = consumer.model
+        if stored is not None:
+            get = stored._model
+            stored._model = lambda: _Timed(get(), timer, {"__call__": "inference"})
+            predict = stored.predict
+
+            # track() goes through predict() too
+            def counted(*args, **kwargs):
+                results = predict(*args, **kwargs)
+                timer.detections += sum(len(r.boxes) for r in results if r.boxes is not None)
+                return results
+
+            stored.predict = counted
+
+    consumer.start = timed_start
+    return consumer
+
+
+# ------------------ RUNS ------------------
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_analysis(name, clip, output_dir, batch_size=None, skip_frames=None):
+    """Worker side: one timed run of one analysis in this (fresh) process."""
+    consumer = ANALYSES[name](clip, output_dir, batch_size, skip_frames)
+
+    # Model loading and the first forward pass are reported apart from the run
+    start = time.perf_counter()
+    backend = get_model(consumer.weights).backend
+    warm_up([consumer.weights])
+    setup = time.perf_counter() - start
+
+    timer = StageTimer()
+    instrument(consumer, timer)
+    start = time.perf_counter()
+    result, error = TimedFrameSource(clip, timer).run([consumer])[consumer.name]
+    wall = time.perf_counter() - start
+    if error is not None:
+        raise RuntimeError(f"{name} failed: {error}")
+
+    frames = consumer.frames_done
+    return {
+        "frames": frames,
+        "detections": timer.detections,
+        "backend": backend,  # PyTorch if INFERENCE_BACKEND fell back
+        "wall_s": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall else None,
+        "setup_s": round(setup, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in timer.totals.items()},
+        "stages_ms_per_frame": {stage: round(seconds * 1000 / frames, 2) if frames else None
+                                for stage, seconds in timer.totals.items()},
+    }
+
+
+def run_benchmarks(clip, analyses, batch_size=None, skip_frames=None, repeat=1):
+    """
+    Runs every analysis `repeat` times, each in a new process (so peak RSS
+    and model caches are its own), keeping the fastest run.
+    """
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name in analyses:
+        runs = []
+        for _ in range(repeat):
+            output_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                    runs.append(pool.submit(run_analysis, name, clip, output_dir, batch_size, skip_frames).result())
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+        results[name] = min(runs, key=lambda run: run["wall_s"])
+        print(f"{name}: {results[name]['fps']} frames/s")
+    return results
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Per analysis in both: frames/sec change against the baseline. Analyses
+    without detections in either run are marked: their post-processing and
+    drawing costs were not measured, so they cannot show up as a regression.
+    Returns (lines, regressed).
+    """
+    lines, regressed = [], False
+    for name, run in results.items():
+        base = baseline["results"].get(name)
+        if not base or not base.get("fps") or not run["fps"]:
+            continue
+        change = run["fps"] / base["fps"] - 1
+        slower = change < -tolerance
+        regressed |= slower
+        line = f"  {name}: {base['fps']} -> {run['fps']} frames/s ({change:+.1%})" + ("  REGRESSION" if slower else "")
+        if not base.get("detections") or not run.get("detections"):
+            line += f"  ({'/'.join(DETECTION_STAGES)} not covered: no detections)"
+        lines.append(line)
+    return lines, regressed
+
+
+def print_results(results):
+    header = (f"{'analysis':<22}{'frames':>7}{'dets':>7}{'fps':>9}{'rss MB':>9}"
+              + "".join(f"{s:>13}" for s in STAGES))
+    print("\nms per frame by stage")
+    print(header)
+    for name, run in results.items():
+        stages = "".join(f"{run['stages_ms_per_frame'][s] if run['stages_ms_per_frame'][s] is not None else '-':>13}"
+                         for s in STAGES)
+        print(f"{name:<22}{run['frames']:>7}{run['detections']:>7}{run['fps']:>9}{str(run['peak_rss_mb']):>9}{stages}")
+    empty = [name for name, run in results.items() if not run["detections"]]
+    if empty:
+        print(f"\nWarning: no detections for {', '.join(empty)}: {' and '.join(DETECTION_STAGES)} ran on empty "
+              f"results and were not measured. Benchmark real footage with --clip to cover them.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analyses stage by stage on a synthetic clip.")
+    parser.add_argument("--analyses", nargs="+", choices=list(ANALYSES), default=list(ANALYSES))
+    parser.add_argument("--clip", help="benchmark this video instead of a synthetic clip")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, help="frames per model call (default INFERENCE_BATCH_SIZE)")
+    parser.add_argument("--skip-frames", type=int, help="frames skipped between analysed ones (default: each analysis' own)")
+    parser.add_argument("--backend", help="inference backend (default INFERENCE_BACKEND)")
+    parser.add_argument("--pipeline", action="store_true", help="decode and encode on their own threads")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per analysis, the fastest is kept")
+    parser.add_argument("--fixtures-dir", default=os.path.join(tempfile.gettempdir(), "benchmark_fixtures"))
+    parser.add_argument("--json", help="write the results to this file (a baseline for --compare)")
+    parser.add_argument("--compare", help="baseline JSON to compare frames/sec against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="fraction of baseline frames/sec a run may lose")
+    args = parser.parse_args(argv)
+
+    # Settings reach the workers through their environment (modules read it on import)
+    os.environ["FRAME_PIPELINE"] = "1" if args.pipeline else "0"
+    os.environ["INFERENCE_STORE"] = "0"
+    if args.backend:
+        os.environ["INFERENCE_BACKEND"] = args.backend
+
+    if args.clip:
+        clip = args.clip
+        clip_config = {"path": os.path.abspath(clip)}
+    else:
+        clip = fixture(args.fixtures_dir, args.width, args.height, args.fps, args.seconds, args.players, args.seed)
+        clip_config = {"width": args.width, "height": args.height, "fps": args.fps, "seconds": args.seconds,
+                       "players": args.players, "seed": args.seed}
+    print(f"Benchmarking on {clip}")
+    results = run_benchmarks(clip, args.analyses, args.batch_size, args.skip_frames, max(1, args.repeat))
+    print_results(results)
+
+    report = {
+        "version": BENCHMARK_VERSION,
+        "config": {
+            "clip": clip_config,
+            "batch_size": args.batch_size, "skip_frames": args.skip_frames,
+            "backend": os.getenv("INFERENCE_BACKEND", "torch"), "pipeline": args.pipeline,
+        },
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Warning: baseline was recorded with different settings")
+        lines, regressed = compare(results, baseline, args.tolerance)
+        print(f"\nAgainst {args.compare}:")
+        print("\n".join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,16 @@
-from ultralytics import YOLO
 import cv2
 import os
+from .frame_source import BatchedConsumer
+from .pipeline import FrameEncoder
+from .overlay import OverlayWriter, overlay_path, boxes_of, join_overlays
+from .segments import concat_videos
+from .model_registry import acquire, DETECTION_MODEL
+from .inference_store import StoredInference
 
-model = YOLO("yolov8n.pt")
-
-def detect_players(video_path):
+def detect_players(video_path, out_path="backend/outputs/tracked.mp4"):
+    model = acquire(DETECTION_MODEL)
     cap = cv2.VideoCapture(video_path)
 
-    out_path = "backend/outputs/tracked.mp4"
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(out_path, fourcc, 30,
                           (int(cap.get(3)), int(cap.get(4))))
@@ -25,3 +28,123 @@ def detect_players(video_path):
     out.release()
 
     return out_path
+
+
+class TrackingConsumer(BatchedConsumer):
+    """
+    Frame consumer drawing person boxes for the player tracking video.
+    With render_mode "overlay" the boxes go to a JSON sidecar instead.
+    Result: the output path, or None if the writer could not be opened.
+    """
+
+    name = "tracking"
+
+    skip_frames = 2 # Process every 3rd frame
+    stride = skip_frames + 1
+    weights = DETECTION_MODEL
+    conf = 0.4
+
+    def __init__(self, output_path, batch_size=None, skip_frames=None, render_mode="video"):
+        super().__init__(batch_size, skip_frames)
+        self.render_mode = render_mode
+        self.output_path = output_path
+        if render_mode == "overlay":
+            self.output_path = overlay_path(output_path)
+        self.out = None
+        self.overlay = None
+        self.encoder = None
+        self.model = None
+        self.total_frames = 0
+
+    def start(self, meta):
+        width, height = meta.width, meta.height
+        self.total_frames = meta.total_frames
+
+        if self.render_mode == "overlay":
+            self.overlay = OverlayWriter(self.output_path, self.name, meta)
+            self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+            return
+
+        # Adjust FPS for frame skipping so playback speed is correct
+        adjusted_fps = meta.fps / (self.skip_frames + 1)
+        
+        # Try avc1 first, fallback to mp4v
+        fourcc = cv2.VideoWriter_fourcc(*"avc1")
+        out = cv2.VideoWriter(self.output_path, fourcc, adjusted_fps, (width, height))
+        
+        if not out.isOpened():
+            print("Warning: avc1 codec failed in process_tracking, falling back to mp4v")
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            out = cv2.VideoWriter(self.output_path, fourcc, adjusted_fps, (width, height))
+
+        if not out.isOpened():
+            print(f"Error: Could not initialize VideoWriter with avc1 or mp4v for {self.output_path}")
+            self.active = False
+            return
+
+        self.out = out
+        self.encoder = FrameEncoder(name="tracking-encoder")
+        self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+
+    def infer(self, frames):
+        return self.model.predict(frames, self.batch_counts, conf=self.conf)
+
+    def set_segment(self, segment):
+        super().set_segment(segment)
+        if self.render_mode == "video":
+            self.output_path = segment.output_path(self.output_path)
+
+    def handle(self, frame_count, frame, r):
+        total_frames = self.total_frames
+        if frame_count % 30 == 0:
+            print(f"Tracking processing frame {frame_count}/{total_frames} ({frame_count/total_frames*100:.1f}%)")
+        if self.warming_up(frame_count):
+            return
+        if self.overlay is not None:
+            boxes, _ = boxes_of(r, persons_only=True)
+            self.overlay.add(frame_count, boxes=boxes)
+            return
+        # Drawing and encoding run on the encoder thread
+        self.encoder.submit(self.render, frame_count, frame, r)
+
+    def render(self, frame_count, frame, r):
+        if r.boxes:
+            for box in r.boxes:
+                cls = int(box.cls[0])
+                if cls == 0: # person
+                    x1, y1, x2, y2 = map(int, box.xyxy[0])
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        self.write_frame(self.out, frame_count, frame)
+
+    def cache_params(self):
+        params = super().cache_params()
+        params["render_mode"] = self.render_mode
+        return params
+
+    def finish(self):
+        if self.overlay is not None:
+            print("Tracking processing finished.")
+            return self.overlay.close()
+        if self.out is None:
+            return None
+        try:
+            self.encoder.close()
+        finally:
+            self.out.release()
+        print("Tracking processing finished.")
+        return self.output_path
+
+    def finish_segment(self):
+        if self.overlay is not None:
+            return self.overlay.part()
+        return {"path": self.finish()}
+
+    def merge_segments(self, parts):
+        if self.render_mode == "overlay":
+            return join_overlays(self.output_path, parts)
+        return concat_videos([part["path"] for part in parts], self.output_path)
+
+    def abort(self):
+        if self.out is not None:
+            self.encoder.abort()
+            self.out.release()
@@ -0,0 +1,486 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from . import metrics, tracing
+from .pipeline import Prefetcher, PIPELINE_ENABLED
+from .model_registry import resolve_backend, serving_backend
+
+# Adaptive sampling defaults: stride bounds and motion thresholds (mean absolute
+# grey-level change per frame on the downscaled image, 0-255)
+ADAPTIVE_SAMPLING = os.getenv("ADAPTIVE_SAMPLING", "0") == "1"
+ADAPTIVE_MIN_STRIDE = int(os.getenv("ADAPTIVE_MIN_STRIDE", "1"))
+ADAPTIVE_MAX_STRIDE = int(os.getenv("ADAPTIVE_MAX_STRIDE", "15"))
+ADAPTIVE_MOTION_LOW = float(os.getenv("ADAPTIVE_MOTION_LOW", "0.5"))
+ADAPTIVE_MOTION_HIGH = float(os.getenv("ADAPTIVE_MOTION_HIGH", "3.0"))
+
+
+class VideoMeta:
+    """
+    Basic properties of the video being decoded, handed to every consumer
+    before the first frame arrives.
+    """
+
+    def __init__(self, path, width, height, fps, total_frames):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.total_frames = total_frames
+
+
+class FrameConsumer:
+    """
+    Base class for an analysis fed by a FrameSource.
+
+    Subclasses override start/process/finish. `frame_count` is 1-based, the
+    same convention the analysis loops used when they each read the video
+    themselves, so `frame_count % (skip_frames + 1) == 0` keeps its meaning.
+    """
+
+    name = "consumer"
+    stride = 1  # deliver every `stride`-th frame
+    weights = None  # model weights the consumer runs, if any
+    backend = None  # runtime serving the weights (None = INFERENCE_BACKEND)
+    conf = None  # confidence threshold passed to the model (None = model default)
+    trace = None  # tracing.Trace of the job, if it records a timeline
+
+    def __init__(self):
+        # Consumers can switch themselves off (e.g. writer failed to open)
+        self.active = True
+        self.frames_done = 0
+        # MotionSampler choosing the frames instead of the fixed stride, if any
+        self.sampler = None
+        self.frames_written = 0
+        # Segment of the video this copy of the consumer runs on, if split
+        self.segment = None
+
+    def cache_params(self):
+        """Parameters that change this consumer's result (part of the result cache key)."""
+        params = {"model": self.weights, "conf": self.conf, "skip_frames": self.stride - 1}
+        # The runtime really serving the weights, so a fallback isn't cached as another backend's result
+        backend = serving_backend(self.weights, self.backend) if self.weights else resolve_backend(self.backend)
+        if backend != "torch":
+            params["backend"] = backend
+        if self.sampler is not None:
+            params["sampling"] = self.sampler.params()
+        return params
+
+    def set_segment(self, segment):
+        """
+        Makes this consumer process one segment of a split video: finish_segment()
+        replaces finish(), and the parent merges the parts with merge_segments().
+        """
+        self.segment = segment
+        # Output videos of the segment continue where the previous one stopped
+        self.frames_written = (segment.core_start - 1) // self.stride
+
+    def warming_up(self, frame_count):
+        """True for frames only analysed to warm up a segment's trackers."""
+        return self.segment is not None and self.segment.warming_up(frame_count)
+
+    def set_skip_frames(self, skip_frames):
+        """Overrides the class default sampling: every (skip_frames + 1)-th frame."""
+        self.skip_frames = max(0, int(skip_frames))
+        self.stride = self.skip_frames + 1
+
+    def wants(self, frame_count):
+        if self.sampler is not None:
+            return self.active and self.sampler.wants(frame_count)
+        return self.active and frame_count % self.stride == 0
+
+    def next_wanted(self, frame_count):
+        """The first frame after `frame_count` this consumer will want."""
+        if self.sampler is not None:
+            return self.sampler.next_wanted(frame_count)
+        return (frame_count // self.stride + 1) * self.stride
+
+    def write_frame(self, out, frame_count, image):
+        """
+        Writes `image` to a video written at fps / stride. With adaptive
+        sampling the gap since the last frame varies, so the image is repeated
+        to cover it and playback keeps real time.
+        """
+        repeats = max(frame_count // self.stride - self.frames_written, 1)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            out.write(image)
+        metrics.stage_done("encode", self.name, start)
+        if self.trace is not None:
+            self.trace.complete(f"encode {self.name}", "encode", start, frame=frame_count)
+        self.frames_written += repeats
+
+    def start(self, meta):
+        pass
+
+    def process(self, frame_count, frame):
+        pass
+
+    def flush(self):
+        """Called once the last frame has been delivered, before finish()."""
+        pass
+
+    def finish(self):
+        return None
+
+    def finish_segment(self):
+        """Picklable partial result of a segment, for merge_segments()."""
+        raise NotImplementedError(f"{self.name} can't run on segments")
+
+    def merge_segments(self, parts):
+        """finish()'s result for the whole video from the segments' parts, in order."""
+        raise NotImplementedError(f"{self.name} can't run on segments")
+
+    def abort(self):
+        """Release resources after an error; default is the normal cleanup."""
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+    def close(self):
+        """Called last, after finish() or abort(), to release shared resources."""
+        pass
+
+
+class BatchedConsumer(FrameConsumer):
+    """
+    Consumer that runs its model on `batch_size` sampled frames per call.
+
+    Subclasses implement infer(frames) -> one result per frame, and
+    handle(frame_count, frame, result), which is called for every frame in
+    delivery order once its batch has been inferred. With batch_size=1 this
+    is the old one-frame-per-call behaviour. Tracking stays continuous
+    because `track()` feeds a list of frames through one tracker in order.
+    """
+
+    # Deployment default, overridable per request
+    batch_size = int(os.getenv("INFERENCE_BATCH_SIZE", "1"))
+
+    def __init__(self, batch_size=None, skip_frames=None):
+        super().__init__()
+        if batch_size:
+            self.batch_size = max(1, int(batch_size))
+        if skip_frames is not None:
+            self.set_skip_frames(skip_frames)
+        self._pending = []
+        self.batch_counts = []
+        # StoredInference the consumer reads detections through (set in start)
+        self.model = None
+
+    def process(self, frame_count, frame):
+        self._pending.append((frame_count, frame))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        # Frame numbers of the batch being inferred, for time-weighted results
+        self.batch_counts = [frame_count for frame_count, _ in pending]
+        # Inference metrics and spans recorded below this call go to this analysis
+        start = time.perf_counter()
+        with metrics.analysis(self.name), tracing.activate(self.trace):
+            results = self.infer([frame for _, frame in pending])
+            if self.trace is not None:
+                self.trace.complete(f"infer {self.name}", "infer", start,
+                                    frames=f"{self.batch_counts[0]}-{self.batch_counts[-1]}")
+            for (frame_count, frame), result in zip(pending, results):
+                self.handle(frame_count, frame, result)
+
+    def infer(self, frames):
+        raise NotImplementedError
+
+    def handle(self, frame_count, frame, result):
+        raise NotImplementedError
+
+    def close(self):
+        if self.model is not None:
+            self.model.close()
+
+
+class MotionSampler:
+    """
+    Picks frames for adaptive sampling from cheap inter-frame motion.
+
+    Every decoded frame is shrunk to a small greyscale image and compared
+    with the previous one. High motion drops the stride to `min_stride`, a
+    static scene doubles it up to `max_stride`, anything in between goes back
+    to `base_stride`. Consumers sharing a sampler get the same frames.
+    """
+
+    def __init__(self, min_stride=ADAPTIVE_MIN_STRIDE, max_stride=ADAPTIVE_MAX_STRIDE,
+                 low=ADAPTIVE_MOTION_LOW, high=ADAPTIVE_MOTION_HIGH, base_stride=3, width=64):
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        self.base_stride = min(max(int(base_stride), self.min_stride), self.max_stride)
+        self.low = low
+        self.high = high
+        self.width = width
+
+        self.stride = self.base_stride
+        self.next_frame = 1
+        self.sampled = None  # frame_count of the latest sampled frame
+        self.motion = 0.0
+        self._prev = None
+        self._prev_count = None
+
+    def params(self):
+        return {"min_stride": self.min_stride, "max_stride": self.max_stride,
+                "low": self.low, "high": self.high, "base_stride": self.base_stride}
+
+    def wants(self, frame_count):
+        return frame_count == self.sampled
+
+    def next_wanted(self, frame_count):
+        return max(self.next_frame, frame_count + 1)
+
+    def observe(self, frame_count, frame):
+        """Measures motion on a decoded frame and schedules the next sample."""
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+        if self._prev is not None:
+            gap = max(frame_count - self._prev_count, 1)
+            self.motion = float(np.abs(small - self._prev).mean()) / gap
+        self._prev, self._prev_count = small, frame_count
+
+        if self.motion > self.high:
+            self.stride = self.min_stride
+        elif self.motion < self.low:
+            self.stride = min(self.stride * 2, self.max_stride)
+        else:
+            self.stride = self.base_stride
+
+        if frame_count >= self.next_frame:
+            self.sampled = frame_count
+            self.next_frame = frame_count + self.stride
+        elif self.motion > self.high:
+            # A frame decoded for someone else shows action: sample sooner
+            self.next_frame = min(self.next_frame, frame_count + self.stride)
+
+
+class FrameSource:
+    """
+    Decodes a video once and fans every frame out to the registered consumers.
+
+    Each consumer decides which frames it wants. Frames nobody wants are only
+    grabbed (demuxed, not decoded into an image), and gaps of at least
+    `seek_min_gap` frames are skipped with a seek when the backend supports
+    it, so with a stride of 3 only a third of the frames is fully decoded.
+    A consumer that raises is aborted and its exception recorded, the other
+    consumers carry on. With PIPELINE_ENABLED, decoding runs on a reader
+    thread a few frames ahead of the consumers.
+    """
+
+    def __init__(self, video_path, start=1, end=None):
+        self.video_path = video_path
+        # Frame range to decode (1-based, inclusive); the whole video by default
+        self.start = start
+        self.end = end
+
+    def open(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {self.video_path}")
+
+        meta = VideoMeta(
+            self.video_path,
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            cap.get(cv2.CAP_PROP_FPS),
+            int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        )
+        return cap, meta
+
+    # Report progress every this many frames
+    progress_every = 10
+    # Seek instead of grabbing when the next wanted frame is this far ahead
+    seek_min_gap = int(os.getenv("FRAME_SEEK_MIN_GAP", "48"))
+
+    def skip_to(self, cap, frame_count, target):
+        """
+        Advances the capture so the next read() returns frame `target`.
+        Returns the new frame_count (target - 1), or None at the end of the video.
+        """
+        if target - frame_count - 1 >= self.seek_min_gap:
+            if cap.set(cv2.CAP_PROP_POS_FRAMES, target - 1) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == target - 1:
+                return target - 1
+            # Seek not supported or inexact: go back to where we were and grab
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+
+        while frame_count < target - 1:
+            if not cap.grab():
+                return None
+            frame_count += 1
+        return frame_count
+
+    def frames(self, cap, consumers):
+        """
+        Yields (frame_count, frame, wanting consumers) for every frame at
+        least one active consumer wants, skipping the rest without decoding.
+        """
+        samplers = []
+        for consumer in consumers:
+            if consumer.sampler is not None and consumer.sampler not in samplers:
+                samplers.append(consumer.sampler)
+
+        # Decoding serves every consumer of the run; its time is labeled with all of them
+        label = "+".join(sorted(c.name for c in consumers))
+        traces = list({id(c.trace): c.trace for c in consumers if c.trace is not None}.values())
+
+        frame_count = 0
+        while True:
+            active = [c for c in consumers if c.active]
+            if not active:
+                return
+            target = min(c.next_wanted(max(frame_count, self.start - 1)) for c in active)
+            if self.end is not None and target > self.end:
+                return
+            start = time.perf_counter()
+            skipped = self.skip_to(cap, frame_count, target)
+            if skipped is None:
+                return
+            frame_count = skipped
+
+            ret, frame = cap.read()
+            if not ret:
+                return
+            metrics.stage_done("decode", label, start)
+            for trace in traces:
+                trace.complete("decode", "decode", start, frame=frame_count + 1)
+
+            frame_count += 1
+            for sampler in samplers:
+                sampler.observe(frame_count, frame)
+            yield frame_count, frame, [c for c in active if c.wants(frame_count)]
+
+    def run(self, consumers, progress=None):
+        """
+        Runs all consumers over the video.
+        Returns {consumer.name: (result, error)} where exactly one is not None.
+
+        `progress(frames_decoded, total_frames, {name: (frames_done, frames_total)})`
+        is called every `progress_every` frames and once at the end.
+        """
+        cap, meta = self.open()
+        outcome = {}
+        live = []
+
+        for consumer in consumers:
+            if consumer.trace is not None:
+                consumer.trace.begin(consumer.name, "analysis", self._span_id(consumer), **self._span_args(consumer))
+            try:
+                consumer.start(meta)
+                live.append(consumer)
+            except Exception as e:
+                consumer.abort()
+                outcome[consumer.name] = (None, e)
+
+        frames = self.frames(cap, live)
+        if PIPELINE_ENABLED:
+            # Decode on a reader thread while the consumers run inference
+            frames = Prefetcher(frames, name="frame-reader")
+
+        frame_count = 0
+        reported = 0
+        try:
+            for frame_count, frame, wanting in frames:
+                # Skip consumers that failed after the reader queued this frame
+                wanting = [c for c in wanting if c.name not in outcome]
+
+                for i, consumer in enumerate(wanting):
+                    # Consumers draw on the frame in place, so all but the last
+                    # one get their own copy
+                    f = frame if i == len(wanting) - 1 else frame.copy()
+                    try:
+                        consumer.process(frame_count, f)
+                        consumer.frames_done += 1
+                        metrics.FRAMES.inc(analysis=consumer.name)
+                    except Exception as e:
+                        print(f"{consumer.name} failed on frame {frame_count}: {e}")
+                        # Stops the reader from delivering more frames to it
+                        consumer.active = False
+                        consumer.abort()
+                        outcome[consumer.name] = (None, e)
+
+                if progress and frame_count - reported >= self.progress_every:
+                    reported = frame_count
+                    self._report(progress, frame_count, meta, consumers)
+        except BaseException:
+            # Decoding failed or we're being torn down: release every consumer
+            for consumer in live:
+                if consumer.name not in outcome:
+                    consumer.abort()
+            self._close(consumers)
+            raise
+        finally:
+            if PIPELINE_ENABLED:
+                frames.close()
+            cap.release()
+
+        live = [c for c in live if c.name not in outcome]
+        for consumer in live:
+            try:
+                start = time.perf_counter()
+                consumer.flush()
+                result = consumer.finish() if consumer.segment is None else consumer.finish_segment()
+                outcome[consumer.name] = (result, None)
+                if consumer.trace is not None:
+                    consumer.trace.complete(f"finish {consumer.name}", "finish", start)
+            except Exception as e:
+                outcome[consumer.name] = (None, e)
+        self._close(consumers)
+
+        if progress:
+            self._report(progress, frame_count, meta, consumers, finished=True)
+        return outcome
+
+    def _close(self, consumers):
+        for consumer in consumers:
+            try:
+                consumer.close()
+            except Exception as e:
+                print(f"{consumer.name} failed to close: {e}")
+            if consumer.trace is not None:
+                consumer.trace.end(consumer.name, "analysis", self._span_id(consumer))
+
+    def _span_id(self, consumer):
+        # Segments of one analysis run at the same time: one async span each
+        return f"{consumer.name}-{self.start}"
+
+    def _span_args(self, consumer):
+        args = {"frames": f"{self.start}-{self.end or 'end'}"}
+        if consumer.segment is not None:
+            args["segment"] = consumer.segment.index
+        return args
+
+    def _report(self, progress, frame_count, meta, consumers, finished=False):
+        total = max(meta.total_frames, frame_count)
+        end = min(self.end, total) if self.end is not None else total
+        span = max(end - self.start + 1, 0)
+        if finished:
+            # The last frames of the range are only decoded if someone wants
+            # them, and adaptive sampling takes fewer frames than the stride
+            # predicts: once the range is done, report it whole
+            progress(span, span, {c.name: (c.frames_done, c.frames_done) for c in consumers})
+            return
+        progress(max(frame_count - self.start + 1, 0), span, {
+            c.name: (c.frames_done, end // c.stride - (self.start - 1) // c.stride) for c in consumers
+        })
+
+
+def run_single(video_path, consumer):
+    """
+    Runs one consumer on its own FrameSource and returns its result,
+    re-raising its error. Keeps the old per-analysis entry points working.
+    """
+    result, error = FrameSource(video_path).run([consumer])[consumer.name]
+    if error is not None:
+        raise error
+    return result
@@ -1,41 +1,208 @@
 import cv2
 import numpy as np
 import os
+import re
+import time
+from .frame_source import BatchedConsumer, run_single
+from .model_registry import DETECTION_MODEL
+from .inference_store import StoredInference
+from .segments import stitch_track_ids
 
-def generate_heatmap(video_path):
-    cap = cv2.VideoCapture(video_path)
-    heatmap = None
-    
-    # Determine output path relative to this file or CWD
-    # Ideally should use the same logical directory as main.py
-    # Assuming CWD is 'backend/' or we use absolute paths if provided.
-    # But main.py calls it.
-    
-    # Better approach: Saves to 'outputs' directory in CWD
-    output_dir = "outputs"
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, "heatmap.png")
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        h, w, _ = frame.shape
-        if heatmap is None:
-            heatmap = np.zeros((h, w), dtype=np.float32)
-
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        heatmap += gray / 255.0
-
-    if heatmap is not None:
+# Side of one heatmap cell in pixels; hits are counted per cell, not per pixel
+HEATMAP_CELL = int(os.getenv("HEATMAP_CELL", "8"))
+# Per-player layers written for the most active tracks (0 = combined map only)
+HEATMAP_TRACK_LAYERS = int(os.getenv("HEATMAP_TRACK_LAYERS", "10"))
+# Gaussian blur on the upscaled map, as in the standalone heatmap.py script
+BLUR = 31
+
+def generate_heatmap(video_path, output_dir=None):
+    """
+    Builds the player occupancy heatmap for the video.
+    Returns the path to the combined heatmap image.
+    """
+    if output_dir is None:
+        output_dir = "outputs"
+    output_path, _ = run_single(video_path, HeatmapConsumer(video_path, output_dir))
+    return output_path
+
+
+class HeatmapConsumer(BatchedConsumer):
+    """
+    Frame consumer accumulating where tracked players stand.
+
+    Each detected person adds a hit, weighted by the frames its sample stands
+    for, at its footprint (bottom-centre of the box) to a grid of HEATMAP_CELL x HEATMAP_CELL pixel cells, so memory and
+    time grow with the number of detections rather than pixels x frames.
+    Hits are kept as (track id, cell) columns so per-player layers can be
+    built at the end.
+    Result: (output_path, [(track_id, layer_path), ...]), output_path is None
+    if there were no frames.
+    """
+
+    name = "heatmap"
+
+    skip_frames = 2 # Process every 3rd frame
+    stride = skip_frames + 1
+    weights = DETECTION_MODEL
+    conf = 0.3
+
+    def __init__(self, video_path, output_dir, batch_size=None, skip_frames=None,
+                 cell=HEATMAP_CELL, track_layers=HEATMAP_TRACK_LAYERS):
+        super().__init__(batch_size, skip_frames)
+        self.cell = max(1, int(cell))
+        self.track_layers = track_layers
+
+        # Unique per job so concurrent runs don't overwrite each other
+        base = os.path.splitext(os.path.basename(video_path))[0]
+        clean_base = re.sub(r'[^a-zA-Z0-9_\-]', '_', base)
+        self.output_dir = output_dir
+        self.output_prefix = f"heatmap_{clean_base}_{int(time.time() * 1000)}"
+
+        self.model = None
+        self.grid = None
+        self.grid_shape = None
+        self.background = None
+        # Per-batch arrays of hit cells (flat grid index) and their track ids
+        self._cells = []
+        self._track_ids = []
+        self._weights = []
+        self.last_count = 0
+
+    def cache_params(self):
+        params = super().cache_params()
+        params["cell"] = self.cell
+        params["track_layers"] = self.track_layers
+        return params
+
+    def start(self, meta):
+        self.grid_shape = (-(-meta.height // self.cell), -(-meta.width // self.cell))
+        self.grid = np.zeros(self.grid_shape, dtype=np.int32)
+        self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+
+    def infer(self, frames):
+        results = self.model.track(frames, self.batch_counts, conf=self.conf, classes=[0])
+
+        boxes, ids, weights = [], [], []
+        for r, frame_count in zip(results, self.batch_counts):
+            # A sample stands for the frames since the previous one, so
+            # adaptive sampling doesn't under-count static stretches
+            weight = (frame_count - self.last_count) if self.last_count else self.stride
+            self.last_count = frame_count
+            if self.warming_up(frame_count) or not r.boxes or len(r.boxes) == 0:
+                continue
+            xyxy = r.boxes.xyxy.cpu().numpy()
+            boxes.append(xyxy)
+            weights.append(np.full(len(xyxy), weight, dtype=np.int32))
+            if r.boxes.id is not None:
+                ids.append(r.boxes.id.cpu().numpy().astype(np.int64))
+            else:
+                ids.append(np.full(len(xyxy), -1, dtype=np.int64))
+
+        if boxes:
+            self.accumulate(np.concatenate(boxes), np.concatenate(ids), np.concatenate(weights))
+        return results
+
+    def accumulate(self, xyxy, track_ids, weights):
+        """Adds the weighted hit of every box at its footprint, for the whole batch at once."""
+        rows, cols = self.grid_shape
+        fx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+        fy = xyxy[:, 3]
+        gx = np.clip((fx // self.cell).astype(np.int64), 0, cols - 1)
+        gy = np.clip((fy // self.cell).astype(np.int64), 0, rows - 1)
+        cells = gy * cols + gx
+
+        np.add.at(self.grid.reshape(-1), cells, weights)
+        if self.track_layers:
+            self._cells.append(cells)
+            self._track_ids.append(track_ids)
+            self._weights.append(weights)
+
+    def handle(self, frame_count, frame, r):
+        if frame_count % 30 == 0:
+            print(f"Heatmap processing frame {frame_count}...")
+        if self.warming_up(frame_count):
+            return
+        # The overlay is drawn on the last frame seen
+        self.background = frame
+
+    def render(self, grid, path):
+        """Upscales a hit grid to frame size and writes it blended over the background."""
+        h, w = self.background.shape[:2]
+        heatmap = cv2.resize(grid.astype(np.float32), (w, h), interpolation=cv2.INTER_LINEAR)
+        heatmap = cv2.GaussianBlur(heatmap, (BLUR | 1, BLUR | 1), 0)
         heatmap = cv2.normalize(heatmap, None, 0, 255, cv2.NORM_MINMAX)
         heatmap = heatmap.astype(np.uint8)
-        heatmap = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-        cv2.imwrite(output_path, heatmap)
+        colored = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
+        overlay = cv2.addWeighted(self.background, 0.6, colored, 0.4, 0)
+        cv2.imwrite(path, overlay)
+        return path
 
-    cap.release()
-    # return simple filename or path relative to CWD?
-    # main.py expects to return URL.
-    # main.py expects a path to identify the file.
-    return output_path
+    def finish(self):
+        if self.background is None:
+            return None, []
+        os.makedirs(self.output_dir, exist_ok=True)
+        output_path = self.render(self.grid, os.path.join(self.output_dir, f"{self.output_prefix}.png"))
+
+        layers = []
+        if self.track_layers and self._cells:
+            cells = np.concatenate(self._cells)
+            track_ids = np.concatenate(self._track_ids)
+            weights = np.concatenate(self._weights)
+            tracked = track_ids >= 0
+            if not tracked.any():
+                # Hits without track ids (tracker warm-up, untracked boxes): combined map only
+                return output_path, layers
+            cells, track_ids, weights = cells[tracked], track_ids[tracked], weights[tracked]
+
+            # Layers for the tracks with the most hits, built in one scatter
+            ids, inverse = np.unique(track_ids, return_inverse=True)
+            totals = np.bincount(inverse, weights=weights, minlength=len(ids))
+            top = np.argsort(totals)[::-1][:self.track_layers]
+            slot = np.full(len(ids), -1)
+            slot[top] = np.arange(len(top))
+            keep = slot[inverse] >= 0
+
+            stack = np.zeros((len(top),) + self.grid_shape, dtype=np.int32)
+            np.add.at(stack.reshape(len(top), -1), (slot[inverse][keep], cells[keep]), weights[keep])
+
+            for i, track_index in enumerate(top):
+                track_id = int(ids[track_index])
+                path = os.path.join(self.output_dir, f"{self.output_prefix}_player_{track_id}.png")
+                layers.append((track_id, self.render(stack[i], path)))
+
+        return output_path, layers
+
+    def finish_segment(self):
+        def joined(parts, dtype):
+            return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+        return {
+            "grid": self.grid,
+            "cells": joined(self._cells, np.int64),
+            "track_ids": joined(self._track_ids, np.int64),
+            "weights": joined(self._weights, np.int32),
+            "background": self.background,
+            "segment": self.segment.summary(),
+        }
+
+    def merge_segments(self, parts):
+        # Hits add up; player layers follow IDs continued across segments
+        id_maps = stitch_track_ids([part["segment"] for part in parts])
+        self.grid = sum(part["grid"] for part in parts)
+        self.grid_shape = self.grid.shape
+        self._cells, self._track_ids, self._weights = [], [], []
+        for part, id_map in zip(parts, id_maps):
+            if part["background"] is not None:
+                self.background = part["background"]
+            if not len(part["cells"]):
+                continue
+            track_ids = part["track_ids"].copy()
+            tracked = track_ids >= 0
+            track_ids[tracked] = id_map.map(track_ids[tracked])
+            self._cells.append(part["cells"])
+            self._track_ids.append(track_ids)
+            self._weights.append(part["weights"])
+        return self.finish()
+
+    def abort(self):
+        pass
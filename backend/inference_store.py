@@ -0,0 +1,301 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: stores are only shared within one process there
+    fcntl = None
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from . import metrics, tracing
+from .model_registry import acquire, serving_backend
+from .result_cache import file_digest
+from .tracker_session import TrackerSession
+
+# Raw detections are stored at this confidence; analyses filter up from it
+STORE_CONF = 0.25
+# Persist detections across jobs (0 = keep them for the current job only)
+INFERENCE_STORE_ENABLED = os.getenv("INFERENCE_STORE", "1") != "0"
+INFERENCE_STORE_DIR = os.getenv(
+    "INFERENCE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "detections"),
+)
+
+KEYPOINT_SHAPE = (17, 3)
+STORE_VERSION = 1
+
+
+class DetectionStore:
+    """
+    Raw per-frame outputs of one model on one video, as columns.
+
+    One row per detection: box (x1, y1, x2, y2), conf, cls and, for pose
+    models, 17x3 keypoints. `frames` lists every inferred frame number (also
+    those without detections) and `offsets[i]:offsets[i + 1]` are its rows.
+    Columns are .npy files opened memory-mapped, so a long video's store is
+    paged in on demand. Frames added during a run are held in memory until
+    save() merges them into the files.
+    """
+
+    columns = ("frames", "offsets", "boxes", "conf", "cls", "keypoints")
+
+    def __init__(self, path, persist=True):
+        self.path = path
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._new = {}  # frame_count -> (boxes, conf, cls, keypoints)
+        if os.path.exists(self.path):
+            with self._locked(shared=True):
+                self._load()
+        else:
+            self._load()
+
+    @contextmanager
+    def _locked(self, shared=False):
+        """File lock on the store directory; analysis worker processes save into it too."""
+        if fcntl is None or not self.persist:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        self.frames = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.conf = np.empty(0, dtype=np.float32)
+        self.cls = np.empty(0, dtype=np.int16)
+        self.keypoints = None
+        if not self.persist or not os.path.exists(os.path.join(self.path, "meta.json")):
+            return
+        with open(os.path.join(self.path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION or meta.get("conf") != STORE_CONF:
+            return
+        for name in self.columns:
+            file = os.path.join(self.path, f"{name}.npy")
+            if os.path.exists(file):
+                setattr(self, name, np.load(file, mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.frames) + len(self._new)
+
+    def get(self, frame_count):
+        """(boxes, conf, cls, keypoints) for a frame, or None if it was never inferred."""
+        with self._lock:
+            item = self._new.get(frame_count)
+            if item is not None:
+                return item
+            i = np.searchsorted(self.frames, frame_count)
+            if i == len(self.frames) or self.frames[i] != frame_count:
+                return None
+            return self._rows(i)
+
+    def put(self, frame_count, boxes, conf, cls, keypoints=None):
+        with self._lock:
+            self._new[frame_count] = (
+                np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+                np.asarray(conf, dtype=np.float32).reshape(-1),
+                np.asarray(cls, dtype=np.int16).reshape(-1),
+                None if keypoints is None else np.asarray(keypoints, dtype=np.float32).reshape((-1,) + KEYPOINT_SHAPE),
+            )
+
+    def _rows(self, i):
+        rows = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        keypoints = np.array(self.keypoints[rows]) if self.keypoints is not None else None
+        return np.array(self.boxes[rows]), np.array(self.conf[rows]), np.array(self.cls[rows]), keypoints
+
+    def save(self):
+        """Merges frames added since the last save into the column files."""
+        with self._lock:
+            if not self._new or not self.persist:
+                return
+            with self._locked():
+                # Pick up what other processes saved since we loaded
+                self._load()
+                self._write()
+            self._new = {}
+
+    def _write(self):
+        """Writes stored and new frames as one set of columns (file lock held)."""
+        # Frames already on disk win (they can't differ: same model, same video)
+        items = {int(f): self._rows(i) for i, f in enumerate(self.frames)}
+        for frame_count, item in self._new.items():
+            items.setdefault(frame_count, item)
+        frames = np.array(sorted(items), dtype=np.int64)
+        ordered = [items[f] for f in frames]
+
+        columns = {
+            "frames": frames,
+            "offsets": np.r_[0, np.cumsum([len(item[1]) for item in ordered])].astype(np.int64),
+            "boxes": np.concatenate([item[0] for item in ordered]),
+            "conf": np.concatenate([item[1] for item in ordered]),
+            "cls": np.concatenate([item[2] for item in ordered]),
+        }
+        if any(item[3] is not None for item in ordered):
+            empty = np.empty((0,) + KEYPOINT_SHAPE, dtype=np.float32)
+            columns["keypoints"] = np.concatenate([empty if item[3] is None else item[3] for item in ordered])
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, array in columns.items():
+            tmp = os.path.join(self.path, f"{name}.tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, os.path.join(self.path, f"{name}.npy"))
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"version": STORE_VERSION, "conf": STORE_CONF,
+                       "frames": len(frames), "rows": len(columns["conf"])}, f)
+
+        self._load()
+
+
+_stores = {}  # (video digest, weights, backend) -> [DetectionStore, users]
+_stores_lock = threading.Lock()
+
+
+def open_store(video_path, weights, backend=None):
+    """
+    The shared DetectionStore for this video's content, these weights and
+    the runtime serving them. Consumers of one job (and concurrent jobs on
+    the same video) get the same instance, so a frame is inferred once.
+    Pair with close_store().
+    """
+    digest = file_digest(video_path)
+    # Detections of a default backend that fell back to PyTorch are PyTorch's
+    backend = serving_backend(weights, backend)
+    key = (digest, weights, backend)
+    with _stores_lock:
+        entry = _stores.get(key)
+        if entry is None:
+            name = os.path.splitext(os.path.basename(weights))[0]
+            if backend != "torch":
+                name = f"{name}-{backend}"
+            path = os.path.join(INFERENCE_STORE_DIR, digest[:32], name)
+            entry = _stores[key] = [DetectionStore(path, persist=INFERENCE_STORE_ENABLED), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def close_store(store):
+    """Saves what this user added and drops the store once nobody uses it."""
+    store.save()
+    with _stores_lock:
+        for key, entry in list(_stores.items()):
+            if entry[0] is store:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del _stores[key]
+
+
+class StoredInference:
+    """
+    A consumer's view of one model through the detection store.
+
+    predict()/track() return ultralytics Results like model(...) and
+    model.track(...) would, built from stored detections filtered at the
+    consumer's conf and classes. Only frames the store lacks go through the
+    network. Track IDs come from a TrackerSession private to this object,
+    replayed over the filtered detections. Without a video_path (live
+    frames) nothing is stored; only the last batch's detections are kept, so
+    predict() and track() of the same frames infer once.
+    """
+
+    def __init__(self, weights, video_path, segment=None, backend=None):
+        self.weights = weights
+        self.video_path = video_path
+        # Segment whose boundary boxes are logged for ID stitching, if split
+        self.segment = segment
+        self.backend = backend
+        self.store = open_store(video_path, weights, backend) if video_path is not None else None
+        self.model = None
+        self.names = None
+        self.tracker = None
+        self.frames_inferred = 0
+        self._last = {}  # store-less mode: frame count -> detections of the last batch
+
+    def _model(self):
+        if self.model is None:
+            self.model = acquire(self.weights, self.backend)
+        return self.model
+
+    def _detections(self, frames, frame_counts):
+        if self.store is None:
+            items = [self._last.get(fc) for fc in frame_counts]
+        else:
+            items = [self.store.get(fc) for fc in frame_counts]
+        missing = [i for i, item in enumerate(items) if item is None]
+        analysis = metrics.current_analysis()
+        if self.store is not None:
+            if len(missing) < len(items):
+                metrics.CACHE_REQUESTS.inc(len(items) - len(missing), cache="detections", analysis=analysis, result="hit")
+            if missing:
+                metrics.CACHE_REQUESTS.inc(len(missing), cache="detections", analysis=analysis, result="miss")
+        if missing:
+            start = time.perf_counter()
+            results = self._model()([frames[i] for i in missing], conf=STORE_CONF, verbose=False)
+            metrics.stage_done("inference", analysis, start)
+            trace = tracing.current()
+            if trace is not None:
+                trace.complete(f"network {self.weights}", "inference", start, frames=len(missing))
+            for i, r in zip(missing, results):
+                keypoints = r.keypoints.data.cpu().numpy() if r.keypoints is not None else None
+                if r.boxes is None:
+                    boxes, conf, cls = np.empty((0, 4)), np.empty(0), np.empty(0)
+                else:
+                    boxes = r.boxes.xyxy.cpu().numpy()
+                    conf = r.boxes.conf.cpu().numpy()
+                    cls = r.boxes.cls.cpu().numpy()
+                if self.store is None:
+                    items[i] = (boxes, conf, cls, keypoints)
+                    continue
+                self.store.put(frame_counts[i], boxes, conf, cls, keypoints)
+                items[i] = self.store.get(frame_counts[i])
+            self.frames_inferred += len(missing)
+            if self.store is None:
+                self._last = dict(zip(frame_counts, items))
+        if self.names is None:
+            self.names = self._model().names
+        return items
+
+    def _result(self, frame, item, conf, classes):
+        boxes, scores, cls, keypoints = item
+        keep = scores >= (conf if conf is not None else STORE_CONF)
+        if classes is not None:
+            keep &= np.isin(cls, classes)
+        data = np.concatenate([boxes[keep], scores[keep, None], cls[keep, None].astype(np.float32)], axis=1)
+        kpts = None
+        if keypoints is not None:
+            kpts = torch.from_numpy(keypoints[keep])
+        return Results(orig_img=frame, path=self.video_path, names=self.names,
+                       boxes=torch.from_numpy(data), keypoints=kpts)
+
+    def predict(self, frames, frame_counts, conf=None, classes=None):
+        items = self._detections(frames, frame_counts)
+        return [self._result(f, item, conf, classes) for f, item in zip(frames, items)]
+
+    def track(self, frames, frame_counts, conf=None, classes=None):
+        """Like predict(), then runs the tracker over the frames in order (boxes get ids)."""
+        results = self.predict(frames, frame_counts, conf, classes)
+        if self.tracker is None:
+            self.tracker = TrackerSession()
+        tracked = [self.tracker.update(r) for r in results]
+        if self.segment is not None:
+            for frame_count, r in zip(frame_counts, tracked):
+                self.segment.record(frame_count, r)
+        return tracked
+
+    def close(self):
+        if self.store is not None:
+            close_store(self.store)
+            self.store = None
+        self.tracker = None
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of analysis jobs that may run at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs kept around for GET /jobs/{id}
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    """
+    State of one queued/running/finished analysis job.
+    Progress updates bump `version` and wake anyone waiting in wait_for_change().
+    """
+
+    def __init__(self, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames_decoded = 0
+        self.total_frames = 0
+        self.analyses = {}  # name -> {"frames_done": int, "frames_total": int}
+        self.result = None
+        self.error = None
+        self.trace = None  # tracing.Trace, if the job records a timeline
+        self.version = 0
+        self._cond = threading.Condition()
+
+    def update_progress(self, frames_decoded, total_frames, analyses):
+        with self._cond:
+            self.frames_decoded = frames_decoded
+            self.total_frames = total_frames
+            self.analyses = {
+                name: {"frames_done": done, "frames_total": total}
+                for name, (done, total) in analyses.items()
+            }
+            self._bump()
+
+    def _set_status(self, status, result=None, error=None):
+        with self._cond:
+            self.status = status
+            if status == "running":
+                self.started_at = time.time()
+            elif status in ("done", "failed"):
+                self.finished_at = time.time()
+                self.result = result
+                self.error = error
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def eta_seconds(self):
+        """Remaining time, extrapolated from the decode rate so far."""
+        if self.status != "running" or not self.frames_decoded or not self.total_frames:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = max(self.total_frames - self.frames_decoded, 0)
+        return round(elapsed / self.frames_decoded * remaining, 1)
+
+    def wait_for_change(self, version, timeout=15.0):
+        """Blocks until the job changes past `version` (or timeout); returns the new version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version or self.finished, timeout)
+            return self.version
+
+    def to_dict(self):
+        with self._cond:
+            data = {
+                "job_id": self.id,
+                "status": self.status,
+                "params": self.params,
+                "progress": {
+                    "frames_decoded": self.frames_decoded,
+                    "total_frames": self.total_frames,
+                    "analyses": self.analyses,
+                    "eta_seconds": self.eta_seconds(),
+                },
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.status == "done":
+                data["result"] = self.result
+            if self.status == "failed":
+                data["error"] = self.error
+            if self.trace is not None:
+                data["trace_url"] = f"/jobs/{self.id}/trace"
+            return data
+
+
+class JobManager:
+    """
+    Runs analysis jobs on a worker thread pool and keeps their state in memory.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, params):
+        """
+        Queues fn(job) and returns the Job right away. fn reports progress via
+        job.update_progress and returns the job result.
+        """
+        job = Job(uuid.uuid4().hex, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self):
+        """Number of kept jobs per status."""
+        counts = dict.fromkeys(("queued", "running", "done", "failed"), 0)
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def _run(self, job, fn):
+        job._set_status("running")
+        try:
+            result = fn(job)
+        except Exception as e:
+            traceback.print_exc()
+            detail = getattr(e, "detail", None) or str(e)
+            job._set_status("failed", error=detail)
+        else:
+            job._set_status("done", result=result)
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.finished]
+        if len(finished) <= MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda j: j.finished_at)
+        for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+            del self._jobs[job.id]
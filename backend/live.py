@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from . import metrics
+from .inference_store import StoredInference
+from .model_registry import DETECTION_MODEL, POSE_MODEL
+from .overlay import boxes_of, keypoints_of
+from .pose_analysis import PoseConsumer, extract_elbow_angles, elbow_metrics
+from .shot_analysis import extract_shot_features
+from .speed_analysis import SpeedConsumer, SpeedTotals, TrackStore, compute_speed_metrics
+
+LIVE_ANALYSES = ("tracking", "pose", "speed", "shot_analysis")
+# Live sessions served at once (each runs its own analysis thread)
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", "4"))
+# Rolling speed metrics cover the last this many seconds
+LIVE_SPEED_WINDOW = float(os.getenv("LIVE_SPEED_WINDOW", "5"))
+
+
+class LiveAnalyzer:
+    """
+    Incremental tracking, pose, speed and shot analysis of a live frame
+    sequence.
+
+    Every frame goes through each model once; the tracked detections serve
+    tracking and speed, the tracked skeletons serve pose and shot. State
+    carries over from frame to frame like in the file analyses: the last
+    elbow angle per player, the last shot detected, the players' positions
+    over the speed window (older ones are dropped as frames arrive) and
+    running speed totals for the session summary. Frame numbers count frames
+    as they arrive, so frames skipped to keep up still count as time passing.
+    """
+
+    def __init__(self, analyses=LIVE_ANALYSES, fps=30, backend=None, speed_window=LIVE_SPEED_WINDOW):
+        unknown = set(analyses) - set(LIVE_ANALYSES)
+        if unknown:
+            raise ValueError(f"Analyses not available live: {sorted(unknown)}, expected some of {LIVE_ANALYSES}")
+        self.analyses = set(analyses)
+        self.fps = fps or 30
+
+        self.detector = None
+        self.pose = None
+        if self.analyses & {"tracking", "speed"}:
+            self.detector = StoredInference(DETECTION_MODEL, None, backend=backend)
+        if self.analyses & {"pose", "shot_analysis"}:
+            self.pose = StoredInference(POSE_MODEL, None, backend=backend)
+        # Set up the predictors now rather than on the first live frames
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for model in (self.detector, self.pose):
+            if model is not None:
+                model.predict([dummy], [0])
+
+        self.speed_window = speed_window
+        self.tracks = TrackStore()  # positions within the speed window
+        self.speed_totals = SpeedTotals(self.fps)
+        self.angles = {}  # track id -> last right elbow angle
+        self.shot_type = "Rest Shot"
+        self.frames = 0
+
+    def process(self, frame_count, frame):
+        """Analyses one frame; returns the rolling metrics and its annotations."""
+        self.frames += 1
+        update = {"frame": frame_count}
+        with metrics.analysis("live"):
+            if self.detector is not None:
+                r = self.detector.track([frame], [frame_count], conf=SpeedConsumer.conf)[0]
+                if "tracking" in self.analyses:
+                    update["boxes"], update["ids"] = boxes_of(r, persons_only=True)
+                if "speed" in self.analyses:
+                    self._add_positions(frame_count, r)
+                    update["speed"] = self.speed()
+
+            if self.pose is not None:
+                r = self.pose.track([frame], [frame_count], conf=PoseConsumer.conf)[0]
+                update["keypoints"] = keypoints_of(r)
+                if "pose" in self.analyses:
+                    elbows = extract_elbow_angles([r])[0]
+                    for track_id, ang, _ in elbows:
+                        self.angles[track_id] = ang
+                    update["elbows"] = [[ex, ey, round(ang, 1)] for _, ang, (ex, ey) in elbows]
+                    update.update(elbow_metrics(self.angles))
+                if "shot_analysis" in self.analyses:
+                    # Unfiltered and untracked, as ShotConsumer classifies (no second inference)
+                    r = self.pose.predict([frame], [frame_count])[0]
+                    features = extract_shot_features([r], frame.shape[1], frame.shape[0])[0]
+                    if features is not None and features[1] != "Rest Shot":
+                        self.shot_type = features[1]
+                    update["shot_type"] = self.shot_type
+        metrics.FRAMES.inc(analysis="live")
+        return update
+
+    def _add_positions(self, frame_count, r):
+        # Box centroids of tracked players, as SpeedConsumer.handle() keeps them
+        if r.boxes and r.boxes.id is not None:
+            boxes = r.boxes.xyxy.cpu().numpy()
+            track_ids = r.boxes.id.cpu().numpy().astype(np.int64)
+            cx, cy = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+            self.tracks.append(track_ids, frame_count, cx, cy)
+            self.speed_totals.append(track_ids, frame_count, cx, cy)
+        # Only frames within the window (frame_idx > frame_count - window) stay
+        self.tracks.drop_before(int(np.floor(frame_count - self.speed_window * self.fps)) + 1)
+
+    def speed(self):
+        """Speed metrics over the last `speed_window` seconds."""
+        return compute_speed_metrics(self.tracks, self.fps)
+
+    def summary(self):
+        """Metrics of the whole session, shaped like the file analyses' aggregated_metrics."""
+        summary = {"frames": self.frames}
+        if "pose" in self.analyses:
+            summary.update(elbow_metrics(self.angles))
+        if "speed" in self.analyses:
+            summary.update(self.speed_totals.metrics())
+        if "shot_analysis" in self.analyses:
+            summary["shot_type"] = self.shot_type
+        return summary
+
+    def close(self):
+        for model in (self.detector, self.pose):
+            if model is not None:
+                model.close()
+
+
+class LiveSession:
+    """
+    Runs a LiveAnalyzer on its own thread over frames pushed as encoded
+    images (JPEG, PNG, ...), and hands every result to `on_update` (called
+    on that thread).
+
+    At most one frame waits for analysis: a frame arriving while another
+    still waits replaces it and the older one is counted as dropped. So
+    latency stays bounded by about one analysis step, however fast frames
+    come in.
+    """
+
+    def __init__(self, analyzer, on_update):
+        self.analyzer = analyzer
+        self.on_update = on_update
+        self.received = 0
+        self.dropped = 0
+        self._pending = None
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="live-analysis", daemon=True)
+        self._thread.start()
+
+    def push(self, data):
+        """Queues an encoded frame (bytes); never blocks."""
+        with self._cond:
+            self.received += 1
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (self.received, data, time.perf_counter())
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending is not None or self._closing)
+            item, self._pending = self._pending, None
+            return item
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            frame_count, data, arrived = item
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                self.on_update({"type": "error", "frame": frame_count, "detail": "Could not decode frame"})
+                continue
+            try:
+                update = self.analyzer.process(frame_count, frame)
+            except Exception as e:
+                print(f"Live analysis failed on frame {frame_count}: {e}")
+                self.on_update({"type": "error", "frame": frame_count, "detail": str(e)})
+                continue
+            update["type"] = "update"
+            update["latency_ms"] = round((time.perf_counter() - arrived) * 1000, 1)
+            update["dropped"] = self.dropped
+            self.on_update(update)
+
+    def close(self):
+        """Analyses the frame still waiting, stops the thread and returns the session summary."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        try:
+            summary = self.analyzer.summary()
+        finally:
+            self.analyzer.close()
+        summary.update(received=self.received, dropped=self.dropped)
+        return summary
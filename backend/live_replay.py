@@ -0,0 +1,122 @@
+"""
+Replays a video file as a live stream, for trying out live analysis locally.
+
+    python -m backend.live_replay clip.mp4 --url ws://127.0.0.1:8000/live
+    python -m backend.live_replay clip.mp4 --local --analyses pose shot_analysis
+
+Frames are sent as JPEGs at the clip's frame rate (times --speed) to the
+/live WebSocket, or with --local straight into a LiveSession in this
+process, and every update is printed as it comes back.
+"""
+import argparse
+import json
+import threading
+import time
+
+import cv2
+
+from .live import LIVE_ANALYSES
+
+
+def frames(path, quality=80, speed=1.0):
+    """Yields the clip's frames JPEG-encoded, paced like a camera at `speed` times real time."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    interval = 1 / (fps * speed) if speed > 0 else 0
+    start = time.perf_counter()
+    sent = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            ok, data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok:
+                continue
+            delay = start + sent * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield data.tobytes()
+            sent += 1
+    finally:
+        cap.release()
+
+
+def clip_fps(path):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    return fps
+
+
+def describe(update):
+    if update.get("type") != "update":
+        return json.dumps(update)
+    parts = [f"frame {update['frame']:>5}", f"{update['latency_ms']:>7.1f} ms", f"dropped {update['dropped']}"]
+    if "ids" in update or "boxes" in update:
+        parts.append(f"players {len(update.get('boxes', []))}")
+    if "speed" in update:
+        parts.append(f"speed {update['speed']['average_speed']:.2f} m/s")
+    if "elbow_angle" in update:
+        parts.append(f"elbow {update['elbow_angle']:.1f}")
+    if "shot_type" in update:
+        parts.append(update["shot_type"])
+    return "  ".join(parts)
+
+
+def replay_remote(args, fps):
+    # websockets ships with uvicorn[standard]; only this client mode needs it
+    from websockets.sync.client import connect
+
+    with connect(args.url, max_size=None) as ws:
+        ws.send(json.dumps({"analyses": args.analyses, "fps": fps, "backend": args.backend}))
+        ready = json.loads(ws.recv())
+        print(describe(ready))
+        if ready.get("type") != "ready":
+            return 1
+
+        def send():
+            for data in frames(args.video, args.quality, args.speed):
+                ws.send(data)
+            ws.send(json.dumps({"type": "end"}))
+
+        sender = threading.Thread(target=send, name="replay-sender", daemon=True)
+        sender.start()
+        for message in ws:
+            update = json.loads(message)
+            print(describe(update))
+            if update.get("type") == "summary":
+                break
+        sender.join()
+    return 0
+
+
+def replay_local(args, fps):
+    from .live import LiveAnalyzer, LiveSession
+
+    session = LiveSession(LiveAnalyzer(args.analyses, fps, args.backend), lambda update: print(describe(update)))
+    for data in frames(args.video, args.quality, args.speed):
+        session.push(data)
+    print(describe({"type": "summary", "aggregated_metrics": session.close()}))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a video file as a live analysis stream.")
+    parser.add_argument("video")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/live", help="live analysis WebSocket")
+    parser.add_argument("--analyses", nargs="+", default=list(LIVE_ANALYSES), choices=LIVE_ANALYSES)
+    parser.add_argument("--backend", default=None, help="inference backend, defaults to the server's")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback rate (0 = as fast as possible)")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality of the sent frames")
+    parser.add_argument("--local", action="store_true", help="analyse in this process instead of over the network")
+    args = parser.parse_args(argv)
+
+    fps = clip_fps(args.video)
+    return replay_local(args, fps) if args.local else replay_remote(args, fps)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
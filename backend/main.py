@@ -1,19 +1,35 @@
-from fastapi import FastAPI, UploadFile, File, Body, HTTPException
+from fastapi import FastAPI, UploadFile, File, Body, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import asyncio
 import shutil
 import os
+import threading
+import json
 import cv2
 import numpy as np
-from ultralytics import YOLO
 
 # Import local modules (use package-relative paths since backend is a package)
 from .pose_analysis import analyze_pose
 from .heatmap import generate_heatmap
 from .speed_analysis import analyze_speed
 from .shot_analysis import analyze_cricket_shot
+from .detector import TrackingConsumer
+from .frame_source import MotionSampler, run_single, ADAPTIVE_SAMPLING
+from .model_registry import warm_up, resolve_backend, missing_packages, INFERENCE_BACKEND, WARMUP_ENABLED
+from .jobs import JobManager, JOB_WORKERS
+from .batch import ANALYSIS_ORDER, build_consumers, collect_clips, run_batch
+from .live import LiveAnalyzer, LiveSession, LIVE_ANALYSES, LIVE_MAX_SESSIONS
+from .metrics import Gauge, CACHE_REQUESTS, METRICS_ENABLED, render as render_metrics
+from . import tracing
+from .scheduler import Scheduler
+from .result_cache import ResultCache, file_digest, cache_key
+from .uploads import UploadManager, UploadError, store_stream
+from .overlay import OVERLAY_SUFFIX
 from .ai_coach import get_coaching_feedback
 from .voice_utils import transcribe_audio
 
@@ -36,40 +52,325 @@ OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Resumable, content-addressed uploads
+uploads = UploadManager(UPLOAD_DIR)
+
+# Content-addressed cache of analysis results; artifacts live under outputs/cache
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "2048"))
+result_cache = ResultCache(
+    os.path.join(OUTPUT_DIR, "cache"),
+    "/backend/outputs/cache",
+    RESULT_CACHE_MAX_MB * 1024 * 1024,
+)
+
+# Worker processes the analyses run in (ANALYSIS_WORKERS, off by default)
+scheduler = Scheduler()
+
+# Worker pool running /process jobs; with analysis workers, enough job
+# threads to keep them all busy
+jobs = JobManager(max(JOB_WORKERS, scheduler.workers))
+Gauge("jobs", "Analysis jobs by status (queued = waiting for a job worker).", ("status",),
+      callback=lambda: {(status,): n for status, n in jobs.counts().items()})
+
+# Directories and manifests POST /batch may read clips from; batch runs write under outputs/batch
+BATCH_ROOT = os.path.abspath(os.getenv("BATCH_ROOT", UPLOAD_DIR))
+BATCH_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "batch")
+
+# Open /live sessions; each holds its own models and analysis thread
+live_sessions = threading.BoundedSemaphore(LIVE_MAX_SESSIONS)
+
 # Serve output files (videos & images)
 app.mount("/backend/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
+# Originals, for drawing overlay sidecars over them in the browser
+app.mount("/backend/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+
+@app.on_event("startup")
+def load_models():
+    missing = missing_packages(INFERENCE_BACKEND)
+    if missing:
+        print(f"Warning: INFERENCE_BACKEND={INFERENCE_BACKEND} needs {', '.join(missing)}; "
+              f"jobs without a backend of their own run on PyTorch")
+    # Load YOLO weights once and run a dummy inference so the first
+    # /process call doesn't pay for it
+    if WARMUP_ENABLED and not scheduler.enabled:
+        warm_up()
 
-# Load YOLO model
-model = YOLO("yolov8n.pt")
+@app.on_event("shutdown")
+def stop_workers():
+    scheduler.shutdown()
 
 # ------------------ MODELS ------------------
 
 class ProcessRequest(BaseModel):
     filename: str
     analyses: List[str]  # e.g. ["tracking", "heatmap", "pose", "speed", "shot_analysis"]
+    batch_size: Optional[int] = None  # frames per model call, defaults to INFERENCE_BATCH_SIZE
+    skip_frames: Optional[int] = Field(None, ge=0)  # frames skipped between analysed ones, defaults to each analysis' own (2)
+    render_mode: Literal["video", "overlay"] = "video"  # "overlay": JSON sidecar drawn by the frontend instead of an encoded video
+    adaptive: bool = ADAPTIVE_SAMPLING  # sample by scene motion between ADAPTIVE_MIN/MAX_STRIDE instead of a fixed stride
+    segments: Optional[int] = Field(None, ge=1)  # time slices processed in parallel, defaults to one per SEGMENT_SECONDS
+    backend: Optional[str] = None  # inference runtime ("torch", "onnx", "onnx-int8", "openvino"), defaults to INFERENCE_BACKEND
+    trace: bool = False  # record a span timeline, downloadable from GET /jobs/{job_id}/trace
+    use_cache: bool = True  # serve repeated analyses of the same video from the result cache
+
+class BatchRequest(BaseModel):
+    source: Optional[str] = None  # directory or manifest of clips, relative to BATCH_ROOT
+    filenames: Optional[List[str]] = None  # or uploaded files
+    analyses: List[str]
+    batch_size: Optional[int] = None
+    skip_frames: Optional[int] = Field(None, ge=0)
+    render_mode: Literal["video", "overlay"] = "video"
+    segments: Optional[int] = Field(None, ge=1)
+    backend: Optional[str] = None
+    concurrency: Optional[int] = Field(None, ge=1)  # clips analysed at once, defaults to one per analysis worker
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None  # total bytes, checked on completion
+    sha256: Optional[str] = None  # lets the server skip uploads it already has
 
 class CoachingRequest(BaseModel):
     question: str
     metrics: dict
+    job_id: Optional[str] = None  # job the metrics came from; a traced job records the coach call
 
 # ------------------ ENDPOINTS ------------------
 
 @app.post("/upload")
-async def upload_video(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename}
+def upload_video(file: UploadFile = File(...)):
+    # Stored under its content hash, so identical uploads share one file and
+    # two different clips called match.mp4 never overwrite each other
+    name, digest, deduplicated = store_stream(file.file, file.filename, UPLOAD_DIR)
+    return {"filename": name, "sha256": digest, "deduplicated": deduplicated}
+
+@app.post("/uploads")
+def create_upload(req: UploadInitRequest):
+    """
+    Starts a resumable upload. If `sha256` is given and we already have that
+    content, the upload completes immediately without sending any bytes.
+    """
+    return uploads.create(req.filename, req.size, req.sha256)
+
+@app.get("/uploads/{upload_id}")
+def get_upload(upload_id: str):
+    """Bytes received so far; a client resumes by sending from this offset."""
+    try:
+        session = uploads.get(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
+    return {"upload_id": upload_id, "offset": session.offset, "size": session.size}
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, offset: int, request: Request):
+    """Appends the raw request body at `offset` (must equal the current offset)."""
+    data = await request.body()
+    try:
+        new_offset = await run_in_threadpool(uploads.write_chunk, upload_id, offset, [data])
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
+    return {"upload_id": upload_id, "offset": new_offset}
+
+@app.post("/uploads/{upload_id}/complete")
+def complete_upload(upload_id: str):
+    try:
+        return uploads.complete(upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
 
 @app.post("/process")
 def process_video(req: ProcessRequest):
+    """
+    Queues the requested analyses and returns a job id right away.
+    Poll GET /jobs/{job_id} or stream GET /jobs/{job_id}/events for progress;
+    the finished job's `result` holds outputs and aggregated_metrics.
+    """
+    input_path = os.path.join(UPLOAD_DIR, req.filename)
+    if not os.path.exists(input_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        # A backend asked for by name must really run; the default may fall back
+        resolve_backend(req.backend, require=req.backend is not None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = jobs.submit(lambda job: run_job(job, req), {"filename": req.filename, "analyses": req.analyses})
+    return {"job_id": job.id, "status": job.status}
+
+def run_job(job, req):
+    """Body of a /process job; records its timeline into job.trace if asked to."""
+    if req.trace:
+        job.trace = tracing.Trace(f"{req.filename} [{', '.join(req.analyses)}]")
+    with tracing.span(job.trace, "process", filename=req.filename, analyses=req.analyses):
+        return run_analyses(req, progress=job.update_progress, trace=job.trace)
+
+@app.post("/batch")
+def process_batch(req: BatchRequest):
+    """
+    Queues a batch job over many clips: a directory or manifest under
+    BATCH_ROOT, or a list of uploaded files. Returns a job id like /process;
+    each finished clip appends a line to the job's metrics.jsonl, and the
+    done job's result links it.
+    """
+    if (req.source is None) == (req.filenames is None):
+        raise HTTPException(status_code=400, detail="Send either source or filenames")
+    unknown = set(req.analyses) - set(ANALYSIS_ORDER)
+    if unknown or not req.analyses:
+        raise HTTPException(status_code=400, detail=f"Unknown analyses {sorted(unknown)}, expected some of {ANALYSIS_ORDER}")
+    try:
+        resolve_backend(req.backend, require=req.backend is not None)
+        if req.source is not None:
+            # Manifest entries may point anywhere: only clips under BATCH_ROOT are accepted
+            clips = collect_clips(os.path.join(BATCH_ROOT, req.source), root=BATCH_ROOT)
+        else:
+            clips = [(os.path.join(UPLOAD_DIR, os.path.basename(name)), None) for name in req.filenames]
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    missing = [path for path, _ in clips if not os.path.exists(path)]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Clips not found: {[os.path.basename(p) for p in missing]}")
+    if not clips:
+        raise HTTPException(status_code=400, detail="No video clips found")
+
+    def run(job):
+        output_dir = os.path.join(BATCH_OUTPUT_DIR, job.id)
+        summary = run_batch(
+            clips, req.analyses, output_dir, scheduler, req.concurrency,
+            progress=lambda done, total: job.update_progress(done, total, {"clips": (done, total)}),
+            batch_size=req.batch_size, skip_frames=req.skip_frames, render_mode=req.render_mode,
+            segments=req.segments, backend=req.backend,
+        )
+        summary["metrics_file"] = f"/backend/outputs/batch/{job.id}/{os.path.basename(summary['metrics_file'])}"
+        summary["artifacts_url"] = f"/backend/outputs/batch/{job.id}/"
+        return summary
+
+    job = jobs.submit(run, {"batch": req.source or req.filenames, "clips": len(clips), "analyses": req.analyses})
+    return {"job_id": job.id, "status": job.status, "clips": len(clips)}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    """Server-Sent Events stream of the job state until it finishes."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    def stream():
+        while True:
+            version = job.version
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.finished:
+                break
+            while job.wait_for_change(version) == version:
+                # Nothing changed within the timeout, keep the connection alive
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/jobs/{job_id}/trace")
+def get_job_trace(job_id: str):
+    """The job's span timeline as a Chrome trace file (chrome://tracing, ui.perfetto.dev)."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.trace is None:
+        raise HTTPException(status_code=404, detail="Job was not traced (send \"trace\": true with /process)")
+    return JSONResponse(job.trace.to_dict(),
+                        headers={"Content-Disposition": f'attachment; filename="trace_{job_id}.json"'})
+
+@app.get("/metrics")
+def get_metrics():
+    """Stage timers, frame and cache counters, queue depths and model load times in Prometheus text format."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS=0)")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.websocket("/live")
+async def live_analysis(ws: WebSocket):
+    """
+    Live analysis of a frame stream.
+    The first message is a JSON config: {"analyses": [...], "fps": 30, "backend": null}.
+    Then every binary message is one encoded frame (JPEG, PNG); the server
+    answers each analysed frame with a JSON update (boxes, keypoints, rolling
+    speed, elbow_angle, shot_type, latency_ms, dropped). Frames arriving
+    faster than they can be analysed are dropped, oldest first. Send
+    {"type": "end"} to get the session summary before the socket closes.
+    """
+    await ws.accept()
+    if not live_sessions.acquire(blocking=False):
+        await ws.close(code=1013, reason=f"Too many live sessions (LIVE_MAX_SESSIONS={LIVE_MAX_SESSIONS})")
+        return
+
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+    session = None
+
+    async def send_updates():
+        while True:
+            update = await updates.get()
+            if update is None:
+                break
+            await ws.send_json(update)
+
+    sender = asyncio.create_task(send_updates())
+    try:
+        try:
+            config = await ws.receive_json()
+            analyses = config.get("analyses") or list(LIVE_ANALYSES)
+            backend = config.get("backend")
+            resolve_backend(backend, require=backend is not None)
+            analyzer = await run_in_threadpool(LiveAnalyzer, analyses, config.get("fps") or 30, backend)
+        except (ValueError, AttributeError) as e:
+            await updates.put({"type": "error", "detail": str(e)})
+            return
+        session = LiveSession(analyzer, lambda update: loop.call_soon_threadsafe(updates.put_nowait, update))
+        await updates.put({"type": "ready", "analyses": sorted(analyzer.analyses)})
+
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                session.push(message["bytes"])
+            elif message.get("text") is not None:
+                # The only text message after the config is {"type": "end"}
+                summary = await run_in_threadpool(session.close)
+                session = None
+                await updates.put({"type": "summary", "aggregated_metrics": summary})
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if session is not None:
+            await run_in_threadpool(session.close)
+        live_sessions.release()
+        await updates.put(None)
+        try:
+            await sender
+        except Exception:
+            # Client already gone
+            pass
+        try:
+            await ws.close()
+        except RuntimeError:
+            pass
+
+def run_analyses(req, progress=None, trace=None):
+    """
+    Runs the requested analyses over one shared decode of the uploaded video.
+    Analyses already in the result cache are served from it and not re-run.
+    With a tracing.Trace, every stage records its spans into it.
+    Returns {"outputs": [...], "aggregated_metrics": {...}}.
+    """
     input_path = os.path.join(UPLOAD_DIR, req.filename)
     if not os.path.exists(input_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    outputs = []
-    aggregated_metrics = {}
-    
     # Helper to clean filenames
     def clean_filename(fname):
         import re
@@ -78,160 +379,184 @@ def process_video(req: ProcessRequest):
         clean_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', name) # Replace non-alphanum with _
         return f"{clean_name}{ext}"
 
+    # Build one frame consumer per requested analysis; the video is decoded
+    # once and every frame is fanned out to all of them
+    tracked_name = clean_filename(f"tracked_{req.filename}")
+    consumers = build_consumers(input_path, OUTPUT_DIR, req.analyses, os.path.join(OUTPUT_DIR, tracked_name),
+                                req.batch_size, req.skip_frames, req.render_mode)
+
+    for consumer in consumers:
+        consumer.backend = req.backend
+        consumer.trace = trace
+
+    if req.adaptive:
+        # One sampler for all analyses so they keep sharing decoded frames
+        base_stride = req.skip_frames + 1 if req.skip_frames is not None else 3
+        sampler = MotionSampler(base_stride=base_stride)
+        for consumer in consumers:
+            consumer.sampler = sampler
+
+    # name -> (output item, metrics)
+    results = {}
+    cache_keys = {}
+
+    if req.use_cache and consumers:
+        with tracing.span(trace, "read upload", bytes=os.path.getsize(input_path)):
+            video_digest = file_digest(input_path)
+        for consumer in consumers:
+            key = cache_key(video_digest, consumer.name, consumer.cache_params())
+            cache_keys[consumer.name] = key
+            hit = result_cache.get(key)
+            CACHE_REQUESTS.inc(cache="results", analysis=consumer.name, result="hit" if hit else "miss")
+            if hit is not None:
+                print(f"{consumer.name} for {req.filename} served from cache")
+                results[consumer.name] = hit
+        consumers = [c for c in consumers if c.name not in results]
+
+    for consumer in consumers:
+        print(f"Starting {consumer.name} for {req.filename}...")
+
+    outcome = {}
+    if consumers:
+        try:
+            with tracing.span(trace, "analyses", analyses=[c.name for c in consumers]):
+                outcome = scheduler.run(input_path, consumers, progress, req.segments)
+        except ValueError as e:
+            # Video could not be opened at all
+            print(f"Error opening video file: {input_path}")
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # name -> (output item, metrics, artifact files) for the analyses just run
+    collected = {}
+
+    def annotated_output(name, path):
+        # Output item for an annotated video, or for its overlay sidecar
+        item = {"name": name, "url": f"/backend/outputs/{os.path.basename(path)}"}
+        if path.endswith(OVERLAY_SUFFIX):
+            item["type"] = "overlay"
+            item["video_url"] = f"/backend/uploads/{req.filename}"
+        return item
+
     # 1. TRACKING
-    if "tracking" in req.analyses:
-        print(f"Starting tracking for {req.filename}...")
-        safe_name = clean_filename(f"tracked_{req.filename}")
-        tracked_path = os.path.join(OUTPUT_DIR, safe_name)
-        process_tracking(input_path, tracked_path)
+    if "tracking" in outcome:
+        tracked_path, error = outcome["tracking"]
+        if error is not None:
+            raise error
         print(f"Tracking completed: {tracked_path}")
-        outputs.append({
-            "name": "Player Tracking",
-            "url": f"/backend/outputs/{safe_name}"
-        })
+        if tracked_path:
+            collected["tracking"] = (annotated_output("Player Tracking", tracked_path), {}, [tracked_path])
+        else:
+            collected["tracking"] = ({
+                "name": "Player Tracking",
+                "url": f"/backend/outputs/{tracked_name}"
+            }, {}, None)
 
     # 2. HEATMAP
-    if "heatmap" in req.analyses:
-        print(f"Starting heatmap for {req.filename}...")
-        try:
-            out_abs_path = generate_heatmap(input_path)
-            out_filename = os.path.basename(out_abs_path)
-            outputs.append({
-                "name": "Heatmap",
-                "url": f"/backend/outputs/{out_filename}"
-            })
-            print(f"Heatmap completed: {out_filename}")
-        except Exception as e:
-            print(f"Heatmap error: {e}")
+    if "heatmap" in outcome:
+        result, error = outcome["heatmap"]
+        if error is None:
+            out_abs_path, layers = result
+            if out_abs_path is not None:
+                out_filename = os.path.basename(out_abs_path)
+                collected["heatmap"] = ({
+                    "name": "Heatmap",
+                    "url": f"/backend/outputs/{out_filename}",
+                    "layers": [
+                        {"track_id": track_id, "url": f"/backend/outputs/{os.path.basename(path)}"}
+                        for track_id, path in layers
+                    ]
+                }, {}, [out_abs_path] + [path for _, path in layers])
+                print(f"Heatmap completed: {out_filename}")
+        else:
+            print(f"Heatmap error: {error}")
 
     # 3. POSE
-    if "pose" in req.analyses:
-        print(f"Starting pose analysis for {req.filename}...")
+    if "pose" in outcome:
+        result, error = outcome["pose"]
         try:
-            out_abs_path, metrics = analyze_pose(input_path, OUTPUT_DIR)
+            if error is not None:
+                raise error
+            out_abs_path, metrics = result
             out_filename = os.path.basename(out_abs_path)
-            outputs.append({
-                "name": "Pose Analysis",
-                "url": f"/backend/outputs/{out_filename}"
-            })
-            aggregated_metrics.update(metrics)
+            collected["pose"] = (annotated_output("Pose Analysis", out_abs_path), metrics, [out_abs_path])
             print(f"Pose analysis completed: {out_filename}")
         except Exception as e:
             print(f"Pose error: {e}")
             
     # 4. SPEED
-    if "speed" in req.analyses:
-        print(f"Starting speed analysis for {req.filename}...")
-        try:
-            metrics = analyze_speed(input_path)
-            outputs.append({
+    if "speed" in outcome:
+        metrics, error = outcome["speed"]
+        if error is None:
+            collected["speed"] = ({
                 "name": "Player Speed Analysis",
                 "type": "speed_analysis",
                 "data": metrics,
                 "url": "#" 
-            })
-            aggregated_metrics.update(metrics)
+            }, metrics, [])
             print(f"Speed analysis completed.")
-        except Exception as e:
-            print(f"Speed error: {e}")
+        else:
+            print(f"Speed error: {error}")
             with open("speed_error.log", "w") as f:
-                f.write(str(e))
+                f.write(str(error))
                 import traceback
-                traceback.print_exc(file=f)
+                traceback.print_exception(error, file=f)
 
     # 5. SHOT ANALYSIS
-    if "shot_analysis" in req.analyses:
-        print(f"Starting cricket shot analysis for {req.filename}...")
-        try:
-            out_abs_path, metrics = analyze_cricket_shot(input_path, OUTPUT_DIR)
+    if "shot_analysis" in outcome:
+        result, error = outcome["shot_analysis"]
+        if error is None:
+            out_abs_path, metrics = result
             out_filename = os.path.basename(out_abs_path)
-            outputs.append({
-                "name": "Cricket Shot Analysis",
-                "url": f"/backend/outputs/{out_filename}"
-            })
-            aggregated_metrics.update(metrics)
+            collected["shot_analysis"] = (annotated_output("Cricket Shot Analysis", out_abs_path), metrics, [out_abs_path])
             print(f"Shot analysis completed: {out_filename}")
-        except Exception as e:
-            print(f"Shot analysis error: {e}")
+        else:
+            print(f"Shot analysis error: {error}")
             import traceback
-            traceback.print_exc()
+            traceback.print_exception(error)
+
+    with tracing.span(trace, "cache results"):
+        for name, (output, metrics, artifacts) in collected.items():
+            # artifacts is None when the analysis produced nothing worth keeping
+            if name in cache_keys and artifacts is not None:
+                output = result_cache.put(cache_keys[name], output, metrics, artifacts)
+            results[name] = (output, metrics)
+
+    outputs = []
+    aggregated_metrics = {}
+    for name in ANALYSIS_ORDER:
+        if name in results:
+            output, metrics = results[name]
+            outputs.append(output)
+            aggregated_metrics.update(metrics)
             
     return {"outputs": outputs, "aggregated_metrics": aggregated_metrics}
 
-def process_tracking(input_path, output_path):
-    cap = cv2.VideoCapture(input_path)
-    if not cap.isOpened():
+def process_tracking(input_path, output_path, batch_size=None, skip_frames=None):
+    try:
+        return run_single(input_path, TrackingConsumer(output_path, batch_size, skip_frames))
+    except ValueError:
         print(f"Error opening video file: {input_path}")
-        return
-
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    frame_count = 0
-    skip_frames = 2 # Process every 3rd frame
-    
-    # Adjust FPS for frame skipping so playback speed is correct
-    adjusted_fps = fps / (skip_frames + 1)
-    
-    # Try avc1 first, fallback to mp4v
-    fourcc = cv2.VideoWriter_fourcc(*"avc1")
-    out = cv2.VideoWriter(output_path, fourcc, adjusted_fps, (width, height))
-    
-    if not out.isOpened():
-        print("Warning: avc1 codec failed in process_tracking, falling back to mp4v")
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter(output_path, fourcc, adjusted_fps, (width, height))
-
-    if not out.isOpened():
-        print(f"Error: Could not initialize VideoWriter with avc1 or mp4v for {output_path}")
-        cap.release()
-        return
-    
-    frame_count = 0
-    skip_frames = 2 # Process every 3rd frame
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        frame_count += 1
-        if frame_count % (skip_frames + 1) != 0:
-            continue
-
-        if frame_count % 30 == 0:
-            print(f"Tracking processing frame {frame_count}/{total_frames} ({frame_count/total_frames*100:.1f}%)")
-            
-        results = model(frame, conf=0.4, verbose=False)
-        for r in results:
-            if r.boxes:
-                for box in r.boxes:
-                    cls = int(box.cls[0])
-                    if cls == 0: # person
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-        out.write(frame)
-    
-    print("Tracking processing finished.")
-    cap.release()
-    out.release()
+        return None
 
 @app.post("/analyze")
 async def analyze(video: UploadFile = File(...)):
     # Save uploaded video
-    input_path = os.path.join(UPLOAD_DIR, video.filename)
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(video.file, buffer)
+    name, _, _ = await run_in_threadpool(store_stream, video.file, video.filename, UPLOAD_DIR)
+    input_path = os.path.join(UPLOAD_DIR, name)
 
     # Run everything
     tracked_path = os.path.join(OUTPUT_DIR, "tracked.mp4")
     process_tracking(input_path, tracked_path)
     
     # Heatmap
-    heatmap_path = generate_heatmap(input_path)
-    
+    try:
+        heatmap_path = generate_heatmap(input_path, OUTPUT_DIR)
+    except ValueError as e:
+        # Video could not be opened at all
+        raise HTTPException(status_code=400, detail=str(e))
+    if heatmap_path is None:
+        raise HTTPException(status_code=422, detail="Video has no frames to build a heatmap from")
+
     return {
         "tracked_video": "/backend/outputs/tracked.mp4",
         "heatmap": f"/backend/outputs/{os.path.basename(heatmap_path)}"
@@ -240,7 +565,9 @@ async def analyze(video: UploadFile = File(...)):
 @app.post("/ai-coach")
 async def ai_coach(req: CoachingRequest):
     try:
-        feedback = get_coaching_feedback(req.metrics, req.question)
+        job = jobs.get(req.job_id) if req.job_id else None
+        with tracing.span(job.trace if job else None, "ai_coach", "ai_coach"):
+            feedback = get_coaching_feedback(req.metrics, req.question)
         return {"feedback": feedback}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Collect timers and counters for GET /metrics (0 = every hook returns at once)
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+
+_registry = []
+_context = threading.local()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """
+    One metric family: a value per combination of label values, rendered in
+    the Prometheus text format. Updates take a lock, so the hooks stay
+    cheap enough to call per frame.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key):
+        if not self.labels:
+            return ""
+        return "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)) + "}"
+
+    def samples(self):
+        """(suffix, label key, value) triples to render."""
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, value in self.samples():
+            lines.append(f"{self.name}{suffix}{self._label_text(key)} {value:g}")
+        return lines
+
+    def drain(self):
+        """Values recorded so far, reset to none (to ship them to another process)."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        """Adds values drained from another process."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """
+    Current value per label set. With a `callback` the values are read at
+    scrape time instead: callback() -> {label tuple: value}.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            return [("", tuple(str(v) for v in key), value) for key, value in self.callback().items()]
+        return super().samples()
+
+    def merge(self, values):
+        with self._lock:
+            self._values.update(values)
+
+
+class Summary(Metric):
+    """Count and sum of observations (e.g. seconds per call) per label set."""
+
+    type = "summary"
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            count, total = self._values.get(key, (0, 0.0))
+            self._values[key] = (count + 1, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return ([("_count", key, count) for key, (count, _) in items]
+                + [("_sum", key, total) for key, (_, total) in items])
+
+    def merge(self, values):
+        with self._lock:
+            for key, (count, total) in values.items():
+                c, t = self._values.get(key, (0, 0.0))
+                self._values[key] = (c + count, t + total)
+
+
+# ------------------ QUEUES ------------------
+
+_queues = {}  # queue name -> WeakSet of live queues with that name
+_queues_lock = threading.Lock()
+
+
+def watch_queue(name, q):
+    """Reports q.qsize() under `name` in pipeline_queue_depth for as long as q lives."""
+    if not METRICS_ENABLED:
+        return
+    with _queues_lock:
+        _queues.setdefault(name, weakref.WeakSet()).add(q)
+
+
+def _queue_depths():
+    with _queues_lock:
+        return {(name,): sum(q.qsize() for q in list(live)) for name, live in _queues.items() if len(live)}
+
+
+# ------------------ METRICS ------------------
+
+STAGE_SECONDS = Summary(
+    "analysis_stage_seconds",
+    "Time spent per pipeline stage (decode, inference, encode), in seconds. Decoding is shared by "
+    "the analyses of a run and labeled with all of them.",
+    ("analysis", "stage"),
+)
+FRAMES = Counter("analysis_frames_total", "Frames processed per analysis.", ("analysis",))
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Lookups in the result cache (per analysis run) and the detection store (per frame).",
+    ("cache", "analysis", "result"),
+)
+MODEL_LOAD_SECONDS = Gauge("model_load_seconds", "Time taken to load (and export) each model.", ("model", "backend"))
+QUEUE_DEPTH = Gauge("pipeline_queue_depth", "Items waiting in the decode and encode queues.", ("queue",),
+                    callback=_queue_depths)
+
+
+# ------------------ HOOKS ------------------
+
+def stage_done(stage, analysis, start):
+    """Records the time since `start` (a perf_counter value) for an analysis' stage."""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(time.perf_counter() - start, analysis=analysis, stage=stage)
+
+
+@contextmanager
+def analysis(name):
+    """Labels what this thread records inside the block (e.g. inference) with analysis `name`."""
+    previous = getattr(_context, "analysis", None)
+    _context.analysis = name
+    try:
+        yield
+    finally:
+        _context.analysis = previous
+
+
+def current_analysis():
+    return getattr(_context, "analysis", None) or "unknown"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def drain():
+    """Everything recorded in this process since the last drain, resetting it (picklable)."""
+    drained = {}
+    for metric in _registry:
+        if getattr(metric, "callback", None) is None:
+            values = metric.drain()
+            if values:
+                drained[metric.name] = values
+    return drained
+
+
+def merge(drained):
+    """Adds metrics drained in a worker process to this process' metrics."""
+    by_name = {metric.name: metric for metric in _registry}
+    for name, values in drained.items():
+        if name in by_name:
+            by_name[name].merge(values)
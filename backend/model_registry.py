@@ -0,0 +1,234 @@
+import copy
+import importlib.util
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from ultralytics import YOLO
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process export lock
+    fcntl = None
+
+# Weight files used by the analyses
+DETECTION_MODEL = "yolov8n.pt"
+POSE_MODEL = "yolov8n-pose.pt"
+
+# Warm-up can be switched off (e.g. for quick dev restarts) with MODEL_WARMUP=0
+WARMUP_ENABLED = os.getenv("MODEL_WARMUP", "1") != "0"
+
+# Runtime serving the weights: "torch" (PyTorch), or a CPU runtime the
+# weights are exported to once and cached next to them: "onnx" (ONNX
+# Runtime), "onnx-int8" (ONNX Runtime, weights quantized to 8 bits) or
+# "openvino". The default falls back to PyTorch if export or loading fails;
+# a backend asked for by name raises instead.
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# Input size the exported models are built for (dynamic batch and shape)
+EXPORT_IMGSZ = int(os.getenv("EXPORT_IMGSZ", "640"))
+
+_models = {}      # (weights, backend) -> shared YOLO instance
+_load_times = {}  # (weights, backend) -> seconds spent loading
+_lock = threading.Lock()
+
+
+# Packages each backend needs on top of requirements.txt (see requirements-cpu.txt)
+BACKEND_PACKAGES = {
+    "torch": (),
+    "onnx": ("onnx", "onnxruntime"),
+    "onnx-int8": ("onnx", "onnxruntime"),
+    "openvino": ("openvino",),
+}
+
+
+def missing_packages(backend):
+    """Packages `backend` needs that are not installed; without them it falls back to PyTorch."""
+    return [name for name in BACKEND_PACKAGES[backend] if importlib.util.find_spec(name) is None]
+
+
+def resolve_backend(backend=None, require=False):
+    """
+    The backend to use, INFERENCE_BACKEND if none is given. With `require`,
+    a backend whose runtime is not installed is a ValueError instead of a
+    silent fallback to PyTorch.
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+    missing = missing_packages(backend) if require else []
+    if missing:
+        raise ValueError(f"Inference backend {backend!r} is not available: {', '.join(missing)} not installed "
+                         f"(pip install -r backend/requirements-cpu.txt)")
+    return backend
+
+
+def serving_backend(weights, backend=None):
+    """
+    The runtime that actually serves `weights`: a backend asked for by name
+    never falls back, the INFERENCE_BACKEND default may have fallen back to
+    PyTorch (which takes loading the model to know).
+    """
+    if backend is not None or INFERENCE_BACKEND == "torch":
+        return resolve_backend(backend)
+    return get_model(weights).backend
+
+
+def exported_path(weights, backend):
+    """Where ultralytics writes `weights` exported for `backend`."""
+    base = os.path.splitext(weights)[0]
+    return {"onnx": base + ".onnx", "onnx-int8": base + ".int8.onnx", "openvino": base + "_openvino_model"}[backend]
+
+
+@contextmanager
+def _export_lock(path):
+    # Worker processes may load the same weights at once; export only once
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def quantize_onnx(source, path):
+    """
+    Writes an INT8 copy of the ONNX model `source` to `path`: weights are
+    stored as 8-bit integers, activations quantized on the fly per batch
+    (dynamic quantization, so no calibration images are needed).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # Unsigned weights: ONNX Runtime's CPU ConvInteger kernel only takes uint8
+    quantize_dynamic(source, path, weight_type=QuantType.QUInt8)
+    return path
+
+
+def export_model(model, backend):
+    """
+    Path of the PyTorch `model` exported for `backend`. The export is cached
+    next to the weights and redone when the weights are newer.
+    """
+    weights = model.ckpt_path
+    path = exported_path(weights, backend)
+    # The quantized model is made from the float ONNX export
+    source = export_model(model, "onnx") if backend == "onnx-int8" else weights
+    with _export_lock(path):
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+            return path
+        start = time.perf_counter()
+        if backend == "onnx-int8":
+            exported = quantize_onnx(source, path)
+        else:
+            exported = model.export(format=backend, dynamic=True, imgsz=EXPORT_IMGSZ)
+        print(f"Exported {weights} for {backend} in {time.perf_counter() - start:.2f}s")
+        return exported
+
+
+def _load(weights, backend, strict=False):
+    # model.backend records the runtime really serving the weights
+    model = YOLO(weights)
+    model.backend = "torch"
+    if backend == "torch":
+        return model
+    try:
+        exported = YOLO(export_model(model, backend), task=model.task)
+    except Exception as e:
+        if strict:
+            raise ValueError(f"Inference backend {backend!r} is not available for {weights}: {e}") from e
+        print(f"Warning: {backend} backend unavailable for {weights} ({e}), using PyTorch")
+        return model
+    exported.backend = backend
+    return exported
+
+
+def get_model(weights, backend=None):
+    """
+    Returns the process-wide YOLO instance for `weights` on `backend`
+    (default INFERENCE_BACKEND), loading (and exporting) it on first use.
+    Only the default may fall back to PyTorch (see model.backend); a backend
+    asked for by name that can't be exported or loaded is a ValueError.
+    The returned object is shared: use acquire() for anything that runs inference.
+    """
+    key = (weights, resolve_backend(backend))
+    strict = backend is not None
+    model = _models.get(key)
+    if model is not None and (model.backend == key[1] or not strict):
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        # A fallback cached for the default is no answer to a request by name
+        if model is None or (strict and model.backend != key[1]):
+            start = time.perf_counter()
+            model = _load(*key, strict=strict)
+            _load_times[key] = time.perf_counter() - start
+            _models[key] = model
+            metrics.MODEL_LOAD_SECONDS.set(_load_times[key], model=weights, backend=model.backend)
+            print(f"Loaded {weights} ({model.backend}) in {_load_times[key]:.2f}s")
+    return model
+
+
+def acquire(weights, backend=None):
+    """
+    Returns a per-request predictor handle for `weights`.
+
+    The handle shares the loaded network with every other handle but has its
+    own predictor and callbacks, so per-run state (tracker IDs from
+    `track(persist=True)`, the last batch) never leaks between requests.
+    Analyses track through their own TrackerSession on top of that.
+    """
+    base = get_model(weights, backend)
+    with _lock:
+        if base.predictor is None:
+            # Predictor setup fuses the shared network in place: do it once
+            # here instead of in each handle's first call, where concurrent
+            # jobs would fuse the same layers at the same time
+            base(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+        handle = copy.copy(base)
+        # track() registers tracker callbacks on the model; keep them per handle
+        handle.callbacks = {event: list(funcs) for event, funcs in base.callbacks.items()}
+        handle.predictor = _fork_predictor(base.predictor, handle.callbacks)
+    return handle
+
+
+def _fork_predictor(predictor, callbacks):
+    """
+    Copies an already set-up (warmed) predictor so the handle skips the model
+    setup and warm-up pass, while resetting everything that is per run.
+    """
+    if predictor is None:
+        return None
+
+    forked = copy.copy(predictor)
+    forked.callbacks = callbacks
+    forked._lock = threading.Lock()
+    forked.vid_writer = {}
+    forked.batch = None
+    forked.results = None
+    forked.dataset = None
+    if hasattr(forked, "trackers"):
+        del forked.trackers
+    return forked
+
+
+def warm_up(weights_list=(DETECTION_MODEL, POSE_MODEL), imgsz=640):
+    """
+    Loads the given weights and runs one dummy inference on each, so the
+    first real request doesn't pay for model setup and the first forward pass.
+    """
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for weights in weights_list:
+        model = get_model(weights)
+        start = time.perf_counter()
+        with _lock:
+            model(dummy, verbose=False)
+        print(f"Warmed up {weights} in {time.perf_counter() - start:.2f}s")
+
@@ -0,0 +1,83 @@
+import json
+
+# How an analysis delivers its annotations: an encoded video, or a JSON
+# sidecar the frontend draws over the original upload
+RENDER_MODES = ("video", "overlay")
+OVERLAY_SUFFIX = ".overlay.json"
+OVERLAY_VERSION = 1
+
+
+def overlay_path(video_path):
+    """Sidecar path next to where the annotated video would have gone."""
+    base = video_path.rsplit(".", 1)[0] if "." in video_path.rsplit("/", 1)[-1] else video_path
+    return base + OVERLAY_SUFFIX
+
+
+def boxes_of(r, persons_only=False):
+    """Boxes of a result as [x1, y1, x2, y2] int lists, plus track ids (or None)."""
+    if r.boxes is None or len(r.boxes) == 0:
+        return [], None
+    xyxy = r.boxes.xyxy.cpu().numpy().round().astype(int)
+    keep = slice(None)
+    if persons_only:
+        keep = r.boxes.cls.cpu().numpy().astype(int) == 0
+    ids = None
+    if r.boxes.id is not None:
+        ids = r.boxes.id.cpu().numpy().astype(int)[keep].tolist()
+    return xyxy[keep].tolist(), ids
+
+
+def keypoints_of(r):
+    """Keypoints of a result as one flat [x0, y0, x1, y1, ...] int list per person."""
+    if r.keypoints is None or len(r.keypoints.xy) == 0:
+        return []
+    xy = r.keypoints.xy.cpu().numpy().round().astype(int)
+    return xy.reshape(len(xy), -1).tolist()
+
+
+class OverlayWriter:
+    """
+    Per-frame annotations (boxes, keypoints, labels, angles) of one analysis,
+    written as a compact JSON sidecar instead of re-encoding the video.
+
+    Frames are keyed by `f`, the 1-based frame number in the source video;
+    the player shows frame f at (f - 1) / fps seconds.
+    """
+
+    def __init__(self, path, analysis, meta):
+        self.path = path
+        self.header = {
+            "version": OVERLAY_VERSION,
+            "analysis": analysis,
+            "width": meta.width,
+            "height": meta.height,
+            "fps": meta.fps,
+            "total_frames": meta.total_frames,
+        }
+        self.frames = []
+
+    def add(self, frame_count, **fields):
+        entry = {"f": frame_count}
+        entry.update((k, v) for k, v in fields.items() if v is not None and v != [])
+        self.frames.append(entry)
+
+    def part(self):
+        """Segment mode: the frames so far, for join_overlays()."""
+        return {"header": self.header, "frames": self.frames}
+
+    def close(self):
+        """Writes the sidecar and returns its path."""
+        with open(self.path, "w") as f:
+            json.dump(dict(self.header, frames=self.frames), f, separators=(",", ":"))
+        return self.path
+
+
+def join_overlays(path, parts):
+    """
+    Writes the sidecar of a video processed in segments from the segments'
+    {"header", "frames"} parts, in order. Returns its path.
+    """
+    frames = [frame for part in parts for frame in part["frames"]]
+    with open(path, "w") as f:
+        json.dump(dict(parts[0]["header"], frames=frames), f, separators=(",", ":"))
+    return path
@@ -0,0 +1,133 @@
+import os
+import queue
+import threading
+
+from . import metrics
+
+# Run decoding and encoding on their own threads, overlapping with inference
+PIPELINE_ENABLED = os.getenv("FRAME_PIPELINE", "1") != "0"
+# Frames that may wait between two stages; a full queue blocks the producer
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+_END = object()
+
+
+class Prefetcher:
+    """
+    Runs an iterator on a background thread and hands its items over through
+    a bounded queue, so producing item N+1 overlaps with consuming item N.
+
+    Iterating re-raises an error from the producer. close() stops the
+    producer (it may be blocked on a full queue) and waits for it.
+    """
+
+    def __init__(self, iterable, maxsize=PIPELINE_QUEUE_SIZE, name="prefetch"):
+        self._iterable = iterable
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        metrics.watch_queue(name, self._queue)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Backpressure: wait for room, but give up once we're told to stop
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        iterator = iter(self._iterable)
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    break
+        except Exception as e:
+            self._error = e
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self._stop.set()
+        # Unblock a producer waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+
+class FrameEncoder:
+    """
+    Runs a consumer's drawing and VideoWriter.write calls on a dedicated
+    thread, in submission order, while the consumer moves on to the next
+    batch. With the pipeline disabled, tasks run inline.
+
+    A failing task stops all later ones; the error is re-raised by the next
+    submit() or by close().
+    """
+
+    def __init__(self, name="encoder", maxsize=PIPELINE_QUEUE_SIZE, threaded=PIPELINE_ENABLED):
+        self.error = None
+        self._discard = False
+        self._thread = None
+        if threaded:
+            self._queue = queue.Queue(maxsize=max(1, maxsize))
+            metrics.watch_queue(name, self._queue)
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            if self.error is not None or self._discard:
+                continue
+            fn, args = task
+            try:
+                fn(*args)
+            except Exception as e:
+                self.error = e
+
+    def submit(self, fn, *args):
+        if self.error is not None:
+            raise self.error
+        if self._thread is None:
+            fn(*args)
+        else:
+            # Blocks while the queue is full
+            self._queue.put((fn, args))
+
+    def close(self):
+        """Waits for all submitted tasks; re-raises the first failure."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """Drops pending tasks and stops the thread."""
+        self._discard = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
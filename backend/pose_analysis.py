@@ -1,133 +1,221 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import os
+from .frame_source import BatchedConsumer, run_single
+from .pipeline import FrameEncoder
+from .overlay import OverlayWriter, overlay_path, boxes_of, keypoints_of, join_overlays
+from .segments import concat_videos, stitch_track_ids
+from .angle_utils import joint_angles
+from .model_registry import POSE_MODEL
+from .inference_store import StoredInference
 
-# Load model once if possible, or inside function to avoid global state issues if reloaded
-# For now, loading at module level is fine for this simple app
-model = YOLO("yolov8n-pose.pt")
-
-def analyze_pose(video_path, output_dir):
+def analyze_pose(video_path, output_dir, batch_size=None, skip_frames=None, render_mode="video"):
     """
     Analyzes the video for bowling action correctness.
     Returns the path to the annotated output video.
     """
-    
-    # Ensure output filename is unique or specific
-    import re
-    filename = os.path.basename(video_path)
-    base, ext = os.path.splitext(filename)
-    # Sanitize base name
-    clean_base = re.sub(r'[^a-zA-Z0-9_\-]', '_', base)
-    # Adding timestamp to ensure unique filename for browser cache busting
-    import time
-    timestamp = int(time.time())
-    output_filename = f"pose_{clean_base}_{timestamp}.webm"
-    output_path = os.path.join(output_dir, output_filename)
-    
-    cap = cv2.VideoCapture(video_path)
-    
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    
+    return run_single(video_path, PoseConsumer(video_path, output_dir, batch_size, skip_frames, render_mode))
+
+
+# Right arm keypoints (COCO format): shoulder 6, elbow 8, wrist 10
+RIGHT_ELBOW = (6, 8, 10)
+
+
+def extract_elbow_angles(results):
+    """
+    Right elbow angle of every tracked person in every result, computed for
+    the whole batch in one vectorized pass.
+    Returns, per result, a list of (track_id, angle, (elbow_x, elbow_y)).
+    """
+    per_frame = [[] for _ in results]
+    kpts_list, ids_list, owners = [], [], []
+
+    for i, r in enumerate(results):
+        if r.keypoints is None or r.boxes.id is None:
+            continue
+        # Check if we have valid keypoints data (COCO has 17)
+        if not hasattr(r.keypoints, 'xy') or len(r.keypoints.xy) == 0 or r.keypoints.xy.shape[1] <= 10:
+            continue
+        n = min(len(r.keypoints.xy), len(r.boxes.id))
+        kpts_list.append(r.keypoints.xy[:n].cpu().numpy())
+        ids_list.append(r.boxes.id[:n].cpu().numpy().astype(int))
+        owners.append(np.full(n, i))
+
+    if not kpts_list:
+        return per_frame
+
+    # (persons across the batch, 17, 2)
+    kpts = np.concatenate(kpts_list)
+    track_ids = np.concatenate(ids_list)
+    owner = np.concatenate(owners)
+
+    # Skip people whose arm points are zero (sometimes simpler models return 0)
+    valid = ~(kpts[:, list(RIGHT_ELBOW)].sum(axis=-1) == 0).any(axis=-1)
+    angles = joint_angles(kpts[valid], [RIGHT_ELBOW], zero_degenerate=True)[:, 0]
+    elbows = kpts[valid, RIGHT_ELBOW[1]]
+
+    for frame_idx, track_id, ang, elbow in zip(owner[valid], track_ids[valid], angles, elbows):
+        per_frame[frame_idx].append((int(track_id), float(ang), (int(elbow[0]), int(elbow[1]))))
+    return per_frame
+
+
+def elbow_metrics(angles):
+    """Pose metrics from the last elbow angle of each player."""
+    avg_elbow_angle = np.mean(list(angles.values())) if angles else 0.0
+    return {"elbow_angle": round(float(avg_elbow_angle), 2)}
+
+
+class PoseConsumer(BatchedConsumer):
+    """
+    Frame consumer for the bowling-action pose analysis.
+    With render_mode "overlay" the skeletons go to a JSON sidecar instead.
+    Result: (output_path, {"elbow_angle": ...})
+    """
+
+    name = "pose"
+
     # Skip frames control
     skip_frames = 2 # Process every 3rd frame
-    adjusted_fps = fps / (skip_frames + 1)
-
-    # Try vp80 first, fallback to mp4v
-    fourcc = cv2.VideoWriter_fourcc(*"vp80")
-    out = cv2.VideoWriter(output_path, fourcc, adjusted_fps, (w, h))
-    
-    if not out.isOpened():
-        print("Warning: vp80 codec failed in analyze_pose, falling back to mp4v")
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter(output_path, fourcc, adjusted_fps, (w, h))
-
-    if not out.isOpened():
-        print(f"Error: Could not initialize VideoWriter for {output_path}")
-        cap.release()
-        return None, {}
-    
-    # store previous elbow angle per player
-    prev_angles = {}
-    
-    def calculate_angle(a, b, c):
-        """ Calculate angle at point b """
-        ba = np.array(a) - np.array(b)
-        bc = np.array(c) - np.array(b)
+    stride = skip_frames + 1
+    weights = POSE_MODEL
+    conf = 0.4
+
+    def __init__(self, video_path, output_dir, batch_size=None, skip_frames=None, render_mode="video"):
+        super().__init__(batch_size, skip_frames)
+        self.render_mode = render_mode
         
-        norm_ba = np.linalg.norm(ba)
-        norm_bc = np.linalg.norm(bc)
+        # Ensure output filename is unique or specific
+        import re
+        filename = os.path.basename(video_path)
+        base, ext = os.path.splitext(filename)
+        # Sanitize base name
+        clean_base = re.sub(r'[^a-zA-Z0-9_\-]', '_', base)
+        # Adding timestamp to ensure unique filename for browser cache busting
+        import time
+        timestamp = int(time.time())
+        output_filename = f"pose_{clean_base}_{timestamp}.webm"
+        self.output_path = os.path.join(output_dir, output_filename)
+        if render_mode == "overlay":
+            self.output_path = overlay_path(self.output_path)
         
-        if norm_ba == 0 or norm_bc == 0:
-            return 0.0
-            
-        cos_angle = np.dot(ba, bc) / (norm_ba * norm_bc)
-        return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
-    
-    frame_count = 0
-    # skip_frames moved up to VideoWriter initialization
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        frame_count += 1
-        if frame_count % (skip_frames + 1) != 0:
-            continue
-            
+        self.out = None
+        self.overlay = None
+        self.encoder = None
+        self.model = None
+        # store previous elbow angle per player
+        self.prev_angles = {}
+
+    def start(self, meta):
+        if self.render_mode == "overlay":
+            self.overlay = OverlayWriter(self.output_path, self.name, meta)
+            self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+            return
+
+        adjusted_fps = meta.fps / (self.skip_frames + 1)
+        size = (meta.width, meta.height)
+
+        # Try vp80 first, fallback to mp4v
+        fourcc = cv2.VideoWriter_fourcc(*"vp80")
+        out = cv2.VideoWriter(self.output_path, fourcc, adjusted_fps, size)
+        
+        if not out.isOpened():
+            print("Warning: vp80 codec failed in analyze_pose, falling back to mp4v")
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            out = cv2.VideoWriter(self.output_path, fourcc, adjusted_fps, size)
+
+        if not out.isOpened():
+            print(f"Error: Could not initialize VideoWriter for {self.output_path}")
+            self.active = False
+            return
+
+        self.out = out
+        self.encoder = FrameEncoder(name="pose-encoder")
+        # Own tracker per run so track IDs don't carry over between videos
+        self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+
+    def infer(self, frames):
+        results = self.model.track(frames, self.batch_counts, conf=self.conf)
+        return list(zip(results, extract_elbow_angles(results)))
+
+    def set_segment(self, segment):
+        super().set_segment(segment)
+        if self.render_mode == "video":
+            self.output_path = segment.output_path(self.output_path)
+
+    def handle(self, frame_count, frame, item):
         if frame_count % 30 == 0:
             print(f"Pose analysis processing frame {frame_count}...")
-            
-        results = model.track(frame, persist=True, conf=0.4, verbose=False)
-        if not results:
-             out.write(frame)
-             continue
-             
-        r = results[0]
-        
-        if r.keypoints is not None and r.boxes.id is not None:
-            # Check if we have valid keypoints data
-            if hasattr(r.keypoints, 'xy') and len(r.keypoints.xy) > 0:
-                for i, kpts in enumerate(r.keypoints.xy):
-                    if i >= len(r.boxes.id):
-                        break
-                        
-                    track_id = int(r.boxes.id[i])
-                    
-                    # Ensure we have enough keypoints (COCO has 17)
-                    if len(kpts) > 10:
-                        # Right arm keypoints (COCO format): shoulder 6, elbow 8, wrist 10
-                        shoulder = kpts[6]
-                        elbow = kpts[8]
-                        wrist = kpts[10]
-                        
-                        # Check confidence or if points are zero (sometimes simpler models return 0)
-                        if not (torch_is_zero(shoulder) or torch_is_zero(elbow) or torch_is_zero(wrist)):
-                            ang = calculate_angle(shoulder.cpu().numpy(), elbow.cpu().numpy(), wrist.cpu().numpy())
-                            
-                            # Removed "POSSIBLE CHUCK" logic as requested
-                            
-                            prev_angles[track_id] = ang
-                            
-                            ex, ey = int(elbow[0]), int(elbow[1])
-                            cv2.circle(frame, (ex, ey), 5, (0, 255, 255), -1)
+        if self.warming_up(frame_count):
+            return
+
+        r, elbow_angles = item
+        for track_id, ang, _ in elbow_angles:
+            # Removed "POSSIBLE CHUCK" logic as requested
+            self.prev_angles[track_id] = ang
+
+        if self.overlay is not None:
+            boxes, ids = boxes_of(r)
+            self.overlay.add(
+                frame_count, boxes=boxes, ids=ids, keypoints=keypoints_of(r),
+                elbows=[[ex, ey, round(ang, 1)] for _, ang, (ex, ey) in elbow_angles],
+            )
+            return
+        # Drawing and encoding run on the encoder thread
+        self.encoder.submit(self.render, frame_count, frame, r, elbow_angles)
+
+    def render(self, frame_count, frame, r, elbow_angles):
+        for _, _, (ex, ey) in elbow_angles:
+            cv2.circle(frame, (ex, ey), 5, (0, 255, 255), -1)
 
         annotated = r.plot()
-        out.write(annotated)
+        self.write_frame(self.out, frame_count, annotated)
+
+    def cache_params(self):
+        params = super().cache_params()
+        params["render_mode"] = self.render_mode
+        return params
+
+    def finish(self):
+        if self.overlay is not None:
+            self.overlay.close()
+        elif self.out is None:
+            return None, {}
+        else:
+            try:
+                self.encoder.close()
+            finally:
+                self.out.release()
         
-    cap.release()
-    out.release()
-    
-    avg_elbow_angle = np.mean(list(prev_angles.values())) if prev_angles else 0.0
-    
-    return output_path, {"elbow_angle": round(float(avg_elbow_angle), 2)}
-
-def torch_is_zero(t):
-    # tensor check helper if inputs are tensors
-    if hasattr(t, 'sum'):
-        return t.sum() == 0
-    # numpy / list check
-    return np.sum(t) == 0
+        return self.output_path, elbow_metrics(self.prev_angles)
+
+    def finish_segment(self):
+        part = {"angles": self.prev_angles, "segment": self.segment.summary()}
+        if self.overlay is not None:
+            part.update(self.overlay.part())
+        else:
+            part["path"] = self.finish()[0]
+        return part
+
+    def merge_segments(self, parts):
+        # Last angle per player across the video, players matched over segment boundaries
+        angles = {}
+        id_maps = stitch_track_ids([part["segment"] for part in parts])
+        for part, id_map in zip(parts, id_maps):
+            for track_id, ang in part["angles"].items():
+                angles[id_map(track_id)] = ang
+            for frame in part.get("frames", []):
+                if "ids" in frame:
+                    frame["ids"] = id_map.map(frame["ids"]).tolist()
+
+        if self.render_mode == "overlay":
+            path = join_overlays(self.output_path, parts)
+        else:
+            path = concat_videos([part["path"] for part in parts], self.output_path)
+            if path is None:
+                return None, {}
+        return path, elbow_metrics(angles)
+
+    def abort(self):
+        if self.out is not None:
+            self.encoder.abort()
+            self.out.release()
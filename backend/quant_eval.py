@@ -0,0 +1,269 @@
+"""
+Accuracy-vs-speed check of a quantized (or any other) inference backend
+against the float reference.
+
+Runs the pose, speed and shot analyses over each reference clip once per
+backend and reports, per clip:
+  - latency per frame of the detection and pose models (one frame per call)
+  - drift in elbow_angle, average_speed and max_speed, and shot_type agreement
+  - box and keypoint deviation of the raw model outputs on sampled frames
+
+Usage:
+    python -m backend.quant_eval clip1.mp4 clip2.mp4 --candidate onnx-int8 --json report.json
+
+Exits with status 1 if any clip drifts beyond the tolerances.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from .frame_source import FrameSource
+from .inference_store import STORE_CONF
+from .model_registry import acquire, get_model, resolve_backend, DETECTION_MODEL, POSE_MODEL
+from .pose_analysis import PoseConsumer
+from .segments import box_iou
+from .shot_analysis import ShotConsumer
+from .speed_analysis import SpeedConsumer
+
+# Default tolerances: how far a metric may move before the candidate fails
+ELBOW_TOLERANCE = 2.0   # degrees
+SPEED_TOLERANCE = 0.1   # m/s, for average_speed and max_speed
+# Minimum IoU for a candidate box to count as the same detection as a reference box
+MATCH_IOU = 0.5
+# Keypoints compared only where both models are at least this confident
+KEYPOINT_CONF = 0.5
+
+
+def sample_frames(video_path, count):
+    """`count` frames spread evenly over the video."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for index in np.linspace(0, max(total - 1, 0), count).round().astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_metrics(video_path, backend, output_dir):
+    """elbow_angle, average_speed, max_speed and shot_type of the clip on `backend`."""
+    consumers = [
+        PoseConsumer(video_path, output_dir, render_mode="overlay"),
+        SpeedConsumer(),
+        ShotConsumer(video_path, output_dir, render_mode="overlay"),
+    ]
+    for consumer in consumers:
+        consumer.backend = backend
+    outcome = FrameSource(video_path).run(consumers)
+
+    metrics = {}
+    for name, (result, error) in outcome.items():
+        if error is not None:
+            raise RuntimeError(f"{name} failed on {backend}: {error}")
+        metrics.update(result[1] if isinstance(result, tuple) else result)
+    return {key: metrics.get(key) for key in ("elbow_angle", "average_speed", "max_speed", "shot_type")}
+
+
+def measure_outputs(weights, backend, frames):
+    """
+    Runs `weights` on `backend` over the frames one at a time.
+    Returns (milliseconds per frame, results); the first call is a warm-up
+    and not timed.
+    """
+    model = acquire(weights, backend)
+    model(frames[0], conf=STORE_CONF, verbose=False)
+    results = []
+    elapsed = 0.0
+    for frame in frames:
+        start = time.perf_counter()
+        results.append(model(frame, conf=STORE_CONF, verbose=False)[0])
+        elapsed += time.perf_counter() - start
+    return elapsed / len(frames) * 1000, results
+
+
+def match_boxes(ref_boxes, cand_boxes, iou=MATCH_IOU):
+    """Greedy one-to-one matching by IoU; returns (ref index, cand index, iou) triples."""
+    if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+        return []
+    overlap = box_iou(ref_boxes, cand_boxes)
+    pairs = []
+    used_ref, used_cand = set(), set()
+    for i, j in zip(*np.unravel_index(np.argsort(-overlap, axis=None), overlap.shape)):
+        if overlap[i, j] < iou:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        pairs.append((int(i), int(j), float(overlap[i, j])))
+        used_ref.add(i)
+        used_cand.add(j)
+    return pairs
+
+
+def output_deviation(ref_results, cand_results):
+    """
+    How far the candidate's raw detections are from the reference's:
+    share of reference boxes found again, their mean IoU and corner
+    deviation (px), boxes only one side found, and the mean distance (px)
+    of keypoints both sides are confident about.
+    """
+    ref_count = cand_count = 0
+    ious, corner_px, keypoint_px = [], [], []
+    for ref, cand in zip(ref_results, cand_results):
+        ref_boxes = ref.boxes.xyxy.cpu().numpy()
+        cand_boxes = cand.boxes.xyxy.cpu().numpy()
+        ref_count += len(ref_boxes)
+        cand_count += len(cand_boxes)
+        for i, j, iou in match_boxes(ref_boxes, cand_boxes):
+            ious.append(iou)
+            corner_px.append(float(np.abs(ref_boxes[i] - cand_boxes[j]).mean()))
+            if ref.keypoints is not None and cand.keypoints is not None:
+                a = ref.keypoints.data[i].cpu().numpy()
+                b = cand.keypoints.data[j].cpu().numpy()
+                both = (a[:, 2] >= KEYPOINT_CONF) & (b[:, 2] >= KEYPOINT_CONF)
+                keypoint_px.extend(np.hypot(*(a[both, :2] - b[both, :2]).T).tolist())
+
+    matched = len(ious)
+    return {
+        "reference_boxes": ref_count,
+        "candidate_boxes": cand_count,
+        "recall": round(matched / ref_count, 4) if ref_count else None,
+        "unmatched": ref_count + cand_count - 2 * matched,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+        "box_deviation_px": round(float(np.mean(corner_px)), 2) if corner_px else None,
+        "keypoint_deviation_px": round(float(np.mean(keypoint_px)), 2) if keypoint_px else None,
+    }
+
+
+def metric_drift(ref, cand):
+    drift = {}
+    for key in ("elbow_angle", "average_speed", "max_speed"):
+        if ref[key] is not None and cand[key] is not None:
+            drift[key] = round(abs(cand[key] - ref[key]), 2)
+        else:
+            drift[key] = None
+    drift["shot_type_agrees"] = ref["shot_type"] == cand["shot_type"]
+    return drift
+
+
+def evaluate_clip(video_path, reference, candidate, frames=30,
+                  elbow_tolerance=ELBOW_TOLERANCE, speed_tolerance=SPEED_TOLERANCE):
+    report = {"clip": os.path.basename(video_path), "latency_ms": {}, "deviation": {}}
+
+    sampled = sample_frames(video_path, frames)
+    if not sampled:
+        raise ValueError(f"No frames could be read from {video_path}")
+    for weights in (DETECTION_MODEL, POSE_MODEL):
+        ref_ms, ref_results = measure_outputs(weights, reference, sampled)
+        cand_ms, cand_results = measure_outputs(weights, candidate, sampled)
+        report["latency_ms"][weights] = {
+            reference: round(ref_ms, 2),
+            candidate: round(cand_ms, 2),
+            "speedup": round(ref_ms / cand_ms, 2) if cand_ms else None,
+        }
+        report["deviation"][weights] = output_deviation(ref_results, cand_results)
+
+    with tempfile.TemporaryDirectory(prefix="quant_eval_") as output_dir:
+        report["metrics"] = {
+            reference: run_metrics(video_path, reference, output_dir),
+            candidate: run_metrics(video_path, candidate, output_dir),
+        }
+    drift = metric_drift(report["metrics"][reference], report["metrics"][candidate])
+    report["drift"] = drift
+    report["pass"] = (
+        (drift["elbow_angle"] or 0) <= elbow_tolerance
+        and (drift["average_speed"] or 0) <= speed_tolerance
+        and (drift["max_speed"] or 0) <= speed_tolerance
+        and drift["shot_type_agrees"]
+    )
+    return report
+
+
+def summarize(reports, reference, candidate):
+    """Totals over all clips: mean latencies and speedup, worst drifts, shot agreement."""
+    summary = {"clips": len(reports), "latency_ms": {}}
+    for weights in (DETECTION_MODEL, POSE_MODEL):
+        ref_ms = float(np.mean([r["latency_ms"][weights][reference] for r in reports]))
+        cand_ms = float(np.mean([r["latency_ms"][weights][candidate] for r in reports]))
+        summary["latency_ms"][weights] = {
+            reference: round(ref_ms, 2), candidate: round(cand_ms, 2),
+            "speedup": round(ref_ms / cand_ms, 2) if cand_ms else None,
+        }
+    for key in ("elbow_angle", "average_speed", "max_speed"):
+        values = [r["drift"][key] for r in reports if r["drift"][key] is not None]
+        summary[f"max_{key}_drift"] = max(values) if values else None
+    summary["shot_type_agreement"] = round(float(np.mean([r["drift"]["shot_type_agrees"] for r in reports])), 4)
+    summary["pass"] = all(r["pass"] for r in reports)
+    return summary
+
+
+def print_report(reports, summary, reference, candidate):
+    for report in reports:
+        print(f"\n{report['clip']}: {'PASS' if report['pass'] else 'FAIL'}")
+        for weights, latency in report["latency_ms"].items():
+            dev = report["deviation"][weights]
+            print(f"  {weights}: {latency[reference]} ms/frame ({reference}) vs "
+                  f"{latency[candidate]} ms/frame ({candidate}), x{latency['speedup']}; "
+                  f"recall {dev['recall']}, IoU {dev['mean_iou']}, "
+                  f"boxes off by {dev['box_deviation_px']} px, keypoints by {dev['keypoint_deviation_px']} px")
+        ref, cand = report["metrics"][reference], report["metrics"][candidate]
+        for key in ("elbow_angle", "average_speed", "max_speed", "shot_type"):
+            print(f"  {key}: {ref[key]} -> {cand[key]}")
+
+    print(f"\n{summary['clips']} clip(s), {candidate} vs {reference}: {'PASS' if summary['pass'] else 'FAIL'}")
+    for weights, latency in summary["latency_ms"].items():
+        print(f"  {weights}: x{latency['speedup']} ({latency[reference]} -> {latency[candidate]} ms/frame)")
+    print(f"  worst drift: elbow {summary['max_elbow_angle_drift']} deg, "
+          f"average speed {summary['max_average_speed_drift']} m/s, max speed {summary['max_max_speed_drift']} m/s; "
+          f"shot type agreement {summary['shot_type_agreement']:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare a (quantized) inference backend against the float models.")
+    parser.add_argument("clips", nargs="+", help="reference clips")
+    parser.add_argument("--reference", default="torch", help="float backend (default: torch)")
+    parser.add_argument("--candidate", default="onnx-int8", help="backend under test (default: onnx-int8)")
+    parser.add_argument("--frames", type=int, default=30, help="frames per clip for latency and output deviation")
+    parser.add_argument("--elbow-tolerance", type=float, default=ELBOW_TOLERANCE, help="max elbow_angle drift (degrees)")
+    parser.add_argument("--speed-tolerance", type=float, default=SPEED_TOLERANCE, help="max average/max speed drift (m/s)")
+    parser.add_argument("--json", help="also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    try:
+        # A fallback to PyTorch would compare the float model with itself: load
+        # both by name (which raises if an export fails) and label the report
+        # with the runtime each model really runs on
+        reference = resolve_backend(args.reference, require=True)
+        candidate = resolve_backend(args.candidate, require=True)
+        for weights in (DETECTION_MODEL, POSE_MODEL):
+            reference = get_model(weights, reference).backend
+            candidate = get_model(weights, candidate).backend
+    except ValueError as e:
+        parser.error(str(e))
+    if reference == candidate:
+        parser.error(f"Reference and candidate are both {reference}")
+    reports = [
+        evaluate_clip(clip, reference, candidate, args.frames, args.elbow_tolerance, args.speed_tolerance)
+        for clip in args.clips
+    ]
+    summary = summarize(reports, reference, candidate)
+    print_report(reports, summary, reference, candidate)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"reference": reference, "candidate": candidate, "summary": summary, "clips": reports}, f, indent=2)
+    return 0 if summary["pass"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+# Bump when an analysis changes in a way that invalidates stored results
+CACHE_VERSION = 1
+
+_digests = {}  # (path, size, mtime_ns) -> sha256 hex
+_digest_lock = threading.Lock()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    SHA-256 of a file's contents, read in chunks.
+    Memoized on (path, size, mtime) so repeated lookups don't re-read the file.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        digest = _digests.get(memo_key)
+    if digest is not None:
+        return digest
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digests[memo_key] = digest
+    return digest
+
+
+def remember_digest(path, digest):
+    """Records a digest computed elsewhere (e.g. while uploading) so file_digest() needn't re-read the file."""
+    st = os.stat(path)
+    with _digest_lock:
+        _digests[(os.path.abspath(path), st.st_size, st.st_mtime_ns)] = digest
+
+
+def cache_key(video_digest, analysis, params):
+    """Key for one analysis of one video with the given parameters."""
+    blob = json.dumps({
+        "version": CACHE_VERSION,
+        "video": video_digest,
+        "analysis": analysis,
+        "params": params,
+    }, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of analysis results.
+
+    An entry holds the output item returned to the client, the analysis metrics
+    and the artifact files it references. Artifacts are moved into `root` when
+    stored (so later runs can't overwrite them) and served from `url_prefix`.
+    Evicting an entry deletes its artifacts. The index is persisted to
+    `root/index.json` so the cache survives restarts.
+    """
+
+    def __init__(self, root, url_prefix, max_bytes):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._entries = self._load_index()
+
+    def get(self, key):
+        """Returns (output, metrics) for a cached result, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            # Artifacts deleted behind our back make the entry useless
+            if not all(os.path.exists(os.path.join(self.root, a)) for a in entry["artifacts"]):
+                self._drop(key)
+                self._save_index()
+                return None
+            entry["last_used"] = time.time()
+            self._save_index()
+            return entry["output"], entry["metrics"]
+
+    def put(self, key, output, metrics, artifact_paths=()):
+        """
+        Stores a result. Artifacts are moved into the cache and the output's
+        URL is rewritten to point at the cached copy.
+        Returns the output item to hand to the client.
+        """
+        output = dict(output)
+        with self._lock:
+            # Drop a previous entry first, its artifacts may share our names
+            if key in self._entries:
+                self._drop(key)
+
+        artifacts = []
+        renamed = {}
+        size = 0
+        for path in artifact_paths:
+            name = f"{key[:16]}_{os.path.basename(path)}"
+            dest = os.path.join(self.root, name)
+            shutil.move(path, dest)
+            artifacts.append(name)
+            renamed[os.path.basename(path)] = name
+            size += os.path.getsize(dest)
+        if artifacts:
+            output["url"] = f"{self.url_prefix}/{artifacts[0]}"
+        # Secondary artifacts (e.g. per-player heatmap layers) listed in "layers"
+        if "layers" in output:
+            output["layers"] = [
+                dict(layer, url=f"{self.url_prefix}/{renamed[os.path.basename(layer['url'])]}")
+                if os.path.basename(layer.get("url", "")) in renamed else layer
+                for layer in output["layers"]
+            ]
+
+        with self._lock:
+            self._entries[key] = {
+                "output": output,
+                "metrics": metrics,
+                "artifacts": artifacts,
+                "size": size,
+                "last_used": time.time(),
+            }
+            self._evict(keep=key)
+            self._save_index()
+        return output
+
+    def _evict(self, keep=None):
+        total = sum(e["size"] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries[key]["size"]
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        for name in entry["artifacts"]:
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self._index_path)
@@ -0,0 +1,295 @@
+import copy
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import metrics
+from .frame_source import FrameSource
+from .segments import plan_segments, overlap_frames, segment_count
+
+# Worker processes running analyses: 0 = run them in the job's own thread
+# (no pool), "auto" = one worker per WORKER_THREADS usable cores
+ANALYSIS_WORKERS = os.getenv("ANALYSIS_WORKERS", "0")
+# torch intra-op threads per worker (default: usable cores / workers, 4 with "auto")
+WORKER_THREADS = os.getenv("WORKER_THREADS")
+# OpenCV threads per worker; decoding and drawing are mostly single-threaded
+WORKER_CV2_THREADS = int(os.getenv("WORKER_CV2_THREADS", "1"))
+# Pin each worker to its own WORKER_THREADS cores (Linux only)
+WORKER_AFFINITY = os.getenv("WORKER_AFFINITY", "0") == "1"
+
+AUTO_THREADS = 4
+
+
+def usable_cores():
+    """Cores this process may run on (respects cgroup/taskset limits where the OS tells us)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pool_size(workers=ANALYSIS_WORKERS, threads=WORKER_THREADS, cores=None):
+    """
+    (worker processes, torch threads per worker) for this host.
+    0 workers means analyses run in-process.
+    """
+    cores = len(cores if cores is not None else usable_cores())
+    if str(workers).lower() == "auto":
+        threads = int(threads) if threads else AUTO_THREADS
+        return max(1, cores // threads), max(1, min(threads, cores))
+    workers = int(workers)
+    if workers <= 0:
+        return 0, 0
+    threads = int(threads) if threads else max(1, cores // workers)
+    return workers, threads
+
+
+def _init_worker(slot_counter, threads, cv2_threads, affinity):
+    """Runs once in every worker process: thread budgets and optional pinning."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed by an earlier parallel op in this process
+    cv2.setNumThreads(cv2_threads)
+
+    with slot_counter.get_lock():
+        slot = slot_counter.value
+        slot_counter.value += 1
+    if affinity and hasattr(os, "sched_setaffinity"):
+        cores = usable_cores()
+        start = (slot * threads) % len(cores)
+        mine = [cores[(start + i) % len(cores)] for i in range(min(threads, len(cores)))]
+        os.sched_setaffinity(0, mine)
+        print(f"Analysis worker {os.getpid()} on cores {mine} ({threads} threads)")
+    else:
+        print(f"Analysis worker {os.getpid()} started ({threads} threads)")
+
+    from .model_registry import warm_up, WARMUP_ENABLED
+    if WARMUP_ENABLED:
+        warm_up()
+
+
+def _run_group(video_path, consumers, progress_queue, key, start=1, end=None, ship_metrics=False):
+    """
+    Worker side: runs one group of consumers over the video (or a frame range of it).
+    Returns (outcome, metrics recorded in this worker since its last task,
+    trace events recorded by the consumers), the last two only if `ship_metrics`.
+    """
+
+    def progress(frames_decoded, total_frames, analyses):
+        progress_queue.put((key, frames_decoded, total_frames, analyses))
+
+    source = FrameSource(video_path, start, end)
+    outcome = source.run(consumers, progress if progress_queue is not None else None)
+    # Errors travel back pickled; keep the message of the ones that can't be
+    for name, (result, error) in outcome.items():
+        if error is not None:
+            try:
+                pickle.dumps(error)
+            except Exception:
+                outcome[name] = (None, RuntimeError(f"{type(error).__name__}: {error}"))
+    if not ship_metrics:
+        return outcome, {}, []
+    traces = {id(c.trace): c.trace for c in consumers if c.trace is not None}
+    return outcome, metrics.drain(), [trace.drain() for trace in traces.values()]
+
+
+def group_consumers(consumers):
+    """
+    Splits consumers into independently runnable groups, one per model.
+    Consumers of one model stay together so they keep sharing inference
+    through the detection store, and no two workers write one store.
+    """
+    groups = {}
+    for consumer in consumers:
+        groups.setdefault(consumer.weights, []).append(consumer)
+    return list(groups.values())
+
+
+class Scheduler:
+    """
+    Runs a job's analyses in a shared pool of worker processes.
+
+    Analyses on different models run as separate tasks, so one job can use
+    several workers, and the tasks of concurrent jobs queue in the same pool.
+    Each worker gets a fixed torch/OpenCV thread budget (and optionally its
+    own cores) instead of every library sizing its thread pool to the whole
+    machine. With no workers configured, run() is FrameSource.run().
+    """
+
+    def __init__(self, workers=ANALYSIS_WORKERS, threads=WORKER_THREADS,
+                 cv2_threads=WORKER_CV2_THREADS, affinity=WORKER_AFFINITY):
+        self.workers, self.threads = pool_size(workers, threads)
+        self.cv2_threads = cv2_threads
+        self.affinity = affinity
+        self._pool = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs torch and
+                # server threads is unsafe
+                ctx = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=ctx,
+                    initializer=_init_worker,
+                    initargs=(ctx.Value("i", 0), self.threads, self.cv2_threads, self.affinity),
+                )
+                self._manager = ctx.Manager()
+            return self._pool, self._manager
+
+    def run(self, video_path, consumers, progress=None, segments=None):
+        """
+        Same contract as FrameSource(video_path).run(consumers, progress).
+
+        `segments` splits the video into that many time slices, processed in
+        parallel and merged by each consumer's merge_segments(); None splits
+        long videos automatically (SEGMENT_SECONDS). Without a pool the
+        tasks run on threads of this process.
+        """
+        plan = [None]
+        if consumers and segments != 1:
+            cap, meta = FrameSource(video_path).open()
+            cap.release()
+            count = segment_count(segments, meta, self.workers)
+            if count > 1:
+                plan = plan_segments(meta.total_frames, count, overlap_frames(meta))
+                print(f"Splitting {os.path.basename(video_path)} into {plan}")
+
+        if plan == [None] and not self.enabled:
+            return FrameSource(video_path).run(consumers, progress)
+
+        # One task per (model group, segment); every consumer of a segment
+        # task is a copy with its own Segment to log track boundaries in
+        tasks = []
+        for g, group in enumerate(group_consumers(consumers)):
+            for segment in plan:
+                if segment is None:
+                    tasks.append(((g, 0), group, 1, None))
+                    continue
+                part = copy.deepcopy(group)
+                for consumer in part:
+                    consumer.set_segment(copy.deepcopy(segment))
+                tasks.append(((g, segment.index), part, segment.start, segment.end))
+
+        if self.enabled:
+            pool, manager = self._get_pool()
+            progress_queue = manager.Queue() if progress else None
+        else:
+            pool = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="segment")
+            progress_queue = queue.Queue() if progress else None
+
+        relay = None
+        if progress:
+            groups = {key[0] for key, _, _, _ in tasks}
+            # Frames each group decodes, overlaps included (None: whole video, as reported)
+            span = sum(s.end - s.start + 1 for s in plan) if plan != [None] else None
+            relay = threading.Thread(target=self._relay, args=(progress_queue, len(groups), progress, span),
+                                     name="scheduler-progress", daemon=True)
+            relay.start()
+
+        results = []
+        try:
+            # Worker processes send their metrics and trace spans back with each result
+            trace = next((c.trace for c in consumers if c.trace is not None), None)
+            futures = [pool.submit(_run_group, video_path, part, progress_queue, key, start, end, self.enabled)
+                       for key, part, start, end in tasks]
+            for future in futures:
+                outcome, recorded, spans = future.result()
+                metrics.merge(recorded)
+                if trace is not None:
+                    for drained in spans:
+                        trace.merge(drained)
+                results.append(outcome)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            self._reset()
+            raise
+        finally:
+            if not self.enabled:
+                pool.shutdown(wait=False, cancel_futures=True)
+            if relay is not None:
+                progress_queue.put(None)
+                relay.join()
+
+        if plan == [None]:
+            outcome = {}
+            for result in results:
+                outcome.update(result)
+            return outcome
+        return self._merge(consumers, tasks, results)
+
+    def _merge(self, consumers, tasks, results):
+        """Combines the segments' parts into each consumer's whole-video result."""
+        parts = {}
+        for (key, _, _, _), result in zip(tasks, results):
+            for name, item in result.items():
+                parts.setdefault(name, []).append((key[1], item))
+
+        outcome = {}
+        for consumer in consumers:
+            items = [item for _, item in sorted(parts.get(consumer.name, []), key=lambda p: p[0])]
+            errors = [error for _, error in items if error is not None]
+            if errors:
+                outcome[consumer.name] = (None, errors[0])
+                continue
+            try:
+                outcome[consumer.name] = (consumer.merge_segments([part for part, _ in items]), None)
+            except Exception as e:
+                print(f"{consumer.name} failed to merge segments: {e}")
+                outcome[consumer.name] = (None, e)
+        return outcome
+
+    def _relay(self, progress_queue, n_groups, progress, span=None):
+        """
+        Merges the tasks' progress reports into one job progress callback.
+        Segments of a group cover disjoint frames and add up; every group
+        decodes the whole video, so the job is as far as the slowest group.
+        """
+        reports = {}  # (group, segment) -> (frames_decoded, frames in its range, analyses)
+        while True:
+            item = progress_queue.get()
+            if item is None:
+                return
+            key, frames_decoded, task_span, analyses = item
+            reports[key] = (frames_decoded, task_span, analyses)
+
+            decoded = {}
+            merged = {}
+            for (group, _), (frames, _, task_analyses) in reports.items():
+                decoded[group] = decoded.get(group, 0) + frames
+                for name, (done, total) in task_analyses.items():
+                    d, t = merged.get(name, (0, 0))
+                    merged[name] = (d + done, t + total)
+            slowest = min(decoded.values()) if len(decoded) == n_groups else 0
+            total = span or max(r[1] for r in reports.values())
+            progress(slowest, total, merged)
+
+    def _reset(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            manager, self._manager = self._manager, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    def shutdown(self):
+        self._reset()
@@ -0,0 +1,191 @@
+import os
+
+import cv2
+import numpy as np
+
+# Videos longer than this many seconds are split into segments of at least
+# this length, processed in parallel (0 = never split unless a job asks)
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "0"))
+# Frames before a segment's start that are re-processed so its trackers are
+# warm and its track IDs can be matched with the previous segment's
+SEGMENT_OVERLAP_SECONDS = float(os.getenv("SEGMENT_OVERLAP_SECONDS", "1.0"))
+# Minimum IoU for two boxes on a shared frame to count as the same player
+STITCH_IOU = 0.5
+
+
+class Segment:
+    """
+    One time slice of a video processed on its own.
+
+    Frames [start, core_start) are warm-up: analysed so trackers pick up
+    the players, but left out of the results, which cover
+    [core_start, end]. Tracked boxes on the warm-up frames and on the last
+    `overlap` frames are logged, so IDs can be matched with the neighbouring
+    segments where both saw the same frames.
+    """
+
+    def __init__(self, index, start, core_start, end, overlap):
+        self.index = index
+        self.start = start
+        self.core_start = core_start
+        self.end = end
+        self.overlap = overlap
+        self.max_id = 0
+        # frame_count -> (track ids, xyxy boxes)
+        self.boundary = {}
+
+    def __repr__(self):
+        return f"Segment({self.index}, frames {self.start}-{self.end}, results from {self.core_start})"
+
+    def warming_up(self, frame_count):
+        return frame_count < self.core_start
+
+    def output_path(self, path):
+        """Where this segment writes its part of an output file."""
+        base, ext = os.path.splitext(path)
+        return f"{base}.seg{self.index}{ext}"
+
+    def record(self, frame_count, r):
+        """Logs the tracked boxes of a result on a boundary frame."""
+        if r.boxes is None or r.boxes.id is None or len(r.boxes) == 0:
+            return
+        ids = r.boxes.id.cpu().numpy().astype(np.int64)
+        self.max_id = max(self.max_id, int(ids.max()))
+        if frame_count < self.core_start or frame_count > self.end - self.overlap:
+            self.boundary[frame_count] = (ids, r.boxes.xyxy.cpu().numpy())
+
+    def summary(self):
+        """What merging needs from this segment (picklable)."""
+        return {"index": self.index, "core_start": self.core_start, "max_id": self.max_id,
+                "boundary": self.boundary}
+
+
+def plan_segments(total_frames, count, overlap):
+    """
+    Splits frames 1..total_frames into `count` consecutive segments, each
+    starting `overlap` frames early (except the first).
+    """
+    count = max(1, min(count, total_frames))
+    bounds = np.linspace(0, total_frames, count + 1).round().astype(int).tolist()
+    return [
+        Segment(i, max(1, bounds[i] + 1 - (overlap if i else 0)), bounds[i] + 1, bounds[i + 1], overlap)
+        for i in range(count)
+    ]
+
+
+def auto_segments(meta, workers, seconds=SEGMENT_SECONDS):
+    """Segments to split a video into: one per SEGMENT_SECONDS, at most one per worker."""
+    if seconds <= 0 or not meta.fps or meta.total_frames <= 0:
+        return 1
+    duration = meta.total_frames / meta.fps
+    return max(1, min(max(workers, 1), int(duration // seconds)))
+
+
+def overlap_frames(meta, seconds=SEGMENT_OVERLAP_SECONDS):
+    return max(1, int(round((meta.fps or 30) * seconds)))
+
+
+def box_iou(a, b):
+    """IoU matrix of xyxy boxes a (n, 4) and b (m, 4)."""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=-1)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=-1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=-1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class IdMap:
+    """Maps one segment's local track IDs to IDs that are unique across the video."""
+
+    def __init__(self, matched, offset):
+        self.matched = matched  # local id -> global id, for tracks continued from the previous segment
+        self.offset = offset    # added to every other local id
+
+    def __call__(self, track_id):
+        return self.matched.get(int(track_id), int(track_id) + self.offset)
+
+    def map(self, track_ids):
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        if not self.matched:
+            return track_ids + self.offset
+        return np.array([self(i) for i in track_ids], dtype=np.int64)
+
+
+def stitch_track_ids(summaries, iou=STITCH_IOU):
+    """
+    One IdMap per segment (summaries in segment order). Consecutive segments
+    share their overlap frames; a track of the later segment continues the
+    earlier track it overlaps (IoU >= `iou`) on the most shared frames.
+    Other tracks get fresh IDs after all IDs the earlier segments used.
+    """
+    maps = []
+    offset = 0
+    for k, summary in enumerate(summaries):
+        matched = {}
+        if k:
+            previous, prev_map = summaries[k - 1], maps[k - 1]
+            votes = {}
+            for frame_count, (ids, boxes) in summary["boundary"].items():
+                if frame_count >= summary["core_start"] or frame_count not in previous["boundary"]:
+                    continue
+                prev_ids, prev_boxes = previous["boundary"][frame_count]
+                overlap = box_iou(boxes, prev_boxes)
+                for i, j in zip(*np.nonzero(overlap >= iou)):
+                    pair = (int(ids[i]), int(prev_ids[j]))
+                    votes[pair] = votes.get(pair, 0) + 1
+            used = set()
+            for (local, prev), _ in sorted(votes.items(), key=lambda item: -item[1]):
+                if local in matched or prev in used:
+                    continue
+                matched[local] = prev_map(prev)
+                used.add(prev)
+        maps.append(IdMap(matched, offset))
+        offset += summary["max_id"]
+    return maps
+
+
+def concat_videos(paths, output_path):
+    """
+    Joins segment videos (same size and fps) into output_path in the first
+    segment's codec, falling back to mp4v, and removes the segment files.
+    Returns output_path, or None if a segment is missing.
+    """
+    if not paths or any(p is None or not os.path.exists(p) for p in paths):
+        return None
+
+    cap = cv2.VideoCapture(paths[0])
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    cap.release()
+
+    out = cv2.VideoWriter(output_path, fourcc, fps, size)
+    if not out.isOpened():
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not out.isOpened():
+        print(f"Error: Could not open VideoWriter to join segments into {output_path}")
+        return None
+
+    try:
+        for path in paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
+    for path in paths:
+        os.remove(path)
+    return output_path
+
+
+def segment_count(requested, meta, workers):
+    """Segments for a job: as requested, else automatic from SEGMENT_SECONDS."""
+    if requested:
+        return max(1, min(int(requested), max(meta.total_frames, 1)))
+    return auto_segments(meta, workers)
+
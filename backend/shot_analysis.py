@@ -1,172 +1,237 @@
 import cv2
 import numpy as np
 import os
-from ultralytics import YOLO
-from .angle_utils import calculate_angle, calculate_distance
-from .shot_classifier import classify_shot
+from .angle_utils import joint_angles, joint_distances, SHOT_ANGLES, SHOT_DISTANCES
+from .shot_classifier import classify_shots, get_rules
+from .frame_source import BatchedConsumer, run_single
+from .pipeline import FrameEncoder
+from .overlay import OverlayWriter, overlay_path, boxes_of, keypoints_of, join_overlays
+from .segments import concat_videos
+from .model_registry import POSE_MODEL
+from .inference_store import StoredInference
 
-# Initialize model
-model = YOLO("yolov8n-pose.pt")
-
-def analyze_cricket_shot(video_path, output_dir):
+def analyze_cricket_shot(video_path, output_dir, batch_size=None, skip_frames=None, render_mode="video"):
     """
     Analyzes a cricket batting video, detects shots, and overlays analytics.
     Returns the path to the processed output video.
     """
-    
-    # Generate output filename
-    import re
-    filename = os.path.basename(video_path)
-    name_only = os.path.splitext(filename)[0]
-    # Replace non-alphanumeric characters with _ to be URL safe
-    clean_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', name_only)
-    
-    # Adding timestamp to ensure unique filename for browser cache busting
-    import time
-    timestamp = int(time.time())
-    output_path = os.path.join(output_dir, f"shot_analysis_{clean_name}_{timestamp}.mp4")
-    
-    # Open video
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise ValueError(f"Could not open video: {video_path}")
-        
-    # Get video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    
+    return run_single(video_path, ShotConsumer(video_path, output_dir, batch_size, skip_frames, render_mode))
+
+
+class ShotConsumer(BatchedConsumer):
+    """
+    Frame consumer for the cricket shot analysis.
+    With render_mode "overlay" skeletons, shot label and angles go to a JSON
+    sidecar instead of an annotated video.
+    Result: (output_path, {"shot_type": ...})
+    """
+
+    name = "shot_analysis"
+
     # Skip frames control
     skip_frames = 2 # Process every 3rd frame
-    adjusted_fps = fps / (skip_frames + 1)
+    stride = skip_frames + 1
+    weights = POSE_MODEL
 
-    # Initialize writer
-    # Try avc1 first (H.264), fallback to mp4v
-    fourcc = cv2.VideoWriter_fourcc(*'avc1')
-    out = cv2.VideoWriter(output_path, fourcc, adjusted_fps, (width, height))
-    
-    if not out.isOpened():
-        print(f"Warning: avc1 codec failed, falling back to mp4v")
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, adjusted_fps, (width, height))
-
-    if not out.isOpened():
-        cap.release()
-        raise ValueError("Could not open VideoWriter with avc1 or mp4v")
-    
-    shot_name = "Rest Shot"
-    frame_count = 0
-    # skip_frames moved up
-    
-    try:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            if frame_count % (skip_frames + 1) != 0:
-                continue
-                
-            if frame_count % 30 == 0:
-                print(f"Shot analysis processing frame {frame_count}...")
+    def __init__(self, video_path, output_dir, batch_size=None, skip_frames=None, render_mode="video"):
+        super().__init__(batch_size, skip_frames)
+        self.render_mode = render_mode
+
+        # Generate output filename
+        import re
+        filename = os.path.basename(video_path)
+        name_only = os.path.splitext(filename)[0]
+        # Replace non-alphanumeric characters with _ to be URL safe
+        clean_name = re.sub(r'[^a-zA-Z0-9_\-]', '_', name_only)
+        
+        # Adding timestamp to ensure unique filename for browser cache busting
+        import time
+        timestamp = int(time.time())
+        self.output_path = os.path.join(output_dir, f"shot_analysis_{clean_name}_{timestamp}.mp4")
+        if render_mode == "overlay":
+            self.output_path = overlay_path(self.output_path)
+
+        self.out = None
+        self.overlay = None
+        self.encoder = None
+        self.model = None
+        self.shot_name = "Rest Shot"
+
+    def cache_params(self):
+        params = super().cache_params()
+        params["rules"] = get_rules().digest
+        params["render_mode"] = self.render_mode
+        return params
+
+    def start(self, meta):
+        # Get video properties
+        width, height = meta.width, meta.height
+        self.width, self.height = width, height
+
+        if self.render_mode == "overlay":
+            self.overlay = OverlayWriter(self.output_path, self.name, meta)
+            self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+            return
+
+        adjusted_fps = meta.fps / (self.skip_frames + 1)
+
+        # Initialize writer
+        # Try avc1 first (H.264), fallback to mp4v
+        fourcc = cv2.VideoWriter_fourcc(*'avc1')
+        out = cv2.VideoWriter(self.output_path, fourcc, adjusted_fps, (width, height))
+        
+        if not out.isOpened():
+            print(f"Warning: avc1 codec failed, falling back to mp4v")
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(self.output_path, fourcc, adjusted_fps, (width, height))
+
+        if not out.isOpened():
+            raise ValueError("Could not open VideoWriter with avc1 or mp4v")
+
+        self.out = out
+        self.encoder = FrameEncoder(name="shot-encoder")
+        self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+
+    def infer(self, frames):
+        # Run YOLO inference
+        results = self.model.predict(frames, self.batch_counts)
+        features = extract_shot_features(results, self.width, self.height)
+        return list(zip(results, features))
+
+    def set_segment(self, segment):
+        super().set_segment(segment)
+        if self.render_mode == "video":
+            self.output_path = segment.output_path(self.output_path)
+
+    def handle(self, frame_count, frame, item):
+        if frame_count % 30 == 0:
+            print(f"Shot analysis processing frame {frame_count}...")
+        if self.warming_up(frame_count):
+            return
+
+        r, features = item
+
+        if features is not None:
+            angles_map, detected_shot = features
             
-            # Run YOLO inference
-            results = model(frame, verbose=False)
+            # Classify Shot
+            if detected_shot != "Rest Shot":
+                self.shot_name = detected_shot
+
+        if self.overlay is not None:
+            angles = None
+            if features is not None:
+                angles = {name: int(value) for name, value in features[0].items()}
+            boxes, _ = boxes_of(r)
+            self.overlay.add(
+                frame_count, boxes=boxes, keypoints=keypoints_of(r),
+                label=self.shot_name if features is not None else None, angles=angles,
+            )
+            return
+        # Drawing and encoding run on the encoder thread
+        self.encoder.submit(self.render, frame_count, r, features, self.shot_name)
+
+    def render(self, frame_count, r, features, shot_name):
+        # Visualize the skeletal keypoints
+        frame = r.plot()
+
+        if features is not None:
+            angles_map, _ = features
             
-            for r in results:
-                # Visualize the skeletal keypoints
-                annotated_frame = r.plot()
-                frame = annotated_frame 
-
-                if r.keypoints and r.keypoints.data.shape[1] >= 17:
-                    kpts = r.keypoints.data[0].cpu().numpy()
-                    
-                    # Helper to get (x,y)
-                    def get_pt(idx):
-                        return kpts[idx][:2]
-                    
-                    nose = get_pt(0)
-                    left_shoulder = get_pt(5)
-                    right_shoulder = get_pt(6)
-                    left_elbow = get_pt(7)
-                    right_elbow = get_pt(8)
-                    left_wrist = get_pt(9)
-                    right_wrist = get_pt(10)
-                    left_hip = get_pt(11)
-                    right_hip = get_pt(12)
-                    left_knee = get_pt(13)
-                    right_knee = get_pt(14)
-                    left_ankle = get_pt(15)
-                    right_ankle = get_pt(16)
-                    
-                    right_elbow_ang = calculate_angle(right_shoulder, right_elbow, right_wrist)
-                    left_elbow_ang = calculate_angle(left_shoulder, left_elbow, left_wrist)
-                    
-                    right_hip_ang = calculate_angle(right_shoulder, right_hip, right_knee)
-                    left_hip_ang = calculate_angle(left_shoulder, left_hip, left_knee)
-                    
-                    right_knee_ang = calculate_angle(right_hip, right_knee, right_ankle)
-                    left_knee_ang = calculate_angle(left_hip, left_knee, left_ankle)
-                    
-                    def normalize(pt):
-                         return [pt[0] / width, pt[1] / height]
-                    
-                    wrist_nose_dist = calculate_distance(normalize(right_wrist), normalize(nose)) * 100
-                    right_left_leg_dist = calculate_distance(normalize(right_ankle), normalize(left_ankle)) * 100
-                    
-                    angles_map = {
-                        'right_knee': right_knee_ang,
-                        'left_knee': left_knee_ang,
-                        'right_elbow': right_elbow_ang,
-                        'left_elbow': left_elbow_ang,
-                        'right_hip': right_hip_ang,
-                        'left_hip': left_hip_ang
-                    }
-                    
-                    dist_map = {
-                        'wrist_nose': wrist_nose_dist,
-                        'right_left_leg': right_left_leg_dist
-                    }
-                    
-                    # Classify Shot
-                    detected_shot = classify_shot(angles_map, dist_map)
-                    if detected_shot != "Rest Shot":
-                        shot_name = detected_shot
-                    
-                    # Draw Analytics
-                    cv2.putText(frame, f"SHOT: {shot_name}", (30, 50), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 1.3, (0, 255, 10), 5)
-                    cv2.putText(frame, f"SHOT: {shot_name}", (30, 50), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 1.32, (0, 0, 0), 2)
-                               
-                    y_pos = 150
-                    gap = 50
-                    
-                    def draw_text(txt, y, color=(0, 0, 255)):
-                        cv2.putText(frame, txt, (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.71, color, 2)
-                        cv2.putText(frame, txt, (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 1)
-
-                    draw_text(f"R Knee: {int(right_knee_ang)}", y_pos)
-                    draw_text(f"R Elbow: {int(right_elbow_ang)}", y_pos + gap)
-                    draw_text(f"L Elbow: {int(left_elbow_ang)}", y_pos + 2*gap)
-                    draw_text(f"L Knee: {int(left_knee_ang)}", y_pos + 3*gap)
-                    draw_text(f"R Hip: {int(right_hip_ang)}", y_pos + 4*gap)
-                    draw_text(f"L Hip: {int(left_hip_ang)}", y_pos + 5*gap)
-
-            out.write(frame)
+            # Draw Analytics
+            cv2.putText(frame, f"SHOT: {shot_name}", (30, 50), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.3, (0, 255, 10), 5)
+            cv2.putText(frame, f"SHOT: {shot_name}", (30, 50), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.32, (0, 0, 0), 2)
+                       
+            y_pos = 150
+            gap = 50
             
-    except Exception as e:
-        print(f"Error during video processing: {e}")
-        raise
-        
-    finally:
-        cap.release()
-        out.release()
-    
-    # Simple summary metric: Most frequent shot name
-    # We can refine this by tracking frames or use the final shot_name if it was updated
+            def draw_text(txt, y, color=(0, 0, 255)):
+                cv2.putText(frame, txt, (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.71, color, 2)
+                cv2.putText(frame, txt, (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 1)
+
+            draw_text(f"R Knee: {int(angles_map['right_knee'])}", y_pos)
+            draw_text(f"R Elbow: {int(angles_map['right_elbow'])}", y_pos + gap)
+            draw_text(f"L Elbow: {int(angles_map['left_elbow'])}", y_pos + 2*gap)
+            draw_text(f"L Knee: {int(angles_map['left_knee'])}", y_pos + 3*gap)
+            draw_text(f"R Hip: {int(angles_map['right_hip'])}", y_pos + 4*gap)
+            draw_text(f"L Hip: {int(angles_map['left_hip'])}", y_pos + 5*gap)
+
+        self.write_frame(self.out, frame_count, frame)
+
+    def finish(self):
+        if self.overlay is not None:
+            self.overlay.close()
+        elif self.out is not None:
+            try:
+                self.encoder.close()
+            finally:
+                self.out.release()
     
-    return output_path, {"shot_type": shot_name}
+        # Simple summary metric: Most frequent shot name
+        # We can refine this by tracking frames or use the final shot_name if it was updated
+        
+        return self.output_path, {"shot_type": self.shot_name}
+
+    def finish_segment(self):
+        part = {"shot": self.shot_name}
+        if self.overlay is not None:
+            part.update(self.overlay.part())
+        else:
+            self.finish()
+            part["path"] = self.output_path if self.out is not None else None
+        return part
+
+    def merge_segments(self, parts):
+        # The label sticks to the last shot detected, also across segments:
+        # a segment that hasn't detected one yet still shows the previous one
+        shot_name = "Rest Shot"
+        for part in parts:
+            for frame in part.get("frames", []):
+                if frame.get("label") == "Rest Shot":
+                    frame["label"] = shot_name
+            if part["shot"] != "Rest Shot":
+                shot_name = part["shot"]
+
+        if self.render_mode == "overlay":
+            path = join_overlays(self.output_path, parts)
+        else:
+            path = concat_videos([part["path"] for part in parts], self.output_path)
+        return path, {"shot_type": shot_name}
+
+    def abort(self):
+        if self.out is not None:
+            self.encoder.abort()
+            self.out.release()
+
+
+# Column order of the feature matrix handed to the classifier
+FEATURE_NAMES = list(SHOT_ANGLES) + list(SHOT_DISTANCES)
+
+def extract_shot_features(results, width, height):
+    """
+    Joint angles and distances of the first detected person in each result,
+    computed and classified for the whole batch in one vectorized pass.
+    Returns one (angles_map, shot_label) per result, or None where no full
+    skeleton was detected.
+    """
+    features = [None] * len(results)
+    rows = [i for i, r in enumerate(results)
+            if r.keypoints and r.keypoints.data.shape[1] >= 17]
+    if not rows:
+        return features
+
+    # (frames, 17, 2) keypoints of the first person in each frame
+    kpts = np.stack([results[i].keypoints.data[0, :, :2].cpu().numpy() for i in rows])
+
+    angles = joint_angles(kpts, list(SHOT_ANGLES.values()))
+    # Normalized by frame size, in percent
+    dists = joint_distances(kpts, list(SHOT_DISTANCES.values()), scale=(width, height)) * 100
+
+    labels = classify_shots(np.hstack([angles, dists]), FEATURE_NAMES)
 
-# Verify file creation
+    for row, i in enumerate(rows):
+        angles_map = dict(zip(SHOT_ANGLES, angles[row].tolist()))
+        features[i] = (angles_map, labels[row])
+    return features
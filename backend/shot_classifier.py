@@ -1,100 +1,131 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Rule table; override with SHOT_RULES_PATH to tune thresholds without code changes
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shot_rules.json")
+RULES_PATH = os.getenv("SHOT_RULES_PATH", DEFAULT_RULES_PATH)
+
+
+class ShotRules:
+    """
+    A shot rule table compiled into interval arrays.
+
+    The table (see shot_rules.json) lists shots in priority order. Each rule has
+    an "all" map of feature -> [lower, upper] bounds that must all hold, and an
+    optional "any" list of such maps of which at least one must hold. Bounds
+    are exclusive and null means unbounded. The first matching rule wins;
+    frames matching nothing get the "default" label.
+    """
+
+    def __init__(self, table):
+        # Identifies the thresholds in use (part of the result cache key)
+        self.digest = hashlib.sha256(json.dumps(table, sort_keys=True).encode()).hexdigest()[:16]
+        self.default = table.get("default", "Rest Shot")
+        self.features = list(table["features"])
+        self.names = np.array([rule["name"] for rule in table["rules"]] + [self.default], dtype=object)
+
+        index = {name: i for i, name in enumerate(self.features)}
+        n_rules, n_features = len(table["rules"]), len(self.features)
+
+        def bounds(constraints):
+            lo = np.full(n_features, -np.inf)
+            hi = np.full(n_features, np.inf)
+            for feature, (lower, upper) in constraints.items():
+                if lower is not None:
+                    lo[index[feature]] = lower
+                if upper is not None:
+                    hi[index[feature]] = upper
+            return lo, hi
+
+        # (rules, features) bounds of the "all" clauses
+        self.lo = np.empty((n_rules, n_features))
+        self.hi = np.empty((n_rules, n_features))
+        # "any" alternatives flattened into one table, with the rule each belongs to
+        alt_lo, alt_hi, alt_rule = [], [], []
+
+        for r, rule in enumerate(table["rules"]):
+            self.lo[r], self.hi[r] = bounds(rule.get("all", {}))
+            for alternative in rule.get("any", []):
+                lo, hi = bounds(alternative)
+                alt_lo.append(lo)
+                alt_hi.append(hi)
+                alt_rule.append(r)
+
+        self.alt_lo = np.array(alt_lo).reshape(-1, n_features)
+        self.alt_hi = np.array(alt_hi).reshape(-1, n_features)
+        # (alternatives, rules) membership matrix
+        self.alt_member = np.zeros((len(alt_rule), n_rules), dtype=bool)
+        self.alt_member[np.arange(len(alt_rule)), alt_rule] = True
+        self.has_any = self.alt_member.any(axis=0)
+
+    @classmethod
+    def load(cls, path=RULES_PATH):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def matches(self, X):
+        """(frames, rules) boolean matrix of which rules each feature row satisfies."""
+        X = np.asarray(X, dtype=np.float64)[:, None, :]
+        ok = ((X > self.lo) & (X < self.hi)).all(axis=-1)
+
+        if len(self.alt_member):
+            alt_ok = ((X > self.alt_lo) & (X < self.alt_hi)).all(axis=-1)
+            any_ok = (alt_ok.astype(np.int32) @ self.alt_member.astype(np.int32)) > 0
+            ok &= any_ok | ~self.has_any
+        return ok
+
+    def classify(self, X, feature_names=None):
+        """
+        Labels every row of the (frames, features) matrix X at once.
+        Columns follow self.features unless `feature_names` gives their order.
+        Returns an object array of shot names.
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(feature_names or self.features))
+        if feature_names is not None and list(feature_names) != self.features:
+            X = X[:, [list(feature_names).index(f) for f in self.features]]
+
+        ok = self.matches(X)
+        first = np.where(ok.any(axis=1), ok.argmax(axis=1), len(self.names) - 1)
+        return self.names[first]
+
+
+_rules = None
+
+
+def get_rules():
+    """The rule table from RULES_PATH, compiled on first use."""
+    global _rules
+    if _rules is None:
+        _rules = ShotRules.load()
+    return _rules
+
+
+def classify_shots(X, feature_names=None):
+    """
+    Vectorized classify_shot over a (frames, features) matrix.
+    Returns an object array with one shot name per row.
+    """
+    return get_rules().classify(X, feature_names)
+
+
 def classify_shot(angles, distances):
     """
     Classifies the cricket shot based on joint angles and distances.
-    
+
     Args:
         angles (dict): Dictionary containing calculated angles.
-            Expected keys: 'right_knee', 'left_knee', 'right_elbow', 'left_elbow', 
+            Expected keys: 'right_knee', 'left_knee', 'right_elbow', 'left_elbow',
                            'right_hip', 'left_hip'
         distances (dict): Dictionary containing calculated distances.
             Expected keys: 'wrist_nose', 'right_left_leg'
-            
+
     Returns:
         str: The name of the detected shot, or "Rest Shot" if no specific shot is detected.
     """
-    
-    # Unpack values for easier reading, matching the user's logic variable names
-    right_knee_angle = angles.get('right_knee', 0)
-    left_knee_angle = angles.get('left_knee', 0)
-    right_elbow_angle = angles.get('right_elbow', 0)
-    left_elbow_angle = angles.get('left_elbow', 0)
-    right_hip_angle = angles.get('right_hip', 0)
-    left_hip_angle = angles.get('left_hip', 0)
-    
-    wrist_nose_dist = distances.get('wrist_nose', 0)
-    right_left_leg_dist = distances.get('right_left_leg', 0)
-    
-    shot = "Rest Shot"
-
-    # Cover Drive
-    if (170 > right_knee_angle > 90 and 
-        160 > left_knee_angle > 80 and 
-        145 > right_elbow_angle > 50 and 
-        170 > left_elbow_angle > 55 and 
-        180 > right_hip_angle > 120 and 
-        165 > left_hip_angle > 100 and 
-        13 > wrist_nose_dist > 5):
-        shot = "Cover Drive"
-            
-    # Front Foot Defensive
-    elif (180 > right_knee_angle > 100 and 
-          165 > left_knee_angle > 100 and 
-          (105 > right_elbow_angle > 50 or 180 > left_elbow_angle > 80) and 
-          180 > right_hip_angle > 70 and 
-          180 > left_hip_angle > 90 and 
-          20 > wrist_nose_dist > 10 and 
-          right_left_leg_dist > 10):
-        shot = "Front Foot Defensive"
-                
-    # Back Foot Defensive
-    elif (180 > right_knee_angle > 150 and 
-          180 > left_knee_angle > 160 and 
-          140 > right_elbow_angle and 
-          140 > left_elbow_angle > 30 and 
-          180 > right_hip_angle > 160 and 
-          180 > left_hip_angle > 160 and 
-          6 > wrist_nose_dist > 2 and 
-          6 > right_left_leg_dist > 3):
-        shot = "Back Foot Defensive"
-
-    # Back Foot Punch
-    elif (180 > right_knee_angle > 160 and 
-          180 > left_knee_angle > 160 and 
-          150 > right_elbow_angle > 70 and 
-          180 > left_elbow_angle > 70 and 
-          180 > right_hip_angle > 160 and 
-          180 > left_hip_angle > 165 and 
-          13 > wrist_nose_dist > 4 and 
-          right_left_leg_dist > 3):
-        shot = "Back Foot Punch"
-            
-    # Sweep Shot
-    elif (110 > right_knee_angle > 70 and 
-          180 > left_knee_angle > 100 and 
-          180 > right_elbow_angle > 40 and 
-          170 > left_elbow_angle > 90 and 
-          175 > right_hip_angle > 120 and 
-          175 > left_hip_angle > 90):
-        shot = "Sweep Shot"
-        
-    # Pull Shot
-    elif (180 > right_knee_angle > 150 and 
-          180 > left_knee_angle > 150 and 
-          180 > right_elbow_angle > 65 and 
-          160 > left_elbow_angle > 20 and 
-          180 > right_hip_angle > 160 and 
-          180 > left_hip_angle > 160 and 
-          13 > wrist_nose_dist > 2 and 
-          12 > right_left_leg_dist > 1):
-        shot = "Pull Shot"
-        
-    # Flick Shot
-    elif (180 > right_knee_angle > 130 and 
-          180 > left_knee_angle > 165 and 
-          180 > right_elbow_angle > 110 and 
-          160 > left_elbow_angle > 110 and 
-          180 > right_hip_angle > 140 and 
-          150 > left_hip_angle > 130):
-        shot = "Flick Shot"
-        
-    return shot
+    rules = get_rules()
+    values = {**angles, **distances}
+    row = [values.get(f, 0) for f in rules.features]
+    return rules.classify([row])[0]
@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
+from .frame_source import BatchedConsumer, run_single
+from .model_registry import DETECTION_MODEL
+from .inference_store import StoredInference
+from .segments import stitch_track_ids
 
 # Load model inside function or reuse
 # heuristic: pixels to meters. 
@@ -9,107 +12,246 @@ from ultralytics import YOLO
 # For simplicity in this demo, we'll use a fixed ratio or just relative units.
 PIXELS_PER_METER = 50 
 
-def analyze_speed(video_path):
+def analyze_speed(video_path, batch_size=None, skip_frames=None):
     """
     Analyzes player speed in the video.
     Returns a dictionary of metrics.
     """
-    model = YOLO("yolov8n.pt")
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    if fps == 0: fps = 30
-    
-    # Store centroids: {track_id: [ (x,y), ... ]}
-    tracks = {}
-    
-    frame_count = 0
+    return run_single(video_path, SpeedConsumer(batch_size, skip_frames))
+
+
+class TrackStore:
+    """
+    Columnar, array-backed store of track observations.
+
+    One row per (track, frame) detection with growable NumPy columns for the
+    track id, frame index and box centroid. Appending a frame's detections is
+    a slice assignment; capacity doubles when full.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.track_id = np.empty(capacity, dtype=np.int64)
+        self.frame_idx = np.empty(capacity, dtype=np.int64)
+        self.cx = np.empty(capacity, dtype=np.float64)
+        self.cy = np.empty(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, needed):
+        capacity = len(self.track_id)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for col in ("track_id", "frame_idx", "cx", "cy"):
+            old = getattr(self, col)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, col, new)
+
+    def append(self, track_ids, frame_idx, cx, cy):
+        """Adds all detections of one frame (arrays of equal length)."""
+        n = len(track_ids)
+        if n == 0:
+            return
+        self._grow(self.size + n)
+        end = self.size + n
+        self.track_id[self.size:end] = track_ids
+        self.frame_idx[self.size:end] = frame_idx
+        self.cx[self.size:end] = cx
+        self.cy[self.size:end] = cy
+        self.size = end
+
+    def columns(self):
+        """(track_id, frame_idx, cx, cy) views of the filled rows."""
+        n = self.size
+        return self.track_id[:n], self.frame_idx[:n], self.cx[:n], self.cy[:n]
+
+    def drop_before(self, frame_idx):
+        """Removes the rows of frames before `frame_idx`, keeping the others in order."""
+        n = self.size
+        keep = self.frame_idx[:n] >= frame_idx
+        if keep.all():
+            return
+        kept = int(keep.sum())
+        for col in ("track_id", "frame_idx", "cx", "cy"):
+            values = getattr(self, col)
+            values[:kept] = values[:n][keep]
+        self.size = kept
+
+
+class SpeedTotals:
+    """
+    Speed metrics of a stream, updated frame by frame without keeping its
+    observations: the last position of every track, and per track the
+    distance, time and top speed so far. Gives the same metrics as
+    compute_speed_metrics over all the observations, when frames are added
+    in order.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.last = {}  # track id -> (frame_idx, cx, cy)
+        self.distance = {}
+        self.time = {}
+        self.max_speed = {}
+        self.buckets = np.zeros(len(INTENSITY_LABELS))
+
+    def append(self, track_ids, frame_idx, cx, cy):
+        """Adds all detections of one frame, as TrackStore.append."""
+        for track_id, x, y in zip(np.asarray(track_ids).tolist(), np.asarray(cx).tolist(), np.asarray(cy).tolist()):
+            previous = self.last.get(track_id)
+            self.last[track_id] = (frame_idx, x, y)
+            if previous is None or frame_idx <= previous[0]:
+                continue
+            gap = frame_idx - previous[0]
+            dist = np.hypot(x - previous[1], y - previous[2]) / PIXELS_PER_METER
+            dt = gap / self.fps
+            speed = dist / dt
+            self.distance[track_id] = self.distance.get(track_id, 0.0) + dist
+            self.time[track_id] = self.time.get(track_id, 0.0) + dt
+            self.max_speed[track_id] = max(self.max_speed.get(track_id, 0.0), speed)
+            self.buckets[np.digitize(speed, INTENSITY_BINS)] += gap
+
+    def metrics(self):
+        tracks = list(self.time)
+        return speed_summary(
+            np.array([self.distance[t] / self.time[t] for t in tracks]),
+            np.array([self.max_speed[t] for t in tracks]),
+            self.buckets,
+        )
+
+
+class SpeedConsumer(BatchedConsumer):
+    """
+    Frame consumer for the player speed analysis.
+    Result: speed metrics dict.
+    """
+
+    name = "speed"
+
     skip_frames = 2 # Process every 3rd frame
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        frame_count += 1
-        if frame_count % (skip_frames + 1) != 0:
-            continue
-            
+    stride = skip_frames + 1
+    weights = DETECTION_MODEL
+    conf = 0.3
+
+    def __init__(self, batch_size=None, skip_frames=None):
+        super().__init__(batch_size, skip_frames)
+        self.model = None
+        # Centroids of every tracked box, one row per (track, frame)
+        self.tracks = TrackStore()
+        self.fps = 30
+
+    def start(self, meta):
+        fps = meta.fps
+        if fps == 0: fps = 30
+        self.fps = fps
+        self.model = StoredInference(self.weights, meta.path, self.segment, self.backend)
+
+    def infer(self, frames):
+        # Tracking
+        return self.model.track(frames, self.batch_counts, conf=self.conf)
+
+    def handle(self, frame_count, frame, r):
         if frame_count % 30 == 0:
             print(f"Speed analysis processing frame {frame_count}...")
-            
-        # Tracking
-        results = model.track(frame, persist=True, conf=0.3, verbose=False)
-        r = results[0]
-        
+        if self.warming_up(frame_count):
+            return
+
         if r.boxes and r.boxes.id is not None:
             boxes = r.boxes.xyxy.cpu().numpy()
-            track_ids = r.boxes.id.cpu().numpy()
-            
-            for box, track_id in zip(boxes, track_ids):
-                track_id = int(track_id)
-                x1, y1, x2, y2 = box
-                cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                
-                if track_id not in tracks:
-                    tracks[track_id] = []
-                tracks[track_id].append((cx, cy))
-                
-    cap.release()
-    
-    # Calculate speeds
-    # distance = sqrt(dx^2 + dy^2)
-    # speed = distance / time_interval
-    # time_interval = (skip_frames + 1) / fps
-    
-    max_speeds = []
-    avg_speeds = []
-    
-    # Intensity distribution (frames count)
-    intensity_counts = {"Walking": 0, "Jogging": 0, "Sprinting": 0}
-    total_samples = 0
-    
-    for tid, points in tracks.items():
-        if len(points) < 2:
-            continue
-            
-        distances = []
-        for i in range(1, len(points)):
-            p1 = points[i-1]
-            p2 = points[i]
-            dist_pixels = np.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2)
-            dist_meters = dist_pixels / PIXELS_PER_METER
-            speed_mps = dist_meters * fps / (skip_frames + 1) # Adjust for skipped frames
-            distances.append(speed_mps)
-            
-            # Classify
-            if speed_mps < 2.0: # < 7.2 km/h
-                intensity_counts["Walking"] += 1
-            elif speed_mps < 5.0: # < 18 km/h
-                intensity_counts["Jogging"] += 1
-            else: # > 18 km/h
-                intensity_counts["Sprinting"] += 1
-            total_samples += 1
-            
-        if distances:
-            avg_speeds.append(np.mean(distances))
-            max_speeds.append(np.max(distances))
-            
-    # Aggregate metrics
-    final_avg = float(np.mean(avg_speeds)) if avg_speeds else 0.0
-    final_max = float(np.max(max_speeds)) if max_speeds else 0.0
-    
-    # Normalize percentages
-    if total_samples > 0:
-        intensity_dist = {
-            "Walking": int((intensity_counts["Walking"] / total_samples) * 100),
-            "Jogging": int((intensity_counts["Jogging"] / total_samples) * 100),
-            "Sprinting": int((intensity_counts["Sprinting"] / total_samples) * 100)
+            track_ids = r.boxes.id.cpu().numpy().astype(np.int64)
+            cx = (boxes[:, 0] + boxes[:, 2]) / 2
+            cy = (boxes[:, 1] + boxes[:, 3]) / 2
+            self.tracks.append(track_ids, frame_count, cx, cy)
+
+    def cache_params(self):
+        params = super().cache_params()
+        params["pixels_per_meter"] = PIXELS_PER_METER
+        return params
+
+    def finish(self):
+        return compute_speed_metrics(self.tracks, self.fps)
+
+    def finish_segment(self):
+        columns = [col.copy() for col in self.tracks.columns()]
+        return {"columns": columns, "fps": self.fps, "segment": self.segment.summary()}
+
+    def merge_segments(self, parts):
+        # One store for the whole video, with IDs continued across segments
+        store = TrackStore()
+        id_maps = stitch_track_ids([part["segment"] for part in parts])
+        for part, id_map in zip(parts, id_maps):
+            track_ids, frame_idx, cx, cy = part["columns"]
+            store.append(id_map.map(track_ids), frame_idx, cx, cy)
+        return compute_speed_metrics(store, parts[0]["fps"])
+
+    def abort(self):
+        pass
+
+
+# Intensity buckets (m/s): Walking < 2.0 (7.2 km/h) <= Jogging < 5.0 (18 km/h) <= Sprinting
+INTENSITY_LABELS = ["Walking", "Jogging", "Sprinting"]
+INTENSITY_BINS = [2.0, 5.0]
+
+def compute_speed_metrics(store, fps):
+    """
+    Turns a TrackStore into the speed/intensity metrics dict, vectorized over
+    all tracks: speeds are the distance between consecutive observations of a
+    track divided by the real time between their frames, and averages are
+    weighted by that time, so variable sampling doesn't skew them.
+    """
+    track_id, frame_idx, cx, cy = store.columns()
+
+    # Sort by track, then frame, so each track's observations are contiguous
+    order = np.lexsort((frame_idx, track_id))
+    track_id, frame_idx = track_id[order], frame_idx[order]
+    cx, cy = cx[order], cy[order]
+
+    # Consecutive pairs that belong to the same track
+    same = track_id[1:] == track_id[:-1]
+    dist_meters = np.hypot(np.diff(cx), np.diff(cy))[same] / PIXELS_PER_METER
+    gaps = np.diff(frame_idx)[same]
+    dt = gaps / fps
+    speeds = dist_meters / dt
+    speed_track = track_id[1:][same]
+
+    if len(speeds) == 0:
+        return speed_summary(speeds, speeds, np.zeros(len(INTENSITY_LABELS)))
+
+    # Per-track average (distance over time, so samples taken further apart
+    # weigh more) and maximum speed
+    starts = np.flatnonzero(np.r_[True, speed_track[1:] != speed_track[:-1]])
+    avg_speeds = np.add.reduceat(dist_meters, starts) / np.add.reduceat(dt, starts)
+    max_speeds = np.maximum.reduceat(speeds, starts)
+
+    # Frames of tracked time per intensity bucket
+    buckets = np.bincount(np.digitize(speeds, INTENSITY_BINS), weights=gaps, minlength=len(INTENSITY_LABELS))
+    return speed_summary(avg_speeds, max_speeds, buckets)
+
+
+def speed_summary(avg_speeds, max_speeds, buckets):
+    """
+    The metrics dict from per-track average and top speeds and the tracked
+    frames per intensity bucket.
+    """
+    if len(avg_speeds) == 0:
+        return {
+            "average_speed": 0.0,
+            "max_speed": 0.0,
+            "intensity": {label: 0 for label in INTENSITY_LABELS}
         }
-    else:
-        intensity_dist = {"Walking": 0, "Jogging": 0, "Sprinting": 0}
-        
+
+    # Intensity distribution (share of tracked time per bucket), as whole percentages
+    intensity_dist = {
+        label: int((frames / buckets.sum()) * 100)
+        for label, frames in zip(INTENSITY_LABELS, buckets)
+    }
+
     return {
-        "average_speed": round(final_avg, 2),
-        "max_speed": round(final_max, 2),
+        "average_speed": round(float(np.mean(avg_speeds)), 2),
+        "max_speed": round(float(np.max(max_speeds)), 2),
         "intensity": intensity_dist
     }
@@ -0,0 +1,53 @@
+import numpy as np
+
+from backend.angle_utils import (SHOT_ANGLES, SHOT_DISTANCES, calculate_angle, calculate_distance, joint_angles,
+                                 joint_distances)
+
+
+def poses(seed=0, shape=(6, 3)):
+    return np.random.default_rng(seed).uniform(0, 640, shape + (17, 2))
+
+
+def test_joint_angles_match_calculate_angle():
+    kpts = poses()
+    triplets = list(SHOT_ANGLES.values())
+    angles = joint_angles(kpts, triplets)
+
+    assert angles.shape == (6, 3, len(triplets))
+    for f in range(6):
+        for p in range(3):
+            want = [calculate_angle(kpts[f, p, a], kpts[f, p, b], kpts[f, p, c]) for a, b, c in triplets]
+            np.testing.assert_allclose(angles[f, p], want, atol=1e-9)
+    assert ((angles >= 0) & (angles <= 180)).all()
+
+
+def test_single_triplet_and_single_pose():
+    kpts = np.zeros((17, 2))
+    kpts[6], kpts[8], kpts[10] = (0, 0), (0, 10), (10, 10)
+    assert joint_angles(kpts, (6, 8, 10)).tolist() == [90.0]
+
+
+def test_zero_degenerate():
+    kpts = poses(1, (4,))
+    # Pose 0: wrist on the elbow, pose 1: shoulder on the elbow
+    kpts[0, 10] = kpts[0, 8]
+    kpts[1, 6] = kpts[1, 8]
+    plain = joint_angles(kpts, [(6, 8, 10)])[:, 0]
+    zeroed = joint_angles(kpts, [(6, 8, 10)], zero_degenerate=True)[:, 0]
+
+    assert zeroed[:2].tolist() == [0.0, 0.0]
+    np.testing.assert_array_equal(zeroed[2:], plain[2:])
+
+
+def test_joint_distances_match_calculate_distance():
+    kpts = poses(2)
+    pairs = list(SHOT_DISTANCES.values())
+    scale = (640, 360)
+    distances = joint_distances(kpts, pairs, scale=scale)
+
+    assert distances.shape == (6, 3, len(pairs))
+    for f in range(6):
+        for p in range(3):
+            scaled = kpts[f, p] / np.array(scale)
+            want = [calculate_distance(scaled[i], scaled[j]) for i, j in pairs]
+            np.testing.assert_allclose(distances[f, p], want, atol=1e-12)
@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend.batch import collect_clips, run_batch
+
+
+def test_manifest_paths_relative_to_manifest(tmp_path):
+    (tmp_path / "day1").mkdir()
+    (tmp_path / "day1" / "a.mp4").write_bytes(b"")
+    manifest = tmp_path / "day1" / "clips.txt"
+    manifest.write_text("# first innings\na.mp4\n")
+
+    assert collect_clips(str(manifest), root=str(tmp_path)) == [(str(tmp_path / "day1" / "a.mp4"), None)]
+
+
+@pytest.mark.parametrize("entry", ["../outside.mp4", "/etc/passwd"])
+def test_manifest_entries_outside_root_rejected(tmp_path, entry):
+    root = tmp_path / "root"
+    root.mkdir()
+    manifest = root / "clips.jsonl"
+    manifest.write_text(json.dumps({"path": entry}) + "\n")
+
+    with pytest.raises(ValueError):
+        collect_clips(str(manifest), root=str(root))
+    # The CLI reads whatever the operator lists
+    assert len(collect_clips(str(manifest))) == 1
+
+
+def test_source_outside_root_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        collect_clips(str(tmp_path / ".." / "elsewhere"), root=str(tmp_path))
+
+
+def test_unknown_manifest_analyses_recorded(tmp_path):
+    clips = [(str(tmp_path / "a.mp4"), ["sprint", "dance"])]
+    summary = run_batch(clips, ["speed"], str(tmp_path / "out"), SimpleNamespace(workers=0))
+
+    assert summary["failed"] == 1
+    with open(summary["metrics_file"]) as f:
+        record = json.loads(f.readline())
+    assert record["status"] == "failed"
+    assert sorted(record["errors"]) == ["dance", "sprint"]
+
+
+@pytest.mark.parametrize("line", ['["a.mp4"]', "42", '{"file": "a.mp4"}', '{"path": "a.mp4", "analyses": 3}'])
+def test_malformed_manifest_entries_rejected(tmp_path, line):
+    manifest = tmp_path / "clips.jsonl"
+    manifest.write_text('{"path": "b.mp4"}\n\n' + line + "\n")
+
+    with pytest.raises(ValueError, match="line 3"):
+        collect_clips(str(manifest))
+
+
+def test_analysis_without_output_fails_only_its_clip(tmp_path):
+    class Scheduler:
+        workers = 0
+
+        def run(self, path, consumers, segments=None):
+            if path.endswith("broken.mp4"):
+                # PoseConsumer.finish() when its video writer could not be opened
+                return {"pose": ((None, {}), None)}
+            return {"pose": ((str(tmp_path / "out" / "pose.mp4"), {"elbow_angle": 90.0}), None)}
+
+    clips = [(str(tmp_path / "broken.mp4"), None), (str(tmp_path / "good.mp4"), None)]
+    summary = run_batch(clips, ["pose"], str(tmp_path / "out"), Scheduler(), concurrency=1)
+
+    assert (summary["done"], summary["failed"]) == (1, 1)
+    with open(summary["metrics_file"]) as f:
+        records = {json.loads(line)["clip"]: json.loads(line) for line in f}
+    broken, good = records[clips[0][0]], records[clips[1][0]]
+    assert broken["status"] == "failed" and "pose" in broken["errors"]
+    assert good["status"] == "done" and good["artifacts"] == {"pose": ["pose.mp4"]}
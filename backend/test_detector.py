@@ -0,0 +1,29 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from backend.detector import detect_players
+from backend.model_registry import DETECTION_MODEL
+
+
+def write_clip(path, frames=5, size=(160, 120)):
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 30, size)
+    for i in range(frames):
+        frame = np.full((size[1], size[0], 3), 40, dtype=np.uint8)
+        cv2.rectangle(frame, (10 + i * 5, 20), (40 + i * 5, 100), (200, 200, 200), -1)
+        out.write(frame)
+    out.release()
+
+
+@pytest.mark.skipif(not os.path.exists(DETECTION_MODEL), reason=f"needs {DETECTION_MODEL} in the working directory")
+def test_detect_players_smoke(tmp_path):
+    clip = tmp_path / "clip.mp4"
+    write_clip(clip)
+    out_path = detect_players(str(clip), str(tmp_path / "tracked.mp4"))
+
+    cap = cv2.VideoCapture(out_path)
+    assert cap.isOpened()
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 5
+    cap.release()
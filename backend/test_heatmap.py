@@ -0,0 +1,48 @@
+import numpy as np
+
+from backend.heatmap import HeatmapConsumer
+
+
+def consumer(tmp_path):
+    heatmap = HeatmapConsumer("clip.mp4", str(tmp_path), cell=8, track_layers=3)
+    heatmap.grid_shape = (8, 8)
+    heatmap.grid = np.zeros(heatmap.grid_shape, dtype=np.int32)
+    heatmap.background = np.zeros((64, 64, 3), dtype=np.uint8)
+    return heatmap
+
+
+def test_untracked_hits_keep_combined_map(tmp_path):
+    heatmap = consumer(tmp_path)
+    boxes = np.array([[0, 0, 10, 20], [30, 30, 40, 50]], dtype=np.float32)
+    heatmap.accumulate(boxes, np.array([-1, -1]), np.array([3, 3], dtype=np.int32))
+
+    output_path, layers = heatmap.finish()
+    assert output_path is not None
+    assert layers == []
+
+
+def test_layers_for_tracked_hits(tmp_path):
+    heatmap = consumer(tmp_path)
+    boxes = np.array([[0, 0, 10, 20], [30, 30, 40, 50], [30, 30, 40, 50]], dtype=np.float32)
+    heatmap.accumulate(boxes, np.array([7, -1, 2]), np.array([3, 3, 1], dtype=np.int32))
+
+    output_path, layers = heatmap.finish()
+    assert output_path is not None
+    assert [track_id for track_id, _ in layers] == [7, 2]
+
+
+def test_merge_segments_without_tracked_players(tmp_path):
+    from backend.segments import plan_segments
+
+    parts = []
+    for segment in plan_segments(90, 3, 10):
+        part = consumer(tmp_path)
+        part.set_segment(segment)
+        parts.append(part.finish_segment())
+    parts[1]["grid"][2, 2] = 4
+
+    merged = consumer(tmp_path)
+    output_path, layers = merged.merge_segments(parts)
+    assert output_path is not None
+    assert layers == []
+    assert merged.grid[2, 2] == 4
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend.live import LiveAnalyzer
+from backend.speed_analysis import TrackStore, compute_speed_metrics
+
+
+class Column:
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class Boxes:
+    def __init__(self, ids, xyxy):
+        self.id = Column(ids)
+        self.xyxy = Column(np.asarray(xyxy, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.xyxy.values)
+
+
+def test_speed_window_keeps_only_recent_positions():
+    # No analyses: no models are loaded, the speed bookkeeping works on its own
+    live = LiveAnalyzer((), fps=10, speed_window=2)
+    positions = TrackStore()
+    for frame_count in range(1, 101):
+        if frame_count % 7 == 0:
+            r = SimpleNamespace(boxes=None)  # frames without players still move the window
+        else:
+            x = 3.0 * frame_count + (frame_count % 5) * 20
+            r = SimpleNamespace(boxes=Boxes([1, 2], [[x, 0, x + 10, 40], [200, x, 210, x + 40]]))
+            positions.append(np.array([1, 2]), frame_count, np.array([x + 5, 205.0]), np.array([20.0, x + 20]))
+        live._add_positions(frame_count, r)
+
+        track_id, frame_idx, cx, cy = positions.columns()
+        recent = frame_idx > frame_count - 2 * 10
+        window = TrackStore()
+        window.append(track_id[recent], frame_idx[recent], cx[recent], cy[recent])
+        assert len(live.tracks) == len(window) <= 2 * 20
+        assert live.speed() == compute_speed_metrics(window, 10)
+
+    assert live.speed_totals.metrics() == compute_speed_metrics(positions, 10)
@@ -0,0 +1,55 @@
+import pytest
+
+from backend import model_registry
+from backend.frame_source import FrameConsumer
+
+
+class FakeYOLO:
+    def __init__(self, path, task=None):
+        self.ckpt_path = path
+        self.task = task or "detect"
+        self.predictor = None
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """The registry with fake models, a failing export and onnx-int8 as the default backend."""
+    def export_model(model, backend):
+        raise RuntimeError("export failed")
+
+    monkeypatch.setattr(model_registry, "YOLO", FakeYOLO)
+    monkeypatch.setattr(model_registry, "export_model", export_model)
+    monkeypatch.setattr(model_registry, "_models", {})
+    monkeypatch.setattr(model_registry, "_load_times", {})
+    monkeypatch.setattr(model_registry, "INFERENCE_BACKEND", "onnx-int8")
+    return model_registry
+
+
+def test_default_backend_falls_back_and_says_so(registry):
+    model = registry.get_model("yolov8n.pt")
+    assert model.backend == "torch"
+    assert registry.serving_backend("yolov8n.pt") == "torch"
+
+
+def test_backend_by_name_raises_instead_of_falling_back(registry):
+    with pytest.raises(ValueError, match="onnx-int8"):
+        registry.get_model("yolov8n.pt", "onnx-int8")
+    # Also when the default already fell back to PyTorch under the same key
+    registry.get_model("yolov8n.pt")
+    with pytest.raises(ValueError, match="export failed"):
+        registry.acquire("yolov8n.pt", "onnx-int8")
+
+
+def test_cache_params_name_the_serving_backend(registry):
+    consumer = FrameConsumer()
+    consumer.weights = "yolov8n.pt"
+    assert "backend" not in consumer.cache_params()
+    consumer.backend = "openvino"
+    assert consumer.cache_params()["backend"] == "openvino"
+
+
+def test_exported_model_records_its_backend(registry, monkeypatch):
+    monkeypatch.setattr(registry, "export_model", lambda model, backend: "yolov8n.onnx")
+    model = registry.get_model("yolov8n.pt", "onnx")
+    assert (model.ckpt_path, model.backend) == ("yolov8n.onnx", "onnx")
+    assert registry.serving_backend("yolov8n.pt", "onnx") == "onnx"
@@ -0,0 +1,71 @@
+import numpy as np
+
+from backend.frame_source import MotionSampler
+
+
+def flat(value, shape=(72, 128)):
+    return np.full(shape + (3,), value, dtype=np.uint8)
+
+
+def sample(sampler, video):
+    """Feeds the frames a lone consumer would have decoded; returns the sampled frame counts."""
+    sampled = []
+    frame_count = 1
+    while frame_count <= len(video):
+        sampler.observe(frame_count, video[frame_count - 1])
+        if sampler.wants(frame_count):
+            sampled.append(frame_count)
+        frame_count = sampler.next_wanted(frame_count)
+    return sampled
+
+
+def noise(seed, shape=(72, 128)):
+    return np.random.default_rng(seed).integers(0, 256, shape + (3,), dtype=np.uint8)
+
+
+def sampler():
+    return MotionSampler(min_stride=1, max_stride=8, low=0.5, high=3.0, base_stride=3)
+
+
+def test_static_scene_backs_off_to_max_stride():
+    sampled = sample(sampler(), [flat(100)] * 60)
+    # The first frame has nothing to compare with and counts as static too
+    assert np.diff(sampled).tolist() == [6, 8, 8, 8, 8, 8, 8]
+
+
+def test_action_samples_every_frame():
+    video = [noise(i) for i in range(30)]
+    sampled = sample(sampler(), video)
+    assert sampled == [1] + list(range(7, 31))
+
+
+def test_moderate_motion_keeps_base_stride():
+    # Brightness rising by 2 per frame: between the thresholds
+    video = [flat(2 * i) for i in range(40)]
+    sampled = sample(sampler(), video)
+    assert set(np.diff(sampled[1:]).tolist()) == {3}
+
+
+def test_stride_drops_when_action_starts():
+    video = [flat(100)] * 40 + [noise(i) for i in range(20)]
+    sampled = sample(sampler(), video)
+    after = [f for f in sampled if f > 40]
+    # One long step into the action at most, then every frame
+    assert after[-5:] == list(range(56, 61))
+    assert after[0] - max(f for f in sampled if f <= 40) <= 8
+
+
+def test_frame_decoded_for_others_pulls_next_sample_in():
+    s = sampler()
+    for frame_count in (1, 3, 7):
+        s.observe(frame_count, flat(100))
+    assert s.next_frame == 15
+    # Frame 9 was decoded for another consumer and shows action
+    s.observe(9, noise(0))
+    assert not s.wants(9)
+    assert s.next_frame == 10
+
+
+def test_strides_are_clamped():
+    s = MotionSampler(min_stride=0, max_stride=-1, base_stride=20)
+    assert (s.min_stride, s.max_stride, s.base_stride) == (1, 1, 1)
@@ -0,0 +1,92 @@
+import itertools
+import os
+
+import pytest
+
+from backend import result_cache
+from backend.result_cache import ResultCache, cache_key, file_digest
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Distinct, increasing last_used stamps however fast the calls come
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(result_cache.time, "time", lambda: float(next(ticks)))
+
+
+def artifact(tmp_path, name, size):
+    path = tmp_path / "outputs" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def put(cache, tmp_path, key, size):
+    return cache.put(key, {"type": "image", "url": f"/outputs/{key}.png"}, {"key": key},
+                     [artifact(tmp_path, f"{key}.png", size)])
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), "/cache", max_bytes=250)
+    put(cache, tmp_path, "a" * 64, 100)
+    put(cache, tmp_path, "b" * 64, 100)
+    # Reading a makes b the least recently used
+    assert cache.get("a" * 64) is not None
+    put(cache, tmp_path, "c" * 64, 100)
+
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == ({"type": "image", "url": f"/cache/{'a' * 16}_{'a' * 64}.png"}, {"key": "a" * 64})
+    assert cache.get("c" * 64) is not None
+    # The evicted entry's artifact is gone with it
+    assert sorted(os.listdir(tmp_path / "cache")) == sorted(
+        ["index.json", f"{'a' * 16}_{'a' * 64}.png", f"{'c' * 16}_{'c' * 64}.png"])
+
+
+def test_keeps_new_entry_larger_than_the_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), "/cache", max_bytes=50)
+    put(cache, tmp_path, "a" * 64, 40)
+    put(cache, tmp_path, "b" * 64, 100)
+
+    assert cache.get("a" * 64) is None
+    assert cache.get("b" * 64) is not None
+
+
+def test_index_survives_restart(tmp_path):
+    root = str(tmp_path / "cache")
+    put(ResultCache(root, "/cache", max_bytes=1000), tmp_path, "a" * 64, 10)
+
+    output, metrics = ResultCache(root, "/cache", max_bytes=1000).get("a" * 64)
+    assert metrics == {"key": "a" * 64}
+
+
+def test_missing_artifact_drops_entry(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), "/cache", max_bytes=1000)
+    output = put(cache, tmp_path, "a" * 64, 10)
+    os.remove(os.path.join(cache.root, os.path.basename(output["url"])))
+
+    assert cache.get("a" * 64) is None
+    assert "a" * 64 not in cache._entries
+
+
+def test_layer_urls_point_at_cached_copies(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), "/cache", max_bytes=1000)
+    key = "d" * 64
+    paths = [artifact(tmp_path, "heat.png", 10), artifact(tmp_path, "heat_player_3.png", 10)]
+    output = cache.put(key, {"url": "/outputs/heat.png",
+                             "layers": [{"track_id": 3, "url": "/outputs/heat_player_3.png"},
+                                        {"track_id": 4, "url": "/outputs/elsewhere.png"}]}, {}, paths)
+
+    assert output["url"] == f"/cache/{key[:16]}_heat.png"
+    assert output["layers"] == [{"track_id": 3, "url": f"/cache/{key[:16]}_heat_player_3.png"},
+                                {"track_id": 4, "url": "/outputs/elsewhere.png"}]
+
+
+def test_cache_key_and_digest(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"frames")
+    digest = file_digest(str(video))
+    assert digest == file_digest(str(video))
+
+    assert cache_key(digest, "pose", {"skip_frames": 2}) == cache_key(digest, "pose", {"skip_frames": 2})
+    assert cache_key(digest, "pose", {"skip_frames": 2}) != cache_key(digest, "pose", {"skip_frames": 1})
+    assert cache_key(digest, "pose", {}) != cache_key(digest, "speed", {})
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+import pytest
+
+from backend.frame_source import FrameConsumer
+from backend.scheduler import Scheduler
+
+
+class FrameCounter(FrameConsumer):
+    """Counts the frames it is given; segments add up."""
+
+    name = "count"
+    stride = 3
+
+    def finish(self):
+        return self.frames_done
+
+    def finish_segment(self):
+        return self.frames_done
+
+    def merge_segments(self, parts):
+        return sum(parts)
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (64, 48))
+    for i in range(100):
+        out.write(np.full((48, 64, 3), i, dtype=np.uint8))
+    out.release()
+    return path
+
+
+@pytest.mark.parametrize("segments", [1, 3])
+def test_progress_ends_complete(clip, segments):
+    # 100 frames with a stride of 3: no segment's last frame is one the consumer wants
+    events = []
+    outcome = Scheduler(workers=0).run(clip, [FrameCounter()], progress=lambda *event: events.append(event),
+                                       segments=segments)
+
+    assert outcome["count"][1] is None
+    decoded, total, analyses = events[-1]
+    assert decoded == total >= 100
+    done, expected = analyses["count"]
+    assert done == expected
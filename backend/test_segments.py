@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.segments import Segment, box_iou, plan_segments, stitch_track_ids
+
+
+class Column:
+    def __init__(self, values):
+        self.values = np.asarray(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class Boxes:
+    def __init__(self, ids, xyxy):
+        self.id = Column(ids)
+        self.xyxy = Column(np.asarray(xyxy, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.xyxy.values)
+
+
+def result(ids, xyxy):
+    return SimpleNamespace(boxes=Boxes(ids, xyxy))
+
+
+def box(x):
+    return [x, 0, x + 10, 20]
+
+
+@pytest.mark.parametrize("total, count, overlap", [(90, 3, 10), (100, 7, 5), (5, 10, 2), (1, 1, 0)])
+def test_plan_segments_cover_every_frame_once(total, count, overlap):
+    segments = plan_segments(total, count, overlap)
+    assert len(segments) == min(count, total)
+    cores = [frame for s in segments for frame in range(s.core_start, s.end + 1)]
+    assert cores == list(range(1, total + 1))
+    assert segments[0].start == 1
+    for s in segments[1:]:
+        assert s.start == max(1, s.core_start - overlap)
+
+
+def segment_summary(segment, tracks):
+    """Records frame -> [(track id, box x)] results on a segment and returns its summary."""
+    for frame_count, boxes in sorted(tracks.items()):
+        ids = [i for i, _ in boxes]
+        segment.record(frame_count, result(ids, [box(x) for _, x in boxes]))
+    return segment.summary()
+
+
+def test_stitch_continues_tracks_across_segments():
+    first, second, third = plan_segments(90, 3, 10)
+    assert (second.start, second.core_start, third.start, third.core_start) == (21, 31, 51, 61)
+
+    # Segment 0: players 1 (x=0) and 2 (x=100), seen to the end
+    s0 = segment_summary(first, {f: [(1, 0), (2, 100)] for f in range(1, 31)})
+    # Segment 1 tracks them as 2 and 1, player 2 leaves and a new player 3 arrives
+    s1 = segment_summary(second, {**{f: [(2, 0), (1, 100)] for f in range(21, 40)},
+                                  **{f: [(2, 0), (3, 300)] for f in range(40, 61)}})
+    # Segment 2: the x=0 player (local 1) continues; x=300 (local 5) continues player 3
+    s2 = segment_summary(third, {f: [(1, 0), (5, 300)] for f in range(51, 91)})
+
+    maps = stitch_track_ids([s0, s1, s2])
+    assert list(maps[0].map([1, 2])) == [1, 2]
+    assert list(maps[1].map([2, 1])) == [1, 2]
+    # Not seen on the shared frames: fresh id after segment 0's ids
+    assert maps[1](3) == 3 + s0["max_id"]
+    # Continued through segment 1's mapping back to the global ids
+    assert maps[2](1) == 1
+    assert maps[2](5) == maps[1](3)
+    # Unmatched ids of a later segment stay clear of every earlier id
+    assert maps[2](4) == 4 + s0["max_id"] + s1["max_id"]
+
+
+def test_stitch_matches_each_track_once_by_most_shared_frames():
+    first, second = plan_segments(40, 2, 10)
+    s0 = segment_summary(first, {f: [(1, 0)] for f in range(1, 21)})
+    # Two tracks of the later segment overlap player 1; local 4 on more frames
+    s1 = segment_summary(second, {**{f: [(3, 0)] for f in range(11, 14)},
+                                  **{f: [(4, 1)] for f in range(14, 21)}})
+
+    maps = stitch_track_ids([s0, s1])
+    assert maps[1](4) == 1
+    assert maps[1](3) == 3 + s0["max_id"]
+
+
+def test_stitch_ignores_boxes_below_iou():
+    first, second = plan_segments(40, 2, 10)
+    s0 = segment_summary(first, {f: [(1, 0)] for f in range(1, 21)})
+    s1 = segment_summary(second, {f: [(1, 8)] for f in range(11, 21)})
+    assert box_iou(np.array([box(0)]), np.array([box(8)]))[0, 0] < 0.5
+
+    maps = stitch_track_ids([s0, s1])
+    assert maps[1](1) == 1 + s0["max_id"]
+
+
+def test_record_keeps_only_boundary_frames():
+    segment = Segment(1, 11, 21, 60, 10)
+    for frame_count in (11, 20, 21, 50, 51, 60):
+        segment.record(frame_count, result([7], [box(0)]))
+    segment.record(55, result([9], np.empty((0, 4))))
+
+    assert sorted(segment.boundary) == [11, 20, 51, 60]
+    assert segment.max_id == 7
@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+import pytest
+
+from backend.shot_classifier import DEFAULT_RULES_PATH, ShotRules, classify_shot
+
+FEATURES = ["right_knee", "left_knee", "right_elbow", "left_elbow", "right_hip", "left_hip", "wrist_nose", "right_left_leg"]
+
+
+def reference_classify(angles, distances):
+    # The hand-written classifier the rule table replaced (same conditions, reflowed), as the oracle
+    right_knee_angle = angles.get('right_knee', 0)
+    left_knee_angle = angles.get('left_knee', 0)
+    right_elbow_angle = angles.get('right_elbow', 0)
+    left_elbow_angle = angles.get('left_elbow', 0)
+    right_hip_angle = angles.get('right_hip', 0)
+    left_hip_angle = angles.get('left_hip', 0)
+    wrist_nose_dist = distances.get('wrist_nose', 0)
+    right_left_leg_dist = distances.get('right_left_leg', 0)
+
+    shot = "Rest Shot"
+    if (170 > right_knee_angle > 90 and 160 > left_knee_angle > 80 and 145 > right_elbow_angle > 50 and
+            170 > left_elbow_angle > 55 and 180 > right_hip_angle > 120 and 165 > left_hip_angle > 100 and
+            13 > wrist_nose_dist > 5):
+        shot = "Cover Drive"
+    elif (180 > right_knee_angle > 100 and 165 > left_knee_angle > 100 and
+          (105 > right_elbow_angle > 50 or 180 > left_elbow_angle > 80) and 180 > right_hip_angle > 70 and
+          180 > left_hip_angle > 90 and 20 > wrist_nose_dist > 10 and right_left_leg_dist > 10):
+        shot = "Front Foot Defensive"
+    elif (180 > right_knee_angle > 150 and 180 > left_knee_angle > 160 and 140 > right_elbow_angle and
+          140 > left_elbow_angle > 30 and 180 > right_hip_angle > 160 and 180 > left_hip_angle > 160 and
+          6 > wrist_nose_dist > 2 and 6 > right_left_leg_dist > 3):
+        shot = "Back Foot Defensive"
+    elif (180 > right_knee_angle > 160 and 180 > left_knee_angle > 160 and 150 > right_elbow_angle > 70 and
+          180 > left_elbow_angle > 70 and 180 > right_hip_angle > 160 and 180 > left_hip_angle > 165 and
+          13 > wrist_nose_dist > 4 and right_left_leg_dist > 3):
+        shot = "Back Foot Punch"
+    elif (110 > right_knee_angle > 70 and 180 > left_knee_angle > 100 and 180 > right_elbow_angle > 40 and
+          170 > left_elbow_angle > 90 and 175 > right_hip_angle > 120 and 175 > left_hip_angle > 90):
+        shot = "Sweep Shot"
+    elif (180 > right_knee_angle > 150 and 180 > left_knee_angle > 150 and 180 > right_elbow_angle > 65 and
+          160 > left_elbow_angle > 20 and 180 > right_hip_angle > 160 and 180 > left_hip_angle > 160 and
+          13 > wrist_nose_dist > 2 and 12 > right_left_leg_dist > 1):
+        shot = "Pull Shot"
+    elif (180 > right_knee_angle > 130 and 180 > left_knee_angle > 165 and 180 > right_elbow_angle > 110 and
+          160 > left_elbow_angle > 110 and 180 > right_hip_angle > 140 and 150 > left_hip_angle > 130):
+        shot = "Flick Shot"
+    return shot
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return ShotRules.load(DEFAULT_RULES_PATH)
+
+
+def samples(n=2000, seed=0):
+    """
+    Feature rows drawn inside each rule's bounds, with some features moved
+    onto a threshold, just beside one, or anywhere, so both the matches and
+    the exclusive bounds get exercised.
+    """
+    with open(DEFAULT_RULES_PATH) as f:
+        table = json.load(f)
+    rng = np.random.default_rng(seed)
+    span = {name: (0, 25) if name in ("wrist_nose", "right_left_leg") else (0, 190) for name in FEATURES}
+    thresholds = {name: [] for name in FEATURES}
+    for rule in table["rules"]:
+        for constraints in [rule.get("all", {})] + rule.get("any", []):
+            for name, bounds in constraints.items():
+                thresholds[name].extend(b for b in bounds if b is not None)
+
+    rows = []
+    for rule in table["rules"]:
+        bounds = dict(rule.get("all", {}))
+        for alternative in rule.get("any", []):
+            bounds.update(alternative)
+        X = np.empty((n, len(FEATURES)))
+        for j, name in enumerate(FEATURES):
+            lower, upper = bounds.get(name, [None, None])
+            lower = span[name][0] if lower is None else lower
+            upper = span[name][1] if upper is None else upper
+            X[:, j] = rng.uniform(lower, upper, n)
+            edge = np.array(thresholds[name]) + rng.choice([-0.5, 0, 0.5], len(thresholds[name]))
+            moved = rng.random(n)
+            X[:, j] = np.where(moved < 0.1, rng.choice(edge, n), X[:, j])
+            X[:, j] = np.where((moved >= 0.1) & (moved < 0.15), rng.uniform(*span[name], n), X[:, j])
+        rows.append(X)
+    return np.concatenate(rows)
+
+
+def expected(X):
+    return [reference_classify(dict(zip(FEATURES[:6], row[:6])), dict(zip(FEATURES[6:], row[6:]))) for row in X]
+
+
+def test_rule_table_matches_reference_classifier(rules):
+    X = samples()
+    want = expected(X)
+    assert list(rules.classify(X)) == want
+    # Every label is reached, so each rule's bounds were actually compared
+    assert set(want) == set(rules.names)
+
+
+def test_feature_names_reorder_columns(rules):
+    X = samples(200, seed=1)
+    order = FEATURES[::-1]
+    assert list(rules.classify(X[:, ::-1], feature_names=order)) == expected(X)
+
+
+def test_classify_shot_defaults_missing_features_to_zero():
+    angles = {"right_knee": 170.5, "left_knee": 170.5, "right_elbow": 100, "left_elbow": 100,
+              "right_hip": 170.5, "left_hip": 170.5}
+    distances = {"wrist_nose": 5, "right_left_leg": 4}
+    assert classify_shot(angles, distances) == reference_classify(angles, distances) == "Back Foot Defensive"
+    assert classify_shot({}, {}) == reference_classify({}, {}) == "Rest Shot"
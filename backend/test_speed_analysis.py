@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from backend.speed_analysis import PIXELS_PER_METER, SpeedTotals, TrackStore, compute_speed_metrics
+
+
+def reference_metrics(rows, fps):
+    """Per-track loop over (track id, frame, cx, cy) rows, the way the metrics are defined."""
+    tracks = {}
+    for track_id, frame_idx, cx, cy in rows:
+        tracks.setdefault(track_id, []).append((frame_idx, cx, cy))
+    averages, maxima, buckets = [], [], [0, 0, 0]
+    for points in tracks.values():
+        points.sort()
+        distance = time = 0.0
+        speeds = []
+        for (f0, x0, y0), (f1, x1, y1) in zip(points, points[1:]):
+            d = np.hypot(x1 - x0, y1 - y0) / PIXELS_PER_METER
+            dt = (f1 - f0) / fps
+            speeds.append(d / dt)
+            distance += d
+            time += dt
+            buckets[0 if d / dt < 2.0 else 1 if d / dt < 5.0 else 2] += f1 - f0
+        if speeds:
+            averages.append(distance / time)
+            maxima.append(max(speeds))
+    return averages, maxima, buckets
+
+
+def random_rows(seed, tracks=6, frames=60):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for track_id in range(tracks):
+        # Tracks with gaps, of varying length, some with a single observation
+        seen = np.sort(rng.choice(np.arange(1, frames + 1), rng.integers(1, frames // 2), replace=False))
+        x, y = rng.uniform(0, 500, 2)
+        for frame_idx in seen:
+            x, y = x + rng.normal(0, 10), y + rng.normal(0, 10)
+            rows.append((track_id, int(frame_idx), x, y))
+    rng.shuffle(rows)
+    return rows
+
+
+def store_of(rows, capacity=4):
+    store = TrackStore(capacity=capacity)
+    for track_id, frame_idx, cx, cy in rows:
+        store.append(np.array([track_id]), frame_idx, np.array([cx]), np.array([cy]))
+    return store
+
+
+def test_track_store_grows_and_keeps_rows():
+    store = TrackStore(capacity=2)
+    store.append(np.array([1, 2, 3]), 5, np.array([1.0, 2.0, 3.0]), np.array([4.0, 5.0, 6.0]))
+    store.append(np.array([], dtype=np.int64), 6, np.array([]), np.array([]))
+    store.append(np.array([1]), 7, np.array([1.5]), np.array([4.5]))
+
+    track_id, frame_idx, cx, cy = store.columns()
+    assert len(store) == 4
+    assert list(track_id) == [1, 2, 3, 1]
+    assert list(frame_idx) == [5, 5, 5, 7]
+    assert list(cx) == [1.0, 2.0, 3.0, 1.5]
+    assert list(cy) == [4.0, 5.0, 6.0, 4.5]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_speed_metrics_match_per_track_loop(seed):
+    fps = 30
+    rows = random_rows(seed)
+    averages, maxima, buckets = reference_metrics(rows, fps)
+
+    metrics = compute_speed_metrics(store_of(rows), fps)
+    assert metrics["average_speed"] == round(float(np.mean(averages)), 2)
+    assert metrics["max_speed"] == round(float(np.max(maxima)), 2)
+    assert list(metrics["intensity"].values()) == [int(b / sum(buckets) * 100) for b in buckets]
+
+
+def test_speed_uses_time_between_frames():
+    # 50 px (1 m) over a 3-frame gap at 30 fps is 10 m/s, over 6 frames 5 m/s
+    store = store_of([(1, 1, 0.0, 0.0), (1, 4, 50.0, 0.0), (1, 10, 100.0, 0.0)])
+    metrics = compute_speed_metrics(store, 30)
+    assert metrics["max_speed"] == 10.0
+    assert metrics["average_speed"] == round(2 / (9 / 30), 2)
+    assert metrics["intensity"] == {"Walking": 0, "Jogging": 0, "Sprinting": 100}
+
+
+def test_speed_metrics_without_pairs():
+    metrics = compute_speed_metrics(store_of([(1, 1, 0.0, 0.0), (2, 1, 5.0, 5.0)]), 30)
+    assert metrics == {"average_speed": 0.0, "max_speed": 0.0,
+                       "intensity": {"Walking": 0, "Jogging": 0, "Sprinting": 0}}
+
+
+def test_drop_before_keeps_later_rows_in_order():
+    store = store_of([(1, f, float(f), 0.0) for f in range(1, 11)] + [(2, 3, 0.0, 0.0)], capacity=2)
+    store.drop_before(6)
+    track_id, frame_idx, cx, _ = store.columns()
+    assert list(frame_idx) == [6, 7, 8, 9, 10]
+    assert list(cx) == [6.0, 7.0, 8.0, 9.0, 10.0]
+    store.drop_before(1)
+    assert len(store) == 5
+    store.drop_before(11)
+    assert len(store) == 0
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_speed_totals_match_full_store(seed):
+    fps = 25
+    rows = sorted(random_rows(seed), key=lambda row: row[1])
+    totals = SpeedTotals(fps)
+    for frame_idx in sorted({row[1] for row in rows}):
+        frame = [row for row in rows if row[1] == frame_idx]
+        totals.append(np.array([row[0] for row in frame]), frame_idx,
+                      np.array([row[2] for row in frame]), np.array([row[3] for row in frame]))
+    assert totals.metrics() == compute_speed_metrics(store_of(rows), fps)
+    assert SpeedTotals(fps).metrics() == compute_speed_metrics(TrackStore(), fps)
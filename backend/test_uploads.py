@@ -0,0 +1,50 @@
+import os
+import time
+
+import pytest
+
+from backend.uploads import UploadError, UploadManager
+
+
+def test_chunks_resume_at_offset(tmp_path):
+    manager = UploadManager(str(tmp_path / "uploads"))
+    upload_id = manager.create("clip.mp4", 6)["upload_id"]
+
+    assert manager.write_chunk(upload_id, 0, [b"abc"]) == 3
+    with pytest.raises(UploadError) as e:
+        manager.write_chunk(upload_id, 0, [b"abc"])
+    assert e.value.status == 409
+    assert manager.get(upload_id).offset == 3
+    assert manager.write_chunk(upload_id, 3, [b"def"]) == 6
+
+    done = manager.complete(upload_id)
+    assert done["filename"] == done["sha256"] + ".mp4"
+    assert manager.create("again.mp4", 6, done["sha256"])["complete"]
+
+
+def test_active_upload_not_pruned(tmp_path):
+    manager = UploadManager(str(tmp_path / "uploads"))
+    active = manager.create("slow.mp4", None)["upload_id"]
+    idle = manager.create("idle.mp4", None)["upload_id"]
+
+    # Both sessions were created two days ago; only one kept receiving chunks
+    old = time.time() - 2 * 24 * 3600
+    for upload_id in (active, idle):
+        for ext in (".part", ".json"):
+            os.utime(os.path.join(manager.partial_dir, upload_id + ext), (old, old))
+    manager.write_chunk(active, 0, [b"more"])
+
+    manager.create("new.mp4", None)
+    assert manager.get(active).offset == 4
+    with pytest.raises(UploadError):
+        manager.get(idle)
+
+
+def test_partial_files_outside_upload_dir(tmp_path):
+    upload_dir = str(tmp_path / "uploads")
+    manager = UploadManager(upload_dir)
+    upload_id = manager.create("clip.mp4", None)["upload_id"]
+    manager.write_chunk(upload_id, 0, [b"abc"])
+
+    assert os.listdir(upload_dir) == []
+    assert sorted(os.listdir(manager.partial_dir)) == [upload_id + ".json", upload_id + ".part"]
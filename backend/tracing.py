@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Events kept per trace; later ones are counted but dropped (a long video
+# at stride 1 records a decode span per frame)
+TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", "200000"))
+
+# Spans are timed with perf_counter and placed on the wall clock, so the
+# spans of worker processes line up with the job's
+_EPOCH = time.time() - time.perf_counter()
+
+_context = threading.local()
+
+
+def _us(t):
+    return round((_EPOCH + t) * 1e6, 1)
+
+
+class Trace:
+    """
+    Span timeline of one job, exported in the Chrome trace event format
+    (open in chrome://tracing or ui.perfetto.dev).
+
+    Spans are complete events on the thread and process that ran them, so
+    the decode reader, encoder threads and worker processes each get their
+    own track; analyses are async spans from start to close. Safe to record
+    into from any thread. Copies of consumers (video segments) keep
+    recording into the same trace; in a worker process the trace starts
+    empty and its events are sent back with the task's result.
+    """
+
+    def __init__(self, name="job", max_events=TRACE_MAX_EVENTS):
+        self.name = name
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self._threads = set()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"name": self.name, "max_events": self.max_events}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], state["max_events"])
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _append(self, event):
+        pid, tid = os.getpid(), threading.get_ident()
+        event["pid"], event["tid"] = pid, tid
+        with self._lock:
+            if (pid, tid) not in self._threads:
+                if not any(p == pid for p, _ in self._threads):
+                    self.events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": tid,
+                                        "args": {"name": f"{multiprocessing.current_process().name} (pid {pid})"}})
+                self._threads.add((pid, tid))
+                self.events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                                    "args": {"name": threading.current_thread().name}})
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append(event)
+
+    def complete(self, name, cat, start, end=None, **args):
+        """Records a span from `start` to `end` (perf_counter values, end defaults to now)."""
+        end = time.perf_counter() if end is None else end
+        self._append({"name": name, "cat": cat, "ph": "X", "ts": _us(start),
+                      "dur": round((end - start) * 1e6, 1), "args": args})
+
+    @contextmanager
+    def span(self, name, cat="job", **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, cat, start, **args)
+
+    def begin(self, name, cat, key, **args):
+        """Starts an async span (its own track, may overlap others on the thread)."""
+        self._append({"name": name, "cat": cat, "ph": "b", "id": key, "ts": _us(time.perf_counter()), "args": args})
+
+    def end(self, name, cat, key):
+        self._append({"name": name, "cat": cat, "ph": "e", "id": key, "ts": _us(time.perf_counter())})
+
+    def drain(self):
+        """Events recorded so far (picklable), emptying the trace."""
+        with self._lock:
+            events, self.events = self.events, []
+            dropped, self.dropped = self.dropped, 0
+            self._threads = set()
+        return events, dropped
+
+    def merge(self, drained):
+        """Adds events drained from this job's trace in another process."""
+        events, dropped = drained
+        with self._lock:
+            room = max(self.max_events - len(self.events), 0)
+            self.events.extend(events[:room])
+            self.dropped += dropped + max(len(events) - room, 0)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"job": self.name, "dropped_events": self.dropped},
+            }
+
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` the one current() returns on this thread inside the block."""
+    previous = getattr(_context, "trace", None)
+    _context.trace = trace
+    try:
+        yield
+    finally:
+        _context.trace = previous
+
+
+def current():
+    """The trace of the analysis running on this thread, if it records one."""
+    return getattr(_context, "trace", None)
+
+
+def span(trace, name, cat="job", **args):
+    """trace.span(...), or a no-op block when there is no trace."""
+    return trace.span(name, cat, **args) if trace is not None else nullcontext()
@@ -0,0 +1,51 @@
+import os
+
+import torch
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import YAML, IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+
+# Tracker replayed over stored detections; ByteTrack needs boxes only, no image features
+TRACKER_CONFIG = os.getenv("TRACKER_CONFIG", "bytetrack.yaml")
+
+_config = None
+
+
+def tracker_config():
+    """Parsed TRACKER_CONFIG, read once and shared (sessions never modify it)."""
+    global _config
+    if _config is None:
+        _config = IterableSimpleNamespace(**YAML.load(check_yaml(TRACKER_CONFIG)))
+    return _config
+
+
+class TrackerSession:
+    """
+    Tracker state of one analysis run.
+
+    Each consumer of each job owns a session, so track IDs never mix between
+    concurrent requests or carry over from one video to the next, while the
+    network behind the detections stays shared. Replaces the tracker that
+    `model.track(persist=True)` keeps on the (shared) predictor.
+    """
+
+    def __init__(self, config=None):
+        self.tracker = BYTETracker(args=config or tracker_config())
+        self.frames = 0
+
+    def update(self, r):
+        """Tracks one frame's Results in order; returns it with ids on its boxes."""
+        self.frames += 1
+        tracks = self.tracker.update(r.boxes.cpu().numpy(), r.orig_img)
+        if len(tracks) == 0:
+            if any(not t.is_activated for t in self.tracker.tracked_stracks):
+                r = r[:0]  # hide new tracks until confirmed, as model.track() does
+            return r
+        r = r[tracks[:, -1].astype(int)]
+        r.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return r
+
+    def reset(self):
+        """Starts over: forgets all tracks and restarts IDs at 1."""
+        self.tracker.reset()
+        self.frames = 0
@@ -0,0 +1,257 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from .result_cache import remember_digest
+
+CHUNK_SIZE = 1024 * 1024
+# Unfinished resumable uploads are discarded after this long without activity
+STALE_UPLOAD_SECONDS = 24 * 3600
+
+
+def partial_dir_for(upload_dir):
+    """
+    Where unfinished uploads and session state live: next to upload_dir
+    (same filesystem, so finishing is a rename) rather than inside it, so
+    serving upload_dir never exposes them.
+    """
+    return os.path.normpath(upload_dir) + ".partial"
+
+
+def stored_name(digest, filename):
+    """Content-addressed file name: the SHA-256 plus the original extension."""
+    ext = os.path.splitext(os.path.basename(filename or ""))[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,8}", ext):
+        ext = ""
+    return f"{digest}{ext}"
+
+
+def existing_name(upload_dir, digest, filename):
+    """
+    Name under which content with this digest is already stored, if any.
+    The same bytes uploaded with a different extension reuse the stored file.
+    """
+    name = stored_name(digest, filename)
+    if os.path.exists(os.path.join(upload_dir, name)):
+        return name
+    matches = glob.glob(os.path.join(glob.escape(upload_dir), f"{digest}*"))
+    return os.path.basename(matches[0]) if matches else None
+
+
+def _finalize(part_path, digest, filename, upload_dir):
+    """
+    Moves a fully received file to its content-addressed name, or drops it if
+    we already have that content. Returns (name, deduplicated).
+    """
+    name = existing_name(upload_dir, digest, filename)
+    if name is not None:
+        os.remove(part_path)
+        deduplicated = True
+    else:
+        name = stored_name(digest, filename)
+        os.replace(part_path, os.path.join(upload_dir, name))
+        deduplicated = False
+    remember_digest(os.path.join(upload_dir, name), digest)
+    return name, deduplicated
+
+
+def store_stream(fileobj, filename, upload_dir):
+    """
+    Copies a file object to `upload_dir` in chunks, hashing as it goes, and
+    stores it under its content hash. Returns (name, digest, deduplicated).
+    """
+    partial_dir = partial_dir_for(upload_dir)
+    os.makedirs(partial_dir, exist_ok=True)
+    part_path = os.path.join(partial_dir, f"{uuid.uuid4().hex}.part")
+
+    h = hashlib.sha256()
+    try:
+        with open(part_path, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+                h.update(chunk)
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    digest = h.hexdigest()
+    name, deduplicated = _finalize(part_path, digest, filename, upload_dir)
+    return name, digest, deduplicated
+
+
+class UploadError(Exception):
+    """Raised for a bad resumable-upload request; `status` is the HTTP code to return."""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class UploadSession:
+    """
+    One resumable upload. Bytes land in `<id>.part`, the session state in
+    `<id>.json`, so an interrupted upload can continue after a server restart.
+    The running hash lives in memory and is rebuilt from the partial file when
+    it is missing.
+    """
+
+    def __init__(self, upload_id, filename, size, partial_dir):
+        self.id = upload_id
+        self.filename = filename
+        self.size = size
+        self.part_path = os.path.join(partial_dir, f"{upload_id}.part")
+        self.state_path = os.path.join(partial_dir, f"{upload_id}.json")
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+        self._hash = None
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.part_path)
+        except FileNotFoundError:
+            return 0
+
+    def save_state(self):
+        with open(self.state_path, "w") as f:
+            json.dump({"id": self.id, "filename": self.filename, "size": self.size}, f)
+
+    def hasher(self):
+        if self._hash is None:
+            # Fresh process or first chunk: hash whatever is already on disk
+            self._hash = hashlib.sha256()
+            if os.path.exists(self.part_path):
+                with open(self.part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        self._hash.update(chunk)
+        return self._hash
+
+    def remove(self):
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class UploadManager:
+    """
+    Chunked, resumable, content-addressed uploads.
+
+    Flow: create() -> write_chunk() at the current offset, repeatedly (a client
+    that lost its connection asks offset() and continues from there) ->
+    complete(). If the client already knows the SHA-256 and we have that
+    content, create() finishes the upload on the spot.
+    """
+
+    def __init__(self, upload_dir):
+        self.upload_dir = upload_dir
+        self.partial_dir = partial_dir_for(upload_dir)
+        os.makedirs(upload_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename, size, sha256=None):
+        """Returns {"upload_id", "offset"}, or {"filename", "complete": True} for known content."""
+        if sha256 and re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+            existing = existing_name(self.upload_dir, sha256.lower(), filename)
+            if existing:
+                return {"filename": existing, "sha256": sha256.lower(), "complete": True, "deduplicated": True}
+
+        self._prune_stale()
+        session = UploadSession(uuid.uuid4().hex, filename, size, self.partial_dir)
+        open(session.part_path, "wb").close()
+        session.save_state()
+        with self._lock:
+            self._sessions[session.id] = session
+        return {"upload_id": session.id, "offset": 0}
+
+    def get(self, upload_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                session = self._load(upload_id)
+            if session is None:
+                raise UploadError(404, "Upload not found")
+            return session
+
+    def write_chunk(self, upload_id, offset, chunks):
+        """
+        Appends the byte chunks from iterable `chunks` at `offset`, which must
+        equal the bytes received so far. Returns the new offset.
+        """
+        session = self.get(upload_id)
+        with session.lock:
+            current = session.offset
+            if offset != current:
+                raise UploadError(409, f"Offset mismatch, upload is at {current}")
+
+            h = session.hasher()
+            written = current
+            with open(session.part_path, "ab") as out:
+                for chunk in chunks:
+                    if session.size is not None and written + len(chunk) > session.size:
+                        raise UploadError(400, "Upload exceeds the declared size")
+                    out.write(chunk)
+                    h.update(chunk)
+                    written += len(chunk)
+            session.updated_at = time.time()
+            # Keeps the session fresh for _prune_stale() however long the upload takes
+            os.utime(session.state_path)
+            return written
+
+    def complete(self, upload_id):
+        """Finalizes the upload; returns {"filename", "sha256", "deduplicated"}."""
+        session = self.get(upload_id)
+        with session.lock:
+            if session.size is not None and session.offset != session.size:
+                raise UploadError(400, f"Upload incomplete: {session.offset}/{session.size} bytes")
+            digest = session.hasher().hexdigest()
+            name, deduplicated = _finalize(session.part_path, digest, session.filename, self.upload_dir)
+            session.remove()
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        return {"filename": name, "sha256": digest, "deduplicated": deduplicated}
+
+    def _load(self, upload_id):
+        """Recovers a session persisted by an earlier server process."""
+        if not all(c in "0123456789abcdef" for c in upload_id):
+            return None
+        state_path = os.path.join(self.partial_dir, f"{upload_id}.json")
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        session = UploadSession(upload_id, state["filename"], state["size"], self.partial_dir)
+        self._sessions[upload_id] = session
+        return session
+
+    def _prune_stale(self):
+        # A session is stale once neither its bytes nor its state changed for
+        # STALE_UPLOAD_SECONDS; the state file alone is only written at create()
+        cutoff = time.time() - STALE_UPLOAD_SECONDS
+        newest = {}
+        for entry in os.scandir(self.partial_dir):
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            upload_id = os.path.splitext(entry.name)[0]
+            newest[upload_id] = max(newest.get(upload_id, 0), mtime)
+        for upload_id, mtime in newest.items():
+            if mtime >= cutoff:
+                continue
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            for ext in (".part", ".json"):
+                try:
+                    os.remove(os.path.join(self.partial_dir, upload_id + ext))
+                except FileNotFoundError:
+                    pass
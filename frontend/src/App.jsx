@@ -4,6 +4,7 @@ import AnalysisCard from "./components/AnalysisCard";
 import Results from "./components/Results";
 import CoachAssistant from "./components/CoachAssistant";
 import axios from "axios";
+import { uploadResumable } from "./upload";
 
 export default function App() {
   const [file, setFile] = useState(null);
@@ -18,6 +19,42 @@ export default function App() {
   const [outputs, setOutputs] = useState(null);
   const [aggregatedMetrics, setAggregatedMetrics] = useState(null);
   const [error, setError] = useState(null);
+  const [progress, setProgress] = useState(null);
+  // Skip encoding annotated videos; results are drawn over the original upload
+  const [overlayOnly, setOverlayOnly] = useState(false);
+
+  // Follows a /process job over its SSE stream until it finishes.
+  // Resolves with the job result, rejects with the job error.
+  const waitForJob = (apiBase, jobId) => new Promise((resolve, reject) => {
+    const events = new EventSource(`${apiBase}/jobs/${jobId}/events`)
+    events.onmessage = (msg) => {
+      const job = JSON.parse(msg.data)
+      setProgress(job.progress)
+      if (job.status === 'done') {
+        events.close()
+        resolve(job.result)
+      } else if (job.status === 'failed') {
+        events.close()
+        reject(new Error(job.error || 'Analysis failed'))
+      }
+    }
+    events.onerror = () => {
+      // Stream dropped (proxy timeout etc.) - fall back to polling the job
+      events.close()
+      const poll = async () => {
+        try {
+          const { data: job } = await axios.get(`${apiBase}/jobs/${jobId}`)
+          setProgress(job.progress)
+          if (job.status === 'done') return resolve(job.result)
+          if (job.status === 'failed') return reject(new Error(job.error || 'Analysis failed'))
+          setTimeout(poll, 1000)
+        } catch (err) {
+          reject(err)
+        }
+      }
+      poll()
+    }
+  })
 
   const handleRun = async () => {
     setError(null);
@@ -36,16 +73,14 @@ export default function App() {
 
     setLoading(true);
     setOutputs(null);
+    setProgress(null);
 
     try {
       const API_BASE = 'http://localhost:8000'
 
       // Primary flow: upload -> process
       try {
-        const formData = new FormData();
-        formData.append('file', file);
-        const up = await axios.post(`${API_BASE}/upload`, formData)
-        const filename = up.data.filename
+        const filename = await uploadResumable(API_BASE, file)
 
         const analyses = []
         if (selected.tracking) analyses.push('tracking')
@@ -54,20 +89,31 @@ export default function App() {
         if (selected.speed) analyses.push('speed')
         if (selected.shot_analysis) analyses.push('shot_analysis')
 
-        const proc = await axios.post(`${API_BASE}/process`, { filename, analyses })
+        const proc = await axios.post(`${API_BASE}/process`, {
+          filename,
+          analyses,
+          render_mode: overlayOnly ? 'overlay' : 'video',
+        })
+        const result = await waitForJob(API_BASE, proc.data.job_id)
         // Append API Base to URL only if it's not a dummy URL
-        const outs = (proc.data.outputs || []).map(o => ({
+        const outs = (result.outputs || []).map(o => ({
           ...o,
-          url: o.url === '#' ? '#' : `${API_BASE}${o.url}`
+          url: o.url === '#' ? '#' : `${API_BASE}${o.url}`,
+          ...(o.video_url ? { video_url: `${API_BASE}${o.video_url}` } : {})
         }))
         console.log('Processed Outputs:', outs)
         setOutputs(outs)
-        setAggregatedMetrics(proc.data.aggregated_metrics || null)
+        setAggregatedMetrics(result.aggregated_metrics || null)
         return
       } catch (firstErr) {
         // If primary flow returned 404 / Not Found, fall back to legacy /analyze endpoint
         const status = firstErr?.response?.status
         const text = firstErr?.response?.data || firstErr.message
+        if (!status) {
+          // The job itself failed; the legacy endpoint would fail the same way
+          setError(`Analysis failed: ${firstErr.message}`)
+          return
+        }
         console.warn('Primary API flow failed, falling back to /analyze', status, text)
         // continue to fallback
       }
@@ -167,6 +213,13 @@ export default function App() {
                     onChange={(v) => setSelected({ ...selected, shot_analysis: v })}
                   />
                 </div>
+
+                <p className="text-sm uppercase tracking-wider text-gray-500 font-semibold mt-6 mb-2">Output</p>
+                <AnalysisCard
+                  label="Overlay only (faster, no video encoding)"
+                  checked={overlayOnly}
+                  onChange={setOverlayOnly}
+                />
               </div>
 
               {/* Error Message Inline */}
@@ -238,6 +291,27 @@ export default function App() {
                   <div className="h-full flex flex-col items-center justify-center space-y-4 min-h-[300px] animate-pulse">
                     <div className="w-16 h-16 border-4 border-blue-500/30 border-t-blue-500 rounded-full animate-spin"></div>
                     <p className="text-blue-300 font-medium">Analyzing footage...</p>
+                    {progress && progress.total_frames > 0 && (
+                      <div className="w-full max-w-sm space-y-3">
+                        {Object.entries(progress.analyses || {}).map(([name, p]) => (
+                          <div key={name}>
+                            <div className="flex justify-between text-xs text-gray-400 mb-1">
+                              <span className="capitalize">{name.replace('_', ' ')}</span>
+                              <span>{p.frames_done}/{p.frames_total} frames</span>
+                            </div>
+                            <div className="w-full bg-blue-900/30 rounded-full h-2 overflow-hidden">
+                              <div
+                                className="bg-blue-500 h-2 rounded-full transition-all duration-300"
+                                style={{ width: `${p.frames_total ? Math.min(100, (p.frames_done / p.frames_total) * 100) : 0}%` }}
+                              />
+                            </div>
+                          </div>
+                        ))}
+                        {progress.eta_seconds != null && (
+                          <p className="text-xs text-gray-500 text-center">About {Math.ceil(progress.eta_seconds)}s remaining</p>
+                        )}
+                      </div>
+                    )}
                   </div>
                 )}
 
@@ -0,0 +1,127 @@
+import React, { useEffect, useRef, useState } from 'react'
+
+// COCO keypoint pairs joined by a line, as in the annotated videos
+const SKELETON = [
+  [15, 13], [13, 11], [16, 14], [14, 12], [11, 12], [5, 11], [6, 12], [5, 6],
+  [5, 7], [6, 8], [7, 9], [8, 10], [1, 2], [0, 1], [0, 2], [1, 3], [2, 4], [3, 5], [4, 6],
+]
+
+// Last sampled frame at or before frame number `f` (frames are sorted by f)
+const frameAt = (frames, f) => {
+  let lo = 0, hi = frames.length - 1, found = null
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1
+    if (frames[mid].f <= f) { found = frames[mid]; lo = mid + 1 } else hi = mid - 1
+  }
+  return found
+}
+
+const drawFrame = (ctx, frame) => {
+  ctx.lineWidth = 2
+
+  ctx.strokeStyle = '#3b82f6'
+  ;(frame.boxes || []).forEach(([x1, y1, x2, y2], i) => {
+    ctx.strokeRect(x1, y1, x2 - x1, y2 - y1)
+    if (frame.ids) {
+      ctx.fillStyle = '#3b82f6'
+      ctx.font = '14px sans-serif'
+      ctx.fillText(`#${frame.ids[i]}`, x1, y1 - 4)
+    }
+  })
+
+  ;(frame.keypoints || []).forEach((flat) => {
+    const pt = (k) => [flat[2 * k], flat[2 * k + 1]]
+    const visible = (k) => flat[2 * k] > 0 || flat[2 * k + 1] > 0
+    ctx.strokeStyle = '#22c55e'
+    SKELETON.forEach(([a, b]) => {
+      if (!visible(a) || !visible(b)) return
+      ctx.beginPath()
+      ctx.moveTo(...pt(a))
+      ctx.lineTo(...pt(b))
+      ctx.stroke()
+    })
+    ctx.fillStyle = '#f97316'
+    for (let k = 0; k < flat.length / 2; k++) {
+      if (!visible(k)) continue
+      ctx.beginPath()
+      ctx.arc(...pt(k), 3, 0, 2 * Math.PI)
+      ctx.fill()
+    }
+  })
+
+  ctx.fillStyle = '#facc15'
+  ;(frame.elbows || []).forEach(([x, y, angle]) => {
+    ctx.beginPath()
+    ctx.arc(x, y, 5, 0, 2 * Math.PI)
+    ctx.fill()
+    ctx.font = '14px sans-serif'
+    ctx.fillText(`${Math.round(angle)}°`, x + 8, y)
+  })
+
+  if (frame.label) {
+    ctx.font = 'bold 28px sans-serif'
+    ctx.fillStyle = '#00ff0a'
+    ctx.fillText(`SHOT: ${frame.label}`, 30, 50)
+  }
+  if (frame.angles) {
+    ctx.font = '18px sans-serif'
+    ctx.fillStyle = '#ef4444'
+    Object.entries(frame.angles).forEach(([name, value], i) => {
+      ctx.fillText(`${name.replace('_', ' ')}: ${value}`, 30, 100 + i * 28)
+    })
+  }
+}
+
+// Plays the original upload and draws an analysis overlay sidecar
+// (boxes, skeletons, shot label, angles) on a canvas on top of it.
+export default function OverlayPlayer({ videoUrl, overlayUrl }) {
+  const videoRef = useRef(null)
+  const canvasRef = useRef(null)
+  const [overlay, setOverlay] = useState(null)
+  const [error, setError] = useState(null)
+
+  useEffect(() => {
+    setOverlay(null)
+    fetch(overlayUrl)
+      .then((r) => r.json())
+      .then(setOverlay)
+      .catch((err) => setError(err.message))
+  }, [overlayUrl])
+
+  useEffect(() => {
+    if (!overlay) return
+    let raf
+    const draw = () => {
+      const video = videoRef.current
+      const canvas = canvasRef.current
+      if (video && canvas) {
+        if (canvas.width !== overlay.width) canvas.width = overlay.width
+        if (canvas.height !== overlay.height) canvas.height = overlay.height
+        const ctx = canvas.getContext('2d')
+        ctx.clearRect(0, 0, canvas.width, canvas.height)
+        const frame = frameAt(overlay.frames, Math.floor(video.currentTime * (overlay.fps || 30)) + 1)
+        if (frame) drawFrame(ctx, frame)
+      }
+      raf = requestAnimationFrame(draw)
+    }
+    raf = requestAnimationFrame(draw)
+    return () => cancelAnimationFrame(raf)
+  }, [overlay])
+
+  return (
+    <div className="relative inline-block">
+      <video
+        ref={videoRef}
+        src={videoUrl}
+        controls
+        autoPlay
+        className="max-h-[85vh] w-auto rounded-lg shadow-2xl"
+      />
+      <canvas
+        ref={canvasRef}
+        className="absolute top-0 left-0 w-full h-full pointer-events-none"
+      />
+      {error && <p className="mt-2 text-sm text-red-300">Could not load overlay: {error}</p>}
+    </div>
+  )
+}
@@ -1,10 +1,12 @@
 import React, { useState } from 'react'
+import OverlayPlayer from './OverlayPlayer'
 
 export default function Results({ outputs }) {
   const [modalContent, setModalContent] = useState(null)
 
   // Data for modal
   const [speedData, setSpeedData] = useState(null)
+  const [overlayItem, setOverlayItem] = useState(null)
 
   if (!outputs || outputs.length === 0) return null; // Handled by App.jsx empty state
 
@@ -15,6 +17,10 @@ export default function Results({ outputs }) {
     if (item.type === 'speed_analysis' && item.data) {
       setSpeedData(item.data)
       setModalContent('speed_dashboard')
+    } else if (item.type === 'overlay') {
+      setOverlayItem(item)
+      setModalContent('overlay')
+      setSpeedData(null)
     } else {
       setModalContent(item.url)
       setSpeedData(null)
@@ -35,7 +41,7 @@ export default function Results({ outputs }) {
                 <svg xmlns="http://www.w3.org/2000/svg" className="h-5 w-5" fill="none" viewBox="0 0 24 24" stroke="currentColor">
                   <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M13 10V3L4 14h7v7l9-11h-7z" />
                 </svg>
-              ) : isVideo(o.url) ? (
+              ) : (o.type === 'overlay' || isVideo(o.url)) ? (
                 <svg xmlns="http://www.w3.org/2000/svg" className="h-5 w-5" fill="none" viewBox="0 0 24 24" stroke="currentColor">
                   <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M14.752 11.168l-3.197-2.132A1 1 0 0010 9.87v4.263a1 1 0 001.555.832l3.197-2.132a1 1 0 000-1.664z" />
                   <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
@@ -176,6 +182,8 @@ export default function Results({ outputs }) {
                     </div>
                   </div>
                 </div>
+              ) : modalContent === 'overlay' && overlayItem ? (
+                <OverlayPlayer videoUrl={overlayItem.video_url} overlayUrl={overlayItem.url} />
               ) : isVideo(modalContent) ? (
                 <video
                   src={modalContent}
@@ -0,0 +1,67 @@
+import axios from "axios";
+
+const CHUNK_SIZE = 8 * 1024 * 1024; // 8 MB per request
+const MAX_RETRIES = 5;
+// Files up to this size are hashed before uploading so the server can skip
+// content it already has; crypto.subtle hashes in one piece, so larger files
+// are uploaded unhashed (the server still deduplicates them on completion)
+const HASH_MAX_BYTES = 512 * 1024 * 1024;
+
+const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+
+// Hex SHA-256 of `file`, or null when it is too large or the page has no
+// WebCrypto (plain-http origins other than localhost)
+async function sha256Hex(file) {
+  if (file.size > HASH_MAX_BYTES || !window.crypto?.subtle) return null;
+  try {
+    const digest = await window.crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+  } catch {
+    return null;
+  }
+}
+
+// Uploads `file` in chunks through the resumable /uploads API.
+// A dropped chunk is retried from the offset the server reports, so a flaky
+// link only costs the chunk in flight. Content the server already has (same
+// SHA-256) completes without sending any bytes. Resolves with the stored
+// filename.
+export async function uploadResumable(apiBase, file, onProgress) {
+  const sha256 = await sha256Hex(file);
+  const init = await axios.post(`${apiBase}/uploads`, {
+    filename: file.name,
+    size: file.size,
+    ...(sha256 && { sha256 }),
+  });
+  if (init.data.complete) {
+    if (onProgress) onProgress(1);
+    return init.data.filename;
+  }
+
+  const uploadId = init.data.upload_id;
+  let offset = init.data.offset || 0;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + CHUNK_SIZE);
+    try {
+      const res = await axios.put(`${apiBase}/uploads/${uploadId}`, chunk, {
+        params: { offset },
+        headers: { "Content-Type": "application/octet-stream" },
+      });
+      offset = res.data.offset;
+      failures = 0;
+      if (onProgress) onProgress(offset / file.size);
+    } catch (err) {
+      failures += 1;
+      if (failures > MAX_RETRIES) throw err;
+      await sleep(1000 * failures);
+      // Ask the server where it got to before sending again
+      const status = await axios.get(`${apiBase}/uploads/${uploadId}`).catch(() => null);
+      if (status) offset = status.data.offset;
+    }
+  }
+
+  const done = await axios.post(`${apiBase}/uploads/${uploadId}/complete`);
+  return done.data.filename;
+}